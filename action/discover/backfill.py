@@ -0,0 +1,281 @@
+"""Historical backfill of CBS publications and media releases.
+
+    python -m action.discover.backfill --from-year 2015 --to-year 2024 \
+        [--sections publications,mediarelease] [--checkpoint PATH] [--max-requests N]
+
+Lists every DocLib folder of the given sections and years concurrently
+(in-flight requests capped at CBS_CONCURRENCY by the shared session) and
+streams each folder's new entries to the manifest uploader as soon as the
+folder is listed, so listing and posting overlap. Each folder's URLs are
+checked against the Worker by hash prefix (known_urls.known_among), or
+against the local snapshot synced once at the start when
+CBS_KNOWN_URLS_SNAPSHOT is set.
+
+--max-requests is a budget of requests sent to CBS for the whole run
+(cache hits are free), checked before each folder is listed; once spent,
+no further folders are listed and the run ends so it can be resumed later. A folder is recorded as done in the
+checkpoint (--checkpoint, or CBS_BACKFILL_CHECKPOINT) once all of its new
+entries were accepted by the Worker; rerunning with the same checkpoint
+skips done folders.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+from .cbs_client import (
+    SECTIONS,
+    MAX_CONCURRENCY,
+    get_page_items,
+    index_page_items,
+    list_doclib_folder_info,
+    fetch_folder_files,
+    folder_signature,
+    build_manifest_entry,
+    request_count,
+    request_failures,
+    save_cache,
+)
+from .known_urls import known_among, sync_known_urls
+from .uploader import ManifestUploader, idempotency_key
+
+PROGRESS_EVERY = 25
+
+
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+
+def load_checkpoint(path: str) -> set[str]:
+    if not path or not os.path.exists(path):
+        return set()
+    try:
+        with open(path) as f:
+            return set(json.load(f).get("done", []))
+    except (OSError, ValueError) as e:
+        log(f"  Warning: ignoring unreadable backfill checkpoint {path}: {e}")
+        return set()
+
+
+def save_checkpoint(path: str, done: set[str]) -> None:
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"done": sorted(done)}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def folder_key(section: str, year: int, folder: str) -> str:
+    return f"{section}/{year}/{folder}"
+
+
+class _Progress:
+    """Folder completion bookkeeping shared by listing threads and the
+    uploader's delivery callback."""
+
+    def __init__(self, done: set[str], checkpoint_path: str):
+        self.done = done
+        self.checkpoint_path = checkpoint_path
+        self.lock = threading.Lock()
+        self.waiting: dict[str, set[str]] = {}  # folder -> undelivered keys
+        self.folder_of: dict[str, str] = {}  # idempotency key -> folder
+        self.completed = 0
+
+    def listed(self, folder: str, keys: list[str]) -> None:
+        with self.lock:
+            if keys:
+                self.waiting[folder] = set(keys)
+                for key in keys:
+                    self.folder_of[key] = folder
+            else:
+                self._complete(folder)
+
+    def delivered(self, batch: list[dict]) -> None:
+        with self.lock:
+            for entry in batch:
+                folder = self.folder_of.pop(entry["idempotency_key"], None)
+                if folder is None:
+                    continue
+                pending = self.waiting[folder]
+                pending.discard(entry["idempotency_key"])
+                if not pending:
+                    del self.waiting[folder]
+                    self._complete(folder)
+
+    def _complete(self, folder: str) -> None:
+        self.done.add(folder)
+        self.completed += 1
+        if self.completed % PROGRESS_EVERY == 0:
+            save_checkpoint(self.checkpoint_path, self.done)
+
+    def save(self) -> None:
+        with self.lock:
+            save_checkpoint(self.checkpoint_path, self.done)
+
+
+def backfill(
+    sections: list[str],
+    years: list[int],
+    base_url: str,
+    token: str,
+    checkpoint_path: str = "",
+    max_requests: int = 0,
+    uploader: Optional[ManifestUploader] = None,
+) -> dict:
+    """Crawl the given sections and years and post new entries.
+
+    Returns a summary: folders (listed this run), skipped (done in an
+    earlier run), deferred (left for a later run by the request budget or
+    a failed listing), entries, new_entries, processed, errors, complete.
+    """
+    started = time.monotonic()
+    failures_before = request_failures()
+    progress = _Progress(load_checkpoint(checkpoint_path), checkpoint_path)
+    if progress.done:
+        log(f"Resuming backfill: {len(progress.done)} folders already done")
+
+    snapshot_path = os.environ.get("CBS_KNOWN_URLS_SNAPSHOT", "")
+    snapshot = sync_known_urls(base_url, token, snapshot_path) if snapshot_path else None
+
+    def known_in(urls: list[str]) -> set[str]:
+        if snapshot is not None:
+            return set(urls) & snapshot
+        return known_among(base_url, token, urls)
+
+    if uploader is None:
+        uploader = ManifestUploader(
+            base_url,
+            token,
+            spool_path=os.environ.get("CBS_MANIFEST_SPOOL", ""),
+            on_delivered=progress.delivered,
+        )
+    else:
+        uploader.on_delivered = progress.delivered
+
+    summary = {"folders": 0, "skipped": 0, "deferred": 0, "entries": 0, "new_entries": 0}
+    requests_before = request_count()
+    budget_lock = threading.Lock()
+    listing = 0  # folders being listed, counted as one request each
+
+    def start_folder() -> bool:
+        nonlocal listing
+        with budget_lock:
+            if max_requests and request_count() - requests_before + listing >= max_requests:
+                return False
+            listing += 1
+            return True
+
+    def list_folder(section: str, year: int, info: dict) -> Optional[tuple[list[dict], list[dict]]]:
+        """The folder's entries and the new ones among them, or None once
+        the request budget is spent."""
+        nonlocal listing
+        if not start_folder():
+            return None
+        try:
+            files = fetch_folder_files(section, year, info["Name"], folder_signature(info))
+        finally:
+            with budget_lock:
+                listing -= 1
+        source = SECTIONS[section][0]
+        entries = [
+            build_manifest_entry(source, section, year, info["Name"], f, page_index[section])
+            for f in files
+        ]
+        known = known_in([e["url"] for e in entries]) if entries else set()
+        return entries, [e for e in entries if e["url"] not in known]
+
+    try:
+        with ThreadPoolExecutor(max_workers=MAX_CONCURRENCY) as pool:
+            # Page metadata and the folder tree for every section and year
+            page_futures = {s: pool.submit(get_page_items, s, SECTIONS[s][1], years[0]) for s in sections}
+            tree_futures = {
+                (s, y): pool.submit(list_doclib_folder_info, s, y) for s in sections for y in years
+            }
+            page_index = {s: index_page_items(f.result()) for s, f in page_futures.items()}
+
+            futures = {}
+            for (section, year), future in tree_futures.items():
+                for info in future.result():
+                    key = folder_key(section, year, info["Name"])
+                    if key in progress.done:
+                        summary["skipped"] += 1
+                        continue
+                    futures[pool.submit(list_folder, section, year, info)] = (section, year, info["Name"])
+            total = len(futures)
+            log(f"Backfill: {total} folders to list, {summary['skipped']} already done")
+
+            for future in as_completed(futures):
+                section, year, folder = futures[future]
+                listed = future.result()
+                if listed is None:
+                    summary["deferred"] += 1
+                    continue
+                summary["folders"] += 1
+                entries, new = listed
+                for entry in new:
+                    entry["idempotency_key"] = idempotency_key(entry)
+                summary["entries"] += len(entries)
+                summary["new_entries"] += len(new)
+                progress.listed(folder_key(section, year, folder), [e["idempotency_key"] for e in new])
+                uploader.submit(new)
+
+                if summary["folders"] % PROGRESS_EVERY == 0:
+                    log(
+                        f"  Progress: {summary['folders']}/{total} folders, "
+                        f"{summary['new_entries']} new entries, {uploader.delivered} delivered, "
+                        f"{request_count()} CBS requests, {time.monotonic() - started:.0f}s"
+                    )
+    finally:
+        processed, errors = uploader.close()
+        progress.save()
+        save_cache()
+
+    summary["processed"] = processed
+    summary["errors"] = errors
+    summary["complete"] = (
+        summary["deferred"] == 0 and not progress.waiting and request_failures() == failures_before
+    )
+    return summary
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Backfill historical CBS publications")
+    parser.add_argument("--from-year", type=int, required=True)
+    parser.add_argument("--to-year", type=int, required=True)
+    parser.add_argument("--sections", default=",".join(SECTIONS))
+    parser.add_argument("--checkpoint", default=os.environ.get("CBS_BACKFILL_CHECKPOINT", ""))
+    parser.add_argument("--max-requests", type=int, default=int(os.environ.get("CBS_BACKFILL_MAX_REQUESTS", "0")))
+    args = parser.parse_args(argv)
+
+    base_url = os.environ.get("INGEST_WEBHOOK_URL", "").rstrip("/")
+    token = os.environ.get("INGEST_AUTH_TOKEN", "")
+    if not base_url or not token:
+        log("ERROR: INGEST_WEBHOOK_URL and INGEST_AUTH_TOKEN must be set")
+        sys.exit(1)
+
+    sections = [s.strip() for s in args.sections.split(",") if s.strip()]
+    unknown = [s for s in sections if s not in SECTIONS]
+    if unknown or args.from_year > args.to_year:
+        parser.error(f"invalid sections {unknown} or year range {args.from_year}-{args.to_year}")
+    years = list(range(args.from_year, args.to_year + 1))
+
+    log(f"=== CBS Backfill: {', '.join(sections)} {years[0]}-{years[-1]} ===")
+    summary = backfill(sections, years, base_url, token, args.checkpoint, args.max_requests)
+    log(f"\n=== Backfill summary: {json.dumps(summary)} ===")
+    if not summary["complete"]:
+        log("Backfill incomplete; rerun with the same checkpoint to resume")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""Offline discovery benchmark over synthetic SharePoint fixtures.
+
+    python -m action.discover.bench [--folders 10,100,1000] [--files 3]
+        [--latency 0.05] [--jitter 0.02] [--error-rate 0] [--concurrency 6]
+        [--rate 0] [--backoff 0.05] [--json results.json]
+
+For each scale, builds an in-memory fixture set for one section and year
+(folder listing, per-folder file listings, page items) and times a full
+discover_section run through the replay transport (replay.py): once cold
+and once warm from the HTTP cache the cold run wrote. Injected errors are
+HTTP 500s, which the governor retries. Reports requests sent, governor
+retries, entries built and wall time, so concurrency, caching and parsing
+changes can be compared without touching cbs.gov.il.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import argparse
+import tempfile
+from typing import Optional
+
+from . import cbs_client
+from .governor import Governor
+from .main import discover_section
+from .replay import FixtureStore, ReplayAdapter
+
+SECTION = "publications"
+SOURCE, LIST_GUID = cbs_client.SECTIONS[SECTION]
+YEAR = 2026
+
+
+def synthetic_store(folders: int, files_per_folder: int = 3) -> FixtureStore:
+    """Fixtures for `folders` DocLib folders of SECTION/YEAR."""
+    store = FixtureStore()
+    names = [f"{i:04d}" for i in range(folders)]
+    store.put(
+        cbs_client.folders_url(SECTION, YEAR),
+        200,
+        {"value": [
+            {"Name": name, "TimeLastModified": f"{YEAR}-01-01T00:00:00Z", "ItemCount": files_per_folder}
+            for name in names
+        ]},
+        {"etag": '"folders"'},
+    )
+    for name in names:
+        store.put(
+            cbs_client.files_url(SECTION, YEAR, name),
+            200,
+            {"value": [
+                {
+                    "Name": f"table{j}.xlsx",
+                    "ServerRelativeUrl": f"/he/{SECTION}/Madad/DocLib/{YEAR}/{name}/table{j}.xlsx",
+                    "Length": 1000 + j,
+                    "TimeLastModified": f"{YEAR}-01-01T00:00:00Z",
+                }
+                for j in range(files_per_folder)
+            ]},
+            {"etag": f'"{name}"'},
+        )
+    store.put(
+        cbs_client.page_items_url(SECTION, LIST_GUID, YEAR),
+        200,
+        {"value": [
+            {
+                "Id": i,
+                "Title": f"Publication {name}",
+                "Created": f"{YEAR}-01-01T00:00:00Z",
+                "FileRef": f"/he/{SECTION}/Madad/Pages/{YEAR}/{name}.aspx",
+            }
+            for i, name in enumerate(names)
+        ]},
+    )
+    return store
+
+
+def run_once(adapter: ReplayAdapter, concurrency: int, rate: float, backoff: float = 0.05) -> dict:
+    governor = Governor(concurrency, rate=rate or 1e9, backoff=backoff)
+    cbs_client.reset_client(governor)
+    session = cbs_client.get_session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+    sent_before = adapter.requests
+    start = time.perf_counter()
+    entries, _ = discover_section(SECTION, SOURCE, LIST_GUID, [YEAR], max_workers=concurrency)
+    elapsed = time.perf_counter() - start
+    cbs_client.save_cache()
+    return {
+        "seconds": round(elapsed, 3),
+        "requests": adapter.requests - sent_before,
+        "retries": governor.retries,
+        "entries": len(entries),
+        "failures": cbs_client.request_failures(),
+    }
+
+
+def bench(
+    scales: list[int],
+    files_per_folder: int = 3,
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    error_rate: float = 0.0,
+    concurrency: int = cbs_client.MAX_CONCURRENCY,
+    rate: float = 0.0,
+    backoff: float = 0.05,
+) -> list[dict]:
+    results = []
+    saved_cache_path = os.environ.get("CBS_HTTP_CACHE")
+    try:
+        for folders in scales:
+            adapter = ReplayAdapter(
+                synthetic_store(folders, files_per_folder),
+                latency=latency,
+                jitter=jitter,
+                error_rate=error_rate,
+                seed=folders,
+            )
+            with tempfile.TemporaryDirectory() as tmp:
+                os.environ["CBS_HTTP_CACHE"] = os.path.join(tmp, "http-cache.json")
+                for run in ("cold", "warm"):
+                    results.append({"folders": folders, "run": run, **run_once(adapter, concurrency, rate, backoff)})
+    finally:
+        if saved_cache_path is None:
+            os.environ.pop("CBS_HTTP_CACHE", None)
+        else:
+            os.environ["CBS_HTTP_CACHE"] = saved_cache_path
+        cbs_client.reset_client()
+    return results
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark CBS discovery offline")
+    parser.add_argument("--folders", default="10,100,1000")
+    parser.add_argument("--files", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--concurrency", type=int, default=cbs_client.MAX_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=0.0, help="requests/s per host, 0 = unpaced")
+    parser.add_argument("--backoff", type=float, default=0.05, help="governor retry backoff, seconds")
+    parser.add_argument("--json", default="")
+    args = parser.parse_args(argv)
+
+    scales = [int(n) for n in args.folders.split(",") if n.strip()]
+    results = bench(
+        scales, args.files, args.latency, args.jitter, args.error_rate, args.concurrency, args.rate,
+        args.backoff,
+    )
+
+    print(f"\n{'folders':>8} {'run':>5} {'requests':>9} {'retries':>8} {'entries':>8} {'failures':>9} {'seconds':>8}")
+    for r in results:
+        print(f"{r['folders']:>8} {r['run']:>5} {r['requests']:>9} {r['retries']:>8} {r['entries']:>8} "
+              f"{r['failures']:>9} {r['seconds']:>8.3f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
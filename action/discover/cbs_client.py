@@ -2,13 +2,28 @@
 
 from __future__ import annotations
 
+import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Any, Optional
+from urllib.parse import unquote
+
+from .http_cache import HttpCache
+from .governor import Governor
+from .replay import adapter_from_env
+from ..tracing import span
 
 CBS_BASE = "https://www.cbs.gov.il"
 PUB_LIST_GUID = "71b30cd4-0261-4757-9482-a52c5a6da90a"
 MEDIA_LIST_GUID = "db8f0177-370a-46ec-9ab9-041b54247975"
 
+# section -> (manifest source, page list GUID)
+SECTIONS = {
+    "mediarelease": ("cbs-media", MEDIA_LIST_GUID),
+    "publications": ("cbs-publications", PUB_LIST_GUID),
+}
+
 SP_HEADERS = {
     "Accept": "application/json;odata=nometadata",
     "X-Requested-With": "XMLHttpRequest",
@@ -16,53 +31,300 @@ SP_HEADERS = {
 
 ALLOWED_EXTENSIONS = {"xlsx", "xls", "docx", "doc", "pdf", "zip"}
 
+# Page items per request when listing a section's pages (SharePoint max 5000)
+PAGE_ITEMS_PAGE_SIZE = 500
+
+# Maximum in-flight requests to CBS across all discovery threads; the
+# governor lowers the effective limit while CBS is blocking (governor.py)
+MAX_CONCURRENCY = int(os.environ.get("CBS_CONCURRENCY", "6"))
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+_governor = Governor(
+    MAX_CONCURRENCY,
+    rate=float(os.environ.get("CBS_RATE_PER_SECOND", "10")),
+    breaker_threshold=int(os.environ.get("CBS_BREAKER_THRESHOLD", "3")),
+    cooldown=float(os.environ.get("CBS_BREAKER_COOLDOWN", "30")),
+)
+
+# Persistent response cache; disabled unless CBS_HTTP_CACHE names a file
+CACHE_MAX_AGE = float(os.environ.get("CBS_CACHE_MAX_AGE", str(6 * 3600)))
+_cache: Optional[HttpCache] = None
+_cache_lock = threading.Lock()
+
+# Failed listings this run; a run with failures must not advance watermarks
+_failures = 0
+_failures_lock = threading.Lock()
+
+# Requests actually sent to CBS this run (cache hits excluded)
+_requests = 0
+_requests_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Shared keep-alive session, pooled for MAX_CONCURRENCY connections."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.headers.update(SP_HEADERS)
+            # CBS_HTTP_RECORD / CBS_HTTP_REPLAY swap in a fixture transport (replay.py)
+            pool = {"pool_connections": 2, "pool_maxsize": MAX_CONCURRENCY}
+            adapter = adapter_from_env(**pool) or HTTPAdapter(**pool)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def reset_client(governor: Optional[Governor] = None) -> None:
+    """Drop the shared session, HTTP cache and run counters, and optionally
+    replace the governor (benchmarks run several discoveries per process)."""
+    global _session, _cache, _failures, _requests, _governor
+    with _session_lock:
+        _session = None
+    with _cache_lock:
+        _cache = None
+    _failures = 0
+    _requests = 0
+    if governor is not None:
+        _governor = governor
+
+
+def get_cache() -> Optional[HttpCache]:
+    """The run's HTTP cache, loaded from CBS_HTTP_CACHE on first use."""
+    global _cache
+    path = os.environ.get("CBS_HTTP_CACHE", "")
+    if not path:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path:
+            _cache = HttpCache(path, CACHE_MAX_AGE)
+        return _cache
+
+
+def save_cache() -> None:
+    cache = get_cache()
+    if cache:
+        cache.save()
+        print(f"  HTTP cache: {cache.hits} hits, {cache.revalidated} revalidated", flush=True)
+
+
+def _record_failure() -> None:
+    global _failures
+    with _failures_lock:
+        _failures += 1
+
+
+def request_failures() -> int:
+    """Number of listings that failed so far in this run."""
+    return _failures
+
+
+def request_count() -> int:
+    """Number of requests sent to CBS so far in this run."""
+    return _requests
+
+
+def blocked_requests() -> int:
+    """Number of requests CBS kept blocking until the governor gave up."""
+    return _governor.gave_up
+
+
+def _get(url: str, headers: Optional[dict[str, str]] = None) -> requests.Response:
+    """GET through the shared session under the request governor.
+
+    Raises governor.CbsBlocked if CBS keeps blocking the request.
+    """
+    def send() -> requests.Response:
+        global _requests
+        with _requests_lock:
+            _requests += 1
+        return get_session().get(url, headers=headers, timeout=30)
+
+    with span("cbs.get", url=url) as attrs:
+        resp = _governor.call(url, send)
+        attrs["status_code"] = resp.status_code
+        return resp
+
+
+def _fetch_json(
+    url: str,
+    label: str,
+    signature: Optional[str] = None,
+    missing_ok: bool = False,
+) -> dict | None:
+    """GET a SharePoint JSON response through the HTTP cache.
+
+    signature identifies the state of the listed folder; when it matches
+    the cached entry's, no request is sent. With missing_ok a 404 is an
+    empty listing rather than a failure.
+    """
+    cache = get_cache()
+    if cache:
+        cached = cache.lookup(url, signature)
+        if cached is not None:
+            return cached
+
+    resp = _get(url, cache.conditional_headers(url) if cache else None)
+    if cache and resp.status_code == 304:
+        cached = cache.not_modified(url, signature)
+        if cached is not None:
+            return cached
+
+    if missing_ok and resp.status_code == 404:
+        return {"value": []}
+
+    data = _parse_sp_response(resp, label)
+    if cache and data is not None:
+        cache.store(url, data, resp.headers, signature)
+    return data
+
+
+def _fetch_paged(
+    url: str,
+    label: str,
+    signature: Optional[str] = None,
+    missing_ok: bool = False,
+) -> dict | None:
+    """Fetch every page of a SharePoint collection by following
+    odata.nextLink ($skiptoken paging). Returns {"value": [...]}, or None if
+    any page failed — a partial listing is treated as a failure."""
+    data = _fetch_json(url, label, signature, missing_ok)
+    if data is None:
+        return None
+    values = list(data.get("value", []))
+    next_url = data.get("odata.nextLink")
+    page = 1
+    while next_url:
+        page += 1
+        data = _fetch_json(next_url, f"{label} (page {page})", signature)
+        if data is None:
+            return None
+        values.extend(data.get("value", []))
+        next_url = data.get("odata.nextLink")
+    return {"value": values}
+
+
+def _modified_since(field: str, since: Optional[str]) -> str:
+    """OData filter clause for items modified after a watermark."""
+    if not since:
+        return ""
+    return f"$filter={field}%20gt%20datetime'{since}'"
+
 
 def _parse_sp_response(resp: requests.Response, label: str) -> dict | None:
     """Parse SharePoint API response, handling various content-types."""
     if resp.status_code != 200:
         print(f"  Warning: {label} returned HTTP {resp.status_code}", flush=True)
+        _record_failure()
         return None
     # Reject HTML responses (CBS WAF block)
     ct = resp.headers.get("content-type", "")
     if "html" in ct:
         print(f"  Warning: {label} returned HTML (blocked?)", flush=True)
+        _record_failure()
         return None
     # Try to parse JSON regardless of content-type header
     try:
         return resp.json()
     except Exception:
         print(f"  Warning: {label} returned non-JSON (content-type: {ct})", flush=True)
+        _record_failure()
         return None
 
 
-def list_doclib_folders(section: str, year: int) -> list[str]:
-    """List DocLib subfolder names for a section+year."""
+def folders_url(section: str, year: int, since: Optional[str] = None) -> str:
     url = (
         f"{CBS_BASE}/he/{section}/Madad/_api/web/"
         f"GetFolderByServerRelativeUrl('/he/{section}/Madad/DocLib/{year}')/Folders"
+        f"?$select=Name,TimeLastModified,ItemCount"
     )
-    try:
-        resp = requests.get(url, headers=SP_HEADERS, timeout=30)
-        data = _parse_sp_response(resp, f"DocLib folders {section}/{year}")
-        if not data:
-            return []
-        return [item["Name"] for item in data.get("value", [])]
-    except Exception as e:
-        print(f"  Error listing DocLib folders for {section}/{year}: {e}", flush=True)
-        return []
+    if since:
+        url += "&" + _modified_since("TimeLastModified", since)
+    return url
 
 
-def list_folder_files(section: str, year: int, folder: str) -> list[dict[str, Any]]:
-    """List files in a DocLib subfolder."""
+def files_url(section: str, year: int, folder: str, since: Optional[str] = None) -> str:
     url = (
         f"{CBS_BASE}/he/{section}/Madad/_api/web/"
         f"GetFolderByServerRelativeUrl('/he/{section}/Madad/DocLib/{year}/{folder}')/Files"
     )
+    if since:
+        url += "?" + _modified_since("TimeLastModified", since)
+    return url
+
+
+def page_items_url(section: str, list_guid: str, since_year: Optional[int] = None) -> str:
+    url = (
+        f"{CBS_BASE}/he/{section}/Madad/_api/Web/Lists(guid'{list_guid}')/items"
+        f"?$orderby=Created%20desc&$top={PAGE_ITEMS_PAGE_SIZE}"
+        f"&$select=Id,Title,CbsEnglishTitle,ArticleStartDate,Created,FileRef"
+    )
+    if since_year:
+        url += f"&$filter=Created%20ge%20datetime'{since_year}-01-01T00:00:00Z'"
+    return url
+
+
+def folder_signature(folder_info: dict[str, Any]) -> str:
+    """Identify a DocLib folder's state from its listing metadata."""
+    return f"{folder_info.get('TimeLastModified', '')}|{folder_info.get('ItemCount', '')}"
+
+
+def list_doclib_folder_info(
+    section: str,
+    year: int,
+    since: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    """List DocLib subfolders for a section+year with Name, TimeLastModified
+    and ItemCount. With since (an ISO timestamp watermark), only folders
+    modified after it are returned (server-side $filter)."""
+    url = folders_url(section, year, since)
     try:
-        resp = requests.get(url, headers=SP_HEADERS, timeout=30)
-        data = _parse_sp_response(resp, f"files {section}/{year}/{folder}")
+        # A year folder that does not exist yet (early January) is empty
+        data = _fetch_paged(url, f"DocLib folders {section}/{year}", missing_ok=True)
         if not data:
             return []
+        return data.get("value", [])
+    except Exception as e:
+        print(f"  Error listing DocLib folders for {section}/{year}: {e}", flush=True)
+        _record_failure()
+        return []
+
+
+def list_doclib_folders(section: str, year: int) -> list[str]:
+    """List DocLib subfolder names for a section+year."""
+    return [item["Name"] for item in list_doclib_folder_info(section, year)]
+
+
+def list_folder_files(
+    section: str,
+    year: int,
+    folder: str,
+    signature: Optional[str] = None,
+    since: Optional[str] = None,
+) -> list[dict[str, Any]]:
+    """List files in a DocLib subfolder.
+
+    Pass the folder's signature (see folder_signature) to skip the request
+    when the folder is unchanged since the cached listing, and since to list
+    only files modified after a watermark.
+    """
+    return fetch_folder_files(section, year, folder, signature, since) or []
+
+
+def fetch_folder_files(
+    section: str,
+    year: int,
+    folder: str,
+    signature: Optional[str] = None,
+    since: Optional[str] = None,
+) -> Optional[list[dict[str, Any]]]:
+    """Like list_folder_files, but None when the listing failed."""
+    url = files_url(section, year, folder, since)
+    try:
+        data = _fetch_paged(url, f"files {section}/{year}/{folder}", signature)
+        if data is None:
+            return None
         files = []
         for f in data.get("value", []):
             ext = f["Name"].rsplit(".", 1)[-1].lower() if "." in f["Name"] else ""
@@ -72,42 +334,91 @@ def list_folder_files(section: str, year: int, folder: str) -> list[dict[str, An
                     "server_url": f["ServerRelativeUrl"],
                     "size": int(f.get("Length", 0)),
                     "ext": ext,
+                    "modified": f.get("TimeLastModified", ""),
                 })
         return files
     except Exception as e:
         print(f"  Error listing files in {section}/{year}/{folder}: {e}", flush=True)
-        return []
+        _record_failure()
+        return None
 
 
-def get_page_items(section: str, list_guid: str, top: int = 20) -> list[dict[str, Any]]:
-    """Get page items from a CBS SharePoint list for title/date metadata."""
-    url = (
-        f"{CBS_BASE}/he/{section}/Madad/_api/Web/Lists(guid'{list_guid}')/items"
-        f"?$orderby=Created%20desc&$top={top}"
-        f"&$select=Id,Title,CbsEnglishTitle,ArticleStartDate,Created,FileRef"
-    )
+def get_page_items(
+    section: str,
+    list_guid: str,
+    since_year: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    """Get page items from a CBS SharePoint list for title/date metadata.
+
+    Fetches every item created since the start of since_year (all items
+    without it), newest first, following odata.nextLink in pages of
+    PAGE_ITEMS_PAGE_SIZE.
+    """
+    url = page_items_url(section, list_guid, since_year)
     try:
-        resp = requests.get(url, headers=SP_HEADERS, timeout=30)
-        data = _parse_sp_response(resp, f"page items {section}")
+        data = _fetch_paged(url, f"page items {section}")
         if not data:
             return []
         items = data.get("value", [])
-        print(f"  Page items content-type: {resp.headers.get('content-type', 'N/A')}, items: {len(items)}", flush=True)
+        print(f"  Page items for {section}: {len(items)}", flush=True)
         return items
     except Exception as e:
         print(f"  Error getting page items for {section}: {e}", flush=True)
+        _record_failure()
         return []
 
 
+def page_item_key(file_ref: str) -> Optional[tuple[str, str]]:
+    """(year, name) of a page item from its FileRef, matching the DocLib
+    (year, folder) it describes, e.g.
+    /he/publications/Madad/Pages/2026/price01aa.aspx -> ("2026", "price01aa").
+    """
+    parts = unquote(file_ref or "").strip("/").split("/")
+    for i in range(len(parts) - 2):
+        if parts[i] in ("Pages", "DocLib") and parts[i + 1].isdigit():
+            name = parts[i + 2]
+            if name.lower().endswith(".aspx"):
+                name = name[: -len(".aspx")]
+            return parts[i + 1], name.lower()
+    return None
+
+
+def index_page_items(page_items: list[dict[str, Any]]) -> dict[tuple[str, str], dict[str, Any]]:
+    """Index page items by (year, folder name) parsed from FileRef. Items
+    arrive newest first, so the newest item for a folder wins."""
+    index: dict[tuple[str, str], dict[str, Any]] = {}
+    for item in page_items:
+        key = page_item_key(item.get("FileRef", ""))
+        if key:
+            index.setdefault(key, item)
+    return index
+
+
+def fetch_leading_bytes(url: str, nbytes: int) -> Optional[bytes]:
+    """The first nbytes of a file (ranged GET), or None on failure. Not
+    counted as a listing failure: callers fall back to treating the file as
+    unique."""
+    try:
+        resp = _get(url, {"Range": f"bytes=0-{nbytes - 1}"})
+    except Exception as e:
+        print(f"  Warning: ranged fetch of {url} failed: {e}", flush=True)
+        return None
+    if resp.status_code not in (200, 206):
+        return None
+    # A server that ignores Range sends the whole file
+    return resp.content[:nbytes]
+
+
 def build_manifest_entry(
     source: str,
     section: str,
     year: int,
     folder: str,
     file_info: dict[str, Any],
-    page_item: Optional[dict[str, Any]],
+    page_index: Optional[dict[tuple[str, str], dict[str, Any]]] = None,
 ) -> dict[str, Any]:
-    """Build a manifest entry dict from file info and page metadata."""
+    """Build a manifest entry dict from file info and the page item indexed
+    for its folder (see index_page_items)."""
     if source == "cbs-publications":
         pub_id = f"cbs-pub-{year}-{folder}"
     else:
@@ -116,6 +427,7 @@ def build_manifest_entry(
     title = ""
     title_en = ""
     pub_date = ""
+    page_item = page_index.get((str(year), folder.lower())) if page_index else None
     if page_item:
         title = page_item.get("Title", f"CBS {section} {folder}")
         title_en = page_item.get("CbsEnglishTitle", "")
@@ -134,6 +446,7 @@ def build_manifest_entry(
             "year": str(year),
             "folder": folder,
             "size": file_info["size"],
+            "modified": file_info.get("modified", ""),
         },
         "is_new": True,
     }
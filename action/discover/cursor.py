@@ -0,0 +1,59 @@
+"""Persisted discovery cursor: a last-modified watermark per CBS section.
+
+The cursor file (CBS_DISCOVERY_CURSOR) is carried across runs alongside the
+HTTP cache. Each section's watermark is the newest SharePoint
+TimeLastModified seen by a run whose listings all succeeded and whose
+manifest was fully posted; the next run asks SharePoint only for folders
+and files modified after it.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+from typing import Optional
+
+DEFAULT_YEAR_WINDOW = 2
+
+
+def load_cursor(path: str) -> dict[str, dict[str, str]]:
+    """Load the cursor, or an empty one if the file is missing or unreadable."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"  Warning: ignoring unreadable discovery cursor {path}: {e}", flush=True)
+        return {}
+
+
+def save_cursor(path: str, cursor: dict[str, dict[str, str]]) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cursor, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def watermark(cursor: dict[str, dict[str, str]], section: str) -> Optional[str]:
+    return cursor.get(section, {}).get("watermark") or None
+
+
+def advance(cursor: dict[str, dict[str, str]], section: str, high_water: str) -> None:
+    """Move a section's watermark forward (never backwards)."""
+    current = watermark(cursor, section) or ""
+    if high_water and high_water > current:
+        cursor.setdefault(section, {})["watermark"] = high_water
+
+
+def discovery_years(now_year: int, window: int, since: Optional[str]) -> list[int]:
+    """Years to list: the explicit window ending this year, extended back to
+    the watermark's year so a long gap between runs is caught up (and so
+    December publications are still seen after the year rolls over)."""
+    start = now_year - max(1, window) + 1
+    if since:
+        start = min(start, int(since[:4]))
+    return list(range(start, now_year + 1))
@@ -0,0 +1,81 @@
+"""Duplicate detection for discovered files.
+
+CBS often publishes the same file under both mediarelease and publications
+DocLib folders. Within a run, entries are grouped by cheap signals: file
+size (SharePoint's Length) and lower-cased file name. With
+CBS_DEDUP_HEAD_BYTES set, each candidate group is confirmed by hashing the
+file's leading bytes (one ranged GET per member), since equal size and
+name alone can be a coincidence across years of a series.
+
+Only new entries are grouped (known URLs are filtered out first), and each
+group is posted once: the first entry in discovery order carries the other
+copies' manifest entries in metadata["duplicates"]. The Worker downloads
+and archives that one copy and records a file row for every copy's
+publication (copiesOf in worker/src/download/archive.ts). Extraction
+deduplicates again by full SHA-256 (extract/dedup.py), which also catches
+copies found in different runs.
+"""
+
+from __future__ import annotations
+
+import os
+import hashlib
+from typing import Callable, Optional
+
+HEAD_BYTES = int(os.environ.get("CBS_DEDUP_HEAD_BYTES", "0"))
+
+
+def _signal(entry: dict) -> Optional[tuple[int, str]]:
+    size = entry.get("metadata", {}).get("size") or 0
+    if not size:
+        return None
+    return size, entry["filename"].lower()
+
+
+def group_duplicates(
+    entries: list[dict],
+    head_hash: Optional[Callable[[str], Optional[str]]] = None,
+) -> list[list[dict]]:
+    """Group entries that are copies of one file, keeping discovery order
+    (of each group's first entry, and within groups).
+
+    head_hash(url) returns a hash of the file's leading bytes, or None if
+    it could not be fetched (the entry then stays on its own).
+    """
+    groups: dict[object, list[dict]] = {}
+    for i, entry in enumerate(entries):
+        key = _signal(entry)
+        groups.setdefault(key if key else ("unique", i), []).append(entry)
+
+    result: list[list[dict]] = []
+    for key, members in groups.items():
+        if len(members) == 1 or head_hash is None:
+            result.append(members)
+            continue
+        confirmed: dict[object, list[dict]] = {}
+        for j, entry in enumerate(members):
+            digest = head_hash(entry["url"])
+            confirmed.setdefault(digest if digest else ("unhashed", j), []).append(entry)
+        result.extend(confirmed.values())
+
+    order = {id(e): i for i, e in enumerate(entries)}
+    result.sort(key=lambda g: order[id(g[0])])
+    return result
+
+
+def canonical_entry(group: list[dict]) -> dict:
+    """The entry to post for a group, listing the other copies."""
+    first = group[0]
+    if len(group) == 1:
+        return first
+    duplicates = [{k: v for k, v in e.items() if k != "idempotency_key"} for e in group[1:]]
+    return {**first, "metadata": {**first["metadata"], "duplicates": duplicates}}
+
+
+def head_hasher(fetch: Callable[[str, int], Optional[bytes]], nbytes: int) -> Callable[[str], Optional[str]]:
+    """head_hash for group_duplicates from a ranged fetch(url, nbytes)."""
+    def head_hash(url: str) -> Optional[str]:
+        data = fetch(url, nbytes)
+        return hashlib.sha256(data).hexdigest() if data else None
+
+    return head_hash
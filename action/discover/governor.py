@@ -0,0 +1,178 @@
+"""Request governor for CBS SharePoint: adaptive concurrency, a circuit
+breaker and per-host token buckets.
+
+The CBS WAF answers aggressive clients with 429/403/503 or an HTML block
+page served as 200. Every request to CBS goes through Governor.call, which
+- caps in-flight requests at an AIMD limit: +1/limit per success (about +1
+  per window), halved on every blocked response, never below 1 or above
+  max_concurrency
+- opens a circuit breaker after breaker_threshold consecutive blocked
+  responses: all requests wait out the cooldown, then a single probe is
+  let through; success closes the breaker, another block reopens it with
+  the cooldown doubled (up to max_cooldown)
+- paces requests per host with a token bucket (rate per second, burst)
+- retries a blocked request up to max_attempts times and then raises
+  CbsBlocked, so a blocked run fails instead of looking empty
+- retries other 5xx responses (server errors, not blocks) as often, with
+  the same backoff but without touching the limit or the breaker; the last
+  response is returned, and the caller counts the listing as failed
+"""
+
+from __future__ import annotations
+
+import time
+import threading
+from typing import Callable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+BLOCK_STATUSES = {403, 429, 503}
+
+
+class CbsBlocked(Exception):
+    """CBS kept blocking a request after every retry."""
+
+
+def is_blocked(resp: requests.Response) -> bool:
+    if resp.status_code in BLOCK_STATUSES:
+        return True
+    return resp.status_code == 200 and "html" in resp.headers.get("content-type", "")
+
+
+def is_server_error(resp: requests.Response) -> bool:
+    return resp.status_code >= 500 and resp.status_code not in BLOCK_STATUSES
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def wait_time(self) -> float:
+        """Take a token if one is available (0.0), else seconds until one is.
+        Not thread-safe; the governor holds its lock."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Governor:
+    def __init__(
+        self,
+        max_concurrency: int,
+        rate: float = 10.0,
+        burst: Optional[float] = None,
+        breaker_threshold: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        max_attempts: int = 4,
+        backoff: float = 1.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.limit = float(max_concurrency)
+        self.rate = rate
+        self.burst = burst if burst is not None else float(max_concurrency)
+        self.breaker_threshold = breaker_threshold
+        self.base_cooldown = cooldown
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self.consecutive_blocks = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.blocked = 0
+        self.trips = 0
+        self.gave_up = 0
+        self.retries = 0
+        self._buckets: dict[str, TokenBucket] = {}
+        self._cond = threading.Condition()
+
+    def _acquire(self, host: str) -> bool:
+        """Wait for the breaker, a concurrency slot and a token for host.
+        Returns True if this request is the breaker's probe."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if now < self.open_until:
+                    self._cond.wait(self.open_until - now)
+                    continue
+                probe = self.open_until > 0
+                if probe and self.probing:
+                    self._cond.wait()
+                    continue
+                if self.in_flight >= max(1, int(self.limit)):
+                    self._cond.wait()
+                    continue
+                bucket = self._buckets.setdefault(host, TokenBucket(self.rate, self.burst))
+                delay = bucket.wait_time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                self.in_flight += 1
+                if probe:
+                    self.probing = True
+                return probe
+
+    def _release(self, probe: bool, outcome: str) -> None:
+        """outcome: "ok", "blocked", or "error" (no response; leaves the
+        limit and breaker as they are, a probe is retried)."""
+        with self._cond:
+            self.in_flight -= 1
+            if probe:
+                self.probing = False
+            if outcome == "blocked":
+                self.blocked += 1
+                self.consecutive_blocks += 1
+                self.limit = max(1.0, self.limit / 2)
+                if probe or self.consecutive_blocks >= self.breaker_threshold:
+                    if probe:
+                        self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+                    else:
+                        self.trips += 1
+                    self.open_until = time.monotonic() + self.cooldown
+                    print(f"  CBS blocking requests; pausing {self.cooldown:.0f}s (limit {int(self.limit)})", flush=True)
+            elif outcome == "ok":
+                self.consecutive_blocks = 0
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+                if probe:
+                    self.open_until = 0.0
+                    self.cooldown = self.base_cooldown
+                    print("  CBS probe succeeded; resuming", flush=True)
+            self._cond.notify_all()
+
+    def call(self, url: str, send: Callable[[], requests.Response]) -> requests.Response:
+        """Send a request under the governor, retrying blocked responses and
+        server errors."""
+        host = urlparse(url).netloc
+        for attempt in range(self.max_attempts):
+            probe = self._acquire(host)
+            try:
+                resp = send()
+            except BaseException:
+                self._release(probe, "error")
+                raise
+            blocked = is_blocked(resp)
+            server_error = not blocked and is_server_error(resp)
+            self._release(probe, "blocked" if blocked else "error" if server_error else "ok")
+            if not blocked and not server_error:
+                return resp
+            if attempt + 1 < self.max_attempts:
+                with self._cond:
+                    self.retries += 1
+                time.sleep(self.backoff * (2 ** attempt))
+
+        if server_error:
+            return resp
+        with self._cond:
+            self.gave_up += 1
+        raise CbsBlocked(f"{url} blocked (HTTP {resp.status_code}) after {self.max_attempts} attempts")
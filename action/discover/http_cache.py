@@ -0,0 +1,97 @@
+"""Persistent HTTP cache for CBS SharePoint API responses.
+
+Stores parsed JSON bodies with their ETag / Last-Modified validators in a
+local JSON file that the workflow carries across runs (actions/cache). On
+lookup:
+- a folder listing whose folder signature (TimeLastModified + ItemCount from
+  the parent listing) is unchanged is served from cache with no request
+- any other entry younger than max_age is served from cache
+- older entries are revalidated with If-None-Match / If-Modified-Since, and
+  a 304 reuses the cached body
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import threading
+from typing import Any, Optional
+
+
+class HttpCache:
+    def __init__(self, path: str, max_age: float):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"  Warning: ignoring unreadable HTTP cache {path}: {e}", flush=True)
+
+    def lookup(self, url: str, signature: Optional[str] = None) -> Optional[Any]:
+        """Return the cached body if it can be used without a request."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            unchanged = signature is not None and entry.get("signature") == signature
+            fresh = time.time() - entry.get("stored_at", 0) < self.max_age
+            if unchanged or fresh:
+                self.hits += 1
+                return entry["body"]
+            return None
+
+    def conditional_headers(self, url: str) -> dict[str, str]:
+        with self._lock:
+            entry = self._entries.get(url, {})
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def not_modified(self, url: str, signature: Optional[str] = None) -> Optional[Any]:
+        """Handle a 304: refresh the entry and return its body."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is None:
+                return None
+            entry["stored_at"] = time.time()
+            if signature is not None:
+                entry["signature"] = signature
+            self.revalidated += 1
+            return entry["body"]
+
+    def store(
+        self,
+        url: str,
+        body: Any,
+        headers: Any,
+        signature: Optional[str] = None,
+    ) -> None:
+        with self._lock:
+            self._entries[url] = {
+                "body": body,
+                "etag": headers.get("ETag", ""),
+                "last_modified": headers.get("Last-Modified", ""),
+                "signature": signature,
+                "stored_at": time.time(),
+            }
+
+    def save(self) -> None:
+        with self._lock:
+            data = json.dumps(self._entries, ensure_ascii=False)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
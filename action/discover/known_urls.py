@@ -0,0 +1,162 @@
+"""Compact known-URL membership against the Worker's /api/known-urls.
+
+Instead of downloading every known URL on every run, discovery asks only
+which of its candidate URLs are already known, in one of two ways:
+- snapshot sync (CBS_KNOWN_URLS_SNAPSHOT set): a local snapshot of known
+  URLs plus the Worker's version string is carried across runs; each run
+  fetches only URLs added since that version (?since=) and merges them
+- hash-prefix check (no snapshot): the SHA-256 prefixes of the candidates
+  are posted to /api/known-urls/check and the Worker returns the full
+  hashes of known URLs sharing them
+
+Either way falls back to the full list when the Worker does not support
+the compact protocol.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import hashlib
+from typing import Optional
+
+import requests
+
+SOURCES = ("cbs-publications", "cbs-media")
+HASH_PREFIX_LENGTH = 8
+
+
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+
+def _auth(token: str) -> dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _source_query() -> str:
+    return "&".join(f"source={s}" for s in SOURCES)
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def fetch_known_urls(base_url: str, token: str) -> set[str]:
+    """Fetch the full list of known file URLs from the Worker."""
+    url = f"{base_url}/api/known-urls?{_source_query()}"
+    try:
+        resp = requests.get(url, headers=_auth(token), timeout=30)
+        if resp.status_code != 200:
+            log(f"Warning: known-urls returned {resp.status_code}, proceeding without filter")
+            return set()
+        data = resp.json()
+        urls = set(data.get("urls", []))
+        log(f"Fetched {len(urls)} known URLs from Worker")
+        return urls
+    except Exception as e:
+        log(f"Warning: could not fetch known URLs: {e}")
+        return set()
+
+
+def load_snapshot(path: str) -> dict:
+    if not os.path.exists(path):
+        return {"version": "", "urls": []}
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        log(f"Warning: ignoring unreadable known-URL snapshot {path}: {e}")
+        return {"version": "", "urls": []}
+
+
+def save_snapshot(path: str, snapshot: dict) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def sync_known_urls(base_url: str, token: str, snapshot_path: str) -> set[str]:
+    """Bring the local snapshot up to date and return its URLs.
+
+    On error the existing snapshot is used as is: a stale snapshot only
+    lets already-known URLs through, and the Worker skips those itself.
+    """
+    snapshot = load_snapshot(snapshot_path)
+    urls = set(snapshot.get("urls", []))
+    version = snapshot.get("version", "")
+
+    url = f"{base_url}/api/known-urls?{_source_query()}"
+    if version:
+        url += f"&since={requests.utils.quote(version)}"
+    try:
+        resp = requests.get(url, headers=_auth(token), timeout=30)
+        if resp.status_code != 200:
+            log(f"Warning: known-urls returned {resp.status_code}, using snapshot of {len(urls)} URLs")
+            return urls
+        data = resp.json()
+    except Exception as e:
+        log(f"Warning: could not sync known URLs: {e}, using snapshot of {len(urls)} URLs")
+        return urls
+
+    if "added" in data:
+        added = set(data["added"])
+        log(f"Known URLs: {len(added)} added since {version}, {len(urls | added)} total")
+        urls |= added
+    else:
+        # Full list: first sync, or a Worker without delta support
+        urls = set(data.get("urls", []))
+        log(f"Known URLs: fetched full list of {len(urls)}")
+
+    save_snapshot(snapshot_path, {"version": data.get("version", ""), "urls": sorted(urls)})
+    return urls
+
+
+def check_known(base_url: str, token: str, candidates: list[str]) -> Optional[set[str]]:
+    """Return which candidates the Worker already knows, by hash prefix.
+
+    Returns None if the check endpoint is unavailable.
+    """
+    hashes = {url_hash(u): u for u in candidates}
+    prefixes = sorted({h[:HASH_PREFIX_LENGTH] for h in hashes})
+    try:
+        resp = requests.post(
+            f"{base_url}/api/known-urls/check",
+            headers={**_auth(token), "Content-Type": "application/json"},
+            json={"sources": list(SOURCES), "prefixes": prefixes},
+            timeout=30,
+        )
+        if resp.status_code != 200:
+            log(f"Warning: known-urls check returned {resp.status_code}")
+            return None
+        known_hashes = set(resp.json().get("hashes", []))
+    except Exception as e:
+        log(f"Warning: could not check known URLs: {e}")
+        return None
+
+    return {hashes[h] for h in known_hashes if h in hashes}
+
+
+def known_among(
+    base_url: str,
+    token: str,
+    candidates: list[str],
+    snapshot_path: str = "",
+) -> set[str]:
+    """Return the subset of candidate URLs already known to the Worker."""
+    if snapshot_path:
+        return set(candidates) & sync_known_urls(base_url, token, snapshot_path)
+    if not candidates:
+        return set()
+
+    known = check_known(base_url, token, candidates)
+    if known is None:
+        log("Falling back to full known-URL list")
+        known = set(candidates) & fetch_known_urls(base_url, token)
+    else:
+        log(f"Checked {len(candidates)} candidates by hash prefix: {len(known)} known")
+    return known
@@ -2,6 +2,14 @@
 
 Discovers new CBS publications and media releases, filters against
 known URLs from the Worker, and posts new manifest entries.
+
+Discovery is incremental: each section keeps a last-modified watermark in
+the discovery cursor (see cursor.py), SharePoint is asked only for folders
+and files modified after it, across an explicit window of years
+(CBS_DISCOVERY_YEARS, default 2). The watermark advances only after every
+listing succeeded and the manifest was posted without errors.
+
+Set TRACE_FILE to write a span trace of the run (see tracing.py).
 """
 
 from __future__ import annotations
@@ -9,17 +17,36 @@ from __future__ import annotations
 import os
 import sys
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
-import requests as http
+from typing import Optional
 
 from .cbs_client import (
-    list_doclib_folders,
+    list_doclib_folder_info,
     list_folder_files,
+    folder_signature,
+    save_cache,
     get_page_items,
+    index_page_items,
     build_manifest_entry,
-    PUB_LIST_GUID,
-    MEDIA_LIST_GUID,
+    SECTIONS,
+    MAX_CONCURRENCY,
+    request_failures,
+    blocked_requests,
+    fetch_leading_bytes,
+)
+from .dedup import HEAD_BYTES, group_duplicates, canonical_entry, head_hasher
+from .known_urls import known_among
+from ..tracing import span, configure_from_env
+from .uploader import ManifestUploader, load_spool
+from .cursor import (
+    load_cursor,
+    save_cursor,
+    watermark,
+    advance,
+    discovery_years,
+    DEFAULT_YEAR_WINDOW,
 )
 
 
@@ -27,101 +54,77 @@ def log(msg: str) -> None:
     print(msg, flush=True)
 
 
-def fetch_known_urls(base_url: str, token: str) -> set[str]:
-    """Fetch known file URLs from the Worker."""
-    url = f"{base_url}/api/known-urls?source=cbs-publications&source=cbs-media"
-    try:
-        resp = http.get(
-            url,
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=30,
-        )
-        if resp.status_code != 200:
-            log(f"Warning: known-urls returned {resp.status_code}, proceeding without filter")
-            return set()
-        data = resp.json()
-        urls = set(data.get("urls", []))
-        log(f"Fetched {len(urls)} known URLs from Worker")
-        return urls
-    except Exception as e:
-        log(f"Warning: could not fetch known URLs: {e}")
-        return set()
-
-
 def discover_section(
     section: str,
     source: str,
     list_guid: str,
-    year: int,
-    month: int,
-) -> list[dict]:
-    """Discover files for a CBS section (publications or mediarelease)."""
-    log(f"\n=== Discovering CBS {section} ===")
-
-    # Get page items for metadata
-    page_items = get_page_items(section, list_guid)
-    log(f"  Got {len(page_items)} page items")
-
-    # Get DocLib folders for current year
-    folders = list_doclib_folders(section, year)
-    log(f"  Found {len(folders)} DocLib folders for {year}")
+    years: list[int],
+    since: Optional[str] = None,
+    max_workers: int = MAX_CONCURRENCY,
+) -> tuple[list[dict], str]:
+    """Discover files for a CBS section (publications or mediarelease).
+
+    Lists the given DocLib years; with since, only folders and files
+    modified after that watermark. Folder listings run concurrently (the
+    shared session caps in-flight requests at MAX_CONCURRENCY); entries keep
+    year and DocLib folder order. Folders whose TimeLastModified/ItemCount
+    are unchanged since the cached listing are served from the HTTP cache.
+    Title and publish date come from the section's page items, fetched once
+    for the whole year window and indexed by folder.
+
+    Returns (entries, high_water) where high_water is the newest
+    TimeLastModified seen.
+    """
+    log(f"\n=== Discovering CBS {section} (years {years[0]}-{years[-1]}, since {since or 'start'}) ===")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Get page items for metadata while listing DocLib folders
+        page_items_future = pool.submit(get_page_items, section, list_guid, years[0])
+        with span("discover.list_folders", section=section, years=len(years)) as attrs:
+            year_folders = list(pool.map(lambda y: list_doclib_folder_info(section, y, since), years))
+            folders = [(year, info) for year, infos in zip(years, year_folders) for info in infos]
+            attrs["folders"] = len(folders)
+        log(f"  [{section}] Found {len(folders)} changed DocLib folders")
+
+        with span("discover.list_files", section=section, folders=len(folders)):
+            folder_files = list(pool.map(
+                lambda yf: list_folder_files(section, yf[0], yf[1]["Name"], folder_signature(yf[1]), since),
+                folders,
+            ))
+        with span("discover.page_items", section=section):
+            page_items = page_items_future.result()
+
+    page_index = index_page_items(page_items)
+    log(f"  [{section}] Got {len(page_items)} page items ({len(page_index)} indexed by folder)")
 
     entries = []
-    for folder in folders:
-        # Use the first page item as fallback metadata
-        best_item = page_items[0] if page_items else None
-
-        # List files in this folder
-        files = list_folder_files(section, year, folder)
+    high_water = since or ""
+    for (year, info), files in zip(folders, folder_files):
+        folder = info["Name"]
+        high_water = max(high_water, info.get("TimeLastModified", ""))
         if not files:
             continue
 
-        log(f"  Folder {folder}: {len(files)} files")
+        log(f"  [{section}] Folder {year}/{folder}: {len(files)} files")
 
         for file_info in files:
-            entry = build_manifest_entry(source, section, year, folder, file_info, best_item)
+            high_water = max(high_water, file_info.get("modified", ""))
+            entry = build_manifest_entry(source, section, year, folder, file_info, page_index)
             entries.append(entry)
 
-    return entries
+    return entries, high_water
 
 
 def post_manifest(entries: list[dict], base_url: str, token: str) -> tuple[int, int]:
-    """Post manifest entries to Worker in batches. Returns (processed, errors)."""
-    batch_size = 10
-    total_processed = 0
-    total_errors = 0
-
-    for i in range(0, len(entries), batch_size):
-        batch = entries[i : i + batch_size]
-        batch_num = i // batch_size + 1
-        log(f"  Batch {batch_num}: {len(batch)} entries")
-
-        try:
-            resp = http.post(
-                f"{base_url}/api/manifest",
-                headers={
-                    "Authorization": f"Bearer {token}",
-                    "Content-Type": "application/json",
-                },
-                json={"entries": batch},
-                timeout=180,
-            )
-            if resp.status_code == 200:
-                result = resp.json()
-                processed = result.get("processed", 0)
-                total_processed += processed
-                log(f"    OK: processed={processed}, errors={result.get('errors', 0)}, pdfs={result.get('pdf_requests', 0)}")
-            else:
-                log(f"    Error: HTTP {resp.status_code}: {resp.text[:200]}")
-                total_errors += 1
-        except Exception as e:
-            log(f"    Error: {e}")
-            total_errors += 1
-
-    return total_processed, total_errors
+    """Post manifest entries to the Worker (see uploader.py), replaying any
+    spooled entries from an earlier run first. Returns (processed, errors)."""
+    uploader = ManifestUploader(base_url, token, spool_path=os.environ.get("CBS_MANIFEST_SPOOL", ""))
+    uploader.submit(entries)
+    return uploader.close()
 
 
 def main():
+    configure_from_env()
     log("=== CBS Discovery Script Starting ===")
 
     base_url = os.environ.get("INGEST_WEBHOOK_URL", "").rstrip("/")
@@ -132,28 +135,54 @@ def main():
         sys.exit(1)
 
     now = datetime.now(timezone.utc)
-    year = now.year
-    month = now.month
+    cursor_path = os.environ.get("CBS_DISCOVERY_CURSOR", "")
+    cursor = load_cursor(cursor_path)
+    window = int(os.environ.get("CBS_DISCOVERY_YEARS", DEFAULT_YEAR_WINDOW))
+    sections = [(section, source, guid) for section, (source, guid) in SECTIONS.items()]
 
     log(f"CBS Discovery — {now.isoformat()}")
-    log(f"Target: year={year}, month={month}")
-
-    # Step 1: Fetch known URLs from Worker
-    known_urls = fetch_known_urls(base_url, token)
-
-    # Step 2: Discover CBS media releases
-    media_entries = discover_section("mediarelease", "cbs-media", MEDIA_LIST_GUID, year, month)
-
-    # Step 3: Discover CBS publications
-    pub_entries = discover_section("publications", "cbs-publications", PUB_LIST_GUID, year, month)
+    for section, _, _ in sections:
+        log(f"Target: {section} since {watermark(cursor, section) or 'start'}, year window {window}")
+
+    # Steps 1-2: Discover CBS media releases and publications concurrently
+    with ThreadPoolExecutor(max_workers=len(sections)) as pool:
+        futures = []
+        for section, source, list_guid in sections:
+            since = watermark(cursor, section)
+            years = discovery_years(now.year, window, since)
+            futures.append(pool.submit(discover_section, section, source, list_guid, years, since))
+        results = [f.result() for f in futures]
+    save_cache()
+
+    # A run CBS blocked must fail rather than post a falsely empty manifest
+    blocked = blocked_requests()
+    if blocked:
+        log(f"ERROR: CBS blocked {blocked} requests after retries; not posting, watermarks kept")
+        sys.exit(1)
 
-    # Step 4: Combine and filter
-    all_entries = media_entries + pub_entries
-    new_entries = [e for e in all_entries if e["url"] not in known_urls]
+    # Step 3: Combine, filter against URLs the Worker already knows, and
+    # group the new copies of one file: each group is posted once with the
+    # other copies in metadata["duplicates"], which the Worker fans out
+    all_entries = [e for entries, _ in results for e in entries]
+    with span("discover.known_urls", entries=len(all_entries)):
+        known_urls = known_among(
+            base_url,
+            token,
+            [e["url"] for e in all_entries],
+            os.environ.get("CBS_KNOWN_URLS_SNAPSHOT", ""),
+        )
+    unknown = [e for e in all_entries if e["url"] not in known_urls]
+    with span("discover.dedup", entries=len(unknown)):
+        groups = group_duplicates(
+            unknown,
+            head_hasher(fetch_leading_bytes, HEAD_BYTES) if HEAD_BYTES else None,
+        )
+    new_entries = [canonical_entry(g) for g in groups]
 
     log(f"\n=== Discovery summary ===")
     log(f"  Total discovered: {len(all_entries)}")
-    log(f"  Already known:    {len(all_entries) - len(new_entries)}")
+    log(f"  Already known:    {len(all_entries) - len(unknown)}")
+    log(f"  Duplicate copies: {len(unknown) - len(groups)}")
     log(f"  New entries:      {len(new_entries)}")
 
     # Write new_files output for GitHub Actions
@@ -163,15 +192,25 @@ def main():
             f.write(f"new_files={len(new_entries)}\n")
             f.write(f"run_id={now.strftime('%Y-%m-%d')}\n")
 
-    if not new_entries:
-        log("\nNo new files found. Done.")
-        return
-
-    # Step 5: Post to Worker
-    log(f"\nPosting {len(new_entries)} new entries to Worker...")
-    processed, errors = post_manifest(new_entries, base_url, token)
-
-    log(f"\n=== Done: {processed} processed, {errors} batch errors ===")
+    errors = 0
+    if new_entries or load_spool(os.environ.get("CBS_MANIFEST_SPOOL", "")):
+        # Step 4: Post to Worker (after entries spooled by an earlier run)
+        log(f"\nPosting {len(new_entries)} new entries to Worker...")
+        with span("discover.post_manifest", entries=len(new_entries)):
+            processed, errors = post_manifest(new_entries, base_url, token)
+        log(f"\n=== Done: {processed} processed, {errors} batch errors ===")
+    else:
+        log("\nNo new files found.")
+
+    # Step 5: Advance watermarks only if nothing was missed
+    failures = request_failures()
+    if failures or errors:
+        log(f"Keeping discovery watermarks ({failures} failed listings, {errors} batch errors)")
+    elif cursor_path:
+        for (section, _, _), (_, high_water) in zip(sections, results):
+            advance(cursor, section, high_water)
+        save_cursor(cursor_path, cursor)
+        log(f"Discovery watermarks: {json.dumps(cursor)}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,182 @@
+"""Record/replay transport for the CBS client, for offline runs and benchmarks.
+
+Record real SharePoint responses once:
+
+    CBS_HTTP_RECORD=fixtures/cbs python -m action.discover.main
+
+and replay them without touching cbs.gov.il:
+
+    CBS_HTTP_REPLAY=fixtures/cbs CBS_REPLAY_LATENCY=0.2 python -m action.discover.main
+
+Fixtures are one JSON file per URL ({url, status, headers, body}) named by
+a hash of the URL. On replay, a request for a URL that was not recorded
+gets a 404 (SharePoint's answer for a missing folder); a request whose
+If-None-Match matches the recorded ETag gets a 304. Latency
+(CBS_REPLAY_LATENCY seconds, +/- CBS_REPLAY_JITTER) and failures
+(CBS_REPLAY_ERROR_RATE of requests answered with CBS_REPLAY_ERROR_STATUS,
+or raising a timeout when that is 0) can be injected.
+"""
+
+from __future__ import annotations
+
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Any, Optional
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+# Response headers worth keeping in a fixture
+KEPT_HEADERS = ("content-type", "etag", "last-modified")
+
+
+def normalize_url(url: str) -> str:
+    """The URL as requests sends it, so recorded and replayed keys match."""
+    return requests.Request("GET", url).prepare().url
+
+
+def fixture_name(url: str) -> str:
+    return hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()[:20] + ".json"
+
+
+class FixtureStore:
+    """URL -> recorded response, held in memory and optionally backed by a
+    directory of fixture files."""
+
+    def __init__(self, directory: str = ""):
+        self.directory = directory
+        self._records: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        if directory and os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".json"):
+                    with open(os.path.join(directory, name)) as f:
+                        record = json.load(f)
+                    self._records[record["url"]] = record
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def get(self, url: str) -> Optional[dict[str, Any]]:
+        return self._records.get(normalize_url(url))
+
+    def put(self, url: str, status: int, body: Any, headers: Optional[dict[str, str]] = None) -> None:
+        """Store a response; a non-string body is serialized as JSON."""
+        if not isinstance(body, str):
+            body = json.dumps(body)
+            headers = {"content-type": "application/json", **(headers or {})}
+        record = {
+            "url": normalize_url(url),
+            "status": status,
+            "headers": {k.lower(): v for k, v in (headers or {}).items() if k.lower() in KEPT_HEADERS},
+            "body": body,
+        }
+        with self._lock:
+            self._records[record["url"]] = record
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, fixture_name(url))
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(record, f, ensure_ascii=False, indent=1)
+            os.replace(f"{path}.tmp", path)
+
+
+def _response(request: requests.PreparedRequest, status: int, body: str, headers: dict[str, str]) -> requests.Response:
+    resp = requests.Response()
+    resp.status_code = status
+    resp._content = body.encode("utf-8")
+    resp.headers = CaseInsensitiveDict(headers)
+    resp.encoding = "utf-8"
+    resp.url = request.url
+    resp.request = request
+    resp.reason = "Replayed"
+    return resp
+
+
+class RecordingAdapter(HTTPAdapter):
+    """Sends requests for real and records each full response in a store."""
+
+    def __init__(self, store: FixtureStore, **kwargs):
+        super().__init__(**kwargs)
+        self.store = store
+
+    def send(self, request, **kwargs):
+        resp = super().send(request, **kwargs)
+        # A 304 has no body; keep the full response recorded earlier
+        if resp.status_code != 304:
+            self.store.put(request.url, resp.status_code, resp.text, dict(resp.headers))
+        return resp
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers requests from a store, with injected latency and errors."""
+
+    def __init__(
+        self,
+        store: FixtureStore,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 500,
+        seed: Optional[int] = None,
+    ):
+        super().__init__()
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.requests = 0
+        self.missing: list[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+
+        if fail:
+            if not self.error_status:
+                raise requests.exceptions.ReadTimeout(f"injected timeout for {request.url}")
+            return _response(request, self.error_status, "<html>Injected error</html>", {"content-type": "text/html"})
+
+        record = self.store.get(request.url)
+        if record is None:
+            with self._lock:
+                self.missing.append(request.url)
+            return _response(request, 404, json.dumps({"error": "not recorded"}), {"content-type": "application/json"})
+
+        etag = record["headers"].get("etag")
+        if etag and request.headers.get("If-None-Match") == etag:
+            return _response(request, 304, "", dict(record["headers"]))
+        return _response(request, record["status"], record["body"], dict(record["headers"]))
+
+    def close(self):
+        pass
+
+
+def adapter_from_env(**http_kwargs) -> Optional[BaseAdapter]:
+    """Recording or replay adapter selected by CBS_HTTP_RECORD / CBS_HTTP_REPLAY.
+    http_kwargs configure the recording adapter's connection pool."""
+    replay_dir = os.environ.get("CBS_HTTP_REPLAY", "")
+    if replay_dir:
+        return ReplayAdapter(
+            FixtureStore(replay_dir),
+            latency=float(os.environ.get("CBS_REPLAY_LATENCY", "0")),
+            jitter=float(os.environ.get("CBS_REPLAY_JITTER", "0")),
+            error_rate=float(os.environ.get("CBS_REPLAY_ERROR_RATE", "0")),
+            error_status=int(os.environ.get("CBS_REPLAY_ERROR_STATUS", "500")),
+        )
+    record_dir = os.environ.get("CBS_HTTP_RECORD", "")
+    if record_dir:
+        return RecordingAdapter(FixtureStore(record_dir), **http_kwargs)
+    return None
@@ -0,0 +1,248 @@
+"""Manifest uploader: posts discovery entries to the Worker's /api/manifest.
+
+- several batches in flight at once (MANIFEST_CONCURRENCY, default 4)
+- batch size adapts to the Worker's latency (AIMD): it grows by
+  BATCH_INCREASE while batches return within MANIFEST_TARGET_SECONDS and
+  halves when one is slower or fails
+- gzip request bodies (Content-Encoding: gzip)
+- every entry carries idempotency_key = SHA-256(url), so a batch retried
+  after a timeout the Worker actually completed is skipped, not re-ingested
+- 5xx, 429, timeouts and connection errors are retried with jittered
+  exponential backoff
+- entries still undelivered at close() are written to a spool file
+  (CBS_MANIFEST_SPOOL) that the next run replays before anything else
+
+Entries can be submitted as they are discovered; close() drains the queue.
+on_delivered, if given, is called with each batch the Worker accepted.
+"""
+
+from __future__ import annotations
+
+import os
+import gzip
+import json
+import time
+import random
+import hashlib
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+MAX_CONCURRENCY = int(os.environ.get("MANIFEST_CONCURRENCY", "4"))
+TARGET_LATENCY = float(os.environ.get("MANIFEST_TARGET_SECONDS", "60"))
+INITIAL_BATCH = 10
+MIN_BATCH = 1
+MAX_BATCH = 50
+BATCH_INCREASE = 2
+MAX_RETRIES = 4
+BACKOFF_SECONDS = 2.0
+REQUEST_TIMEOUT = 180
+
+
+def log(msg: str) -> None:
+    print(msg, flush=True)
+
+
+def idempotency_key(entry: dict) -> str:
+    return hashlib.sha256(entry["url"].encode("utf-8")).hexdigest()
+
+
+def load_spool(path: str) -> list[dict]:
+    if not path or not os.path.exists(path):
+        return []
+    try:
+        with open(path) as f:
+            return json.load(f).get("entries", [])
+    except (OSError, ValueError) as e:
+        log(f"  Warning: ignoring unreadable manifest spool {path}: {e}")
+        return []
+
+
+def save_spool(path: str, entries: list[dict]) -> None:
+    """Write undelivered entries, or remove the spool when there are none."""
+    if not entries:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"entries": entries}, f)
+    os.replace(tmp_path, path)
+
+
+class ManifestUploader:
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        spool_path: str = "",
+        concurrency: int = MAX_CONCURRENCY,
+        batch_size: int = INITIAL_BATCH,
+        max_batch: int = MAX_BATCH,
+        target_latency: float = TARGET_LATENCY,
+        retries: int = MAX_RETRIES,
+        backoff: float = BACKOFF_SECONDS,
+        timeout: float = REQUEST_TIMEOUT,
+        compress: bool = True,
+        on_delivered: Optional[Callable[[list[dict]], None]] = None,
+    ):
+        self.url = f"{base_url}/api/manifest"
+        self.token = token
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.max_batch = max_batch
+        self.target_latency = target_latency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.compress = compress
+        self.on_delivered = on_delivered
+
+        self.processed = 0
+        self.delivered = 0
+        self.failed_batches = 0
+        self.batches = 0
+
+        self._session = requests.Session()
+        self._session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+        self._session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+        self._cond = threading.Condition()
+        self._pending: deque[dict] = deque()
+        self._keys: set[str] = set()
+        self._undelivered: list[dict] = []
+        self._closed = False
+
+        spooled = load_spool(spool_path)
+        if spooled:
+            log(f"  Replaying {len(spooled)} spooled manifest entries")
+            self.submit(spooled)
+
+        self._threads = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(max(1, concurrency))
+        ]
+        for t in self._threads:
+            t.start()
+
+    def submit(self, entries: list[dict]) -> None:
+        """Queue entries for upload; repeats of a queued URL are ignored."""
+        with self._cond:
+            for entry in entries:
+                key = entry.get("idempotency_key") or idempotency_key(entry)
+                if key in self._keys:
+                    continue
+                self._keys.add(key)
+                self._pending.append({**entry, "idempotency_key": key})
+            self._cond.notify_all()
+
+    def close(self) -> tuple[int, int]:
+        """Drain the queue, spool anything undelivered. Returns (processed, errors)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        self._session.close()
+
+        if self.spool_path:
+            save_spool(self.spool_path, self._undelivered)
+        if self._undelivered:
+            where = f"spooled to {self.spool_path}" if self.spool_path else "not spooled"
+            log(f"  {len(self._undelivered)} manifest entries undelivered ({where})")
+        return self.processed, self.failed_batches
+
+    def __enter__(self) -> "ManifestUploader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _next_batch(self) -> Optional[list[dict]]:
+        # Wait for a full batch while entries are still being submitted
+        with self._cond:
+            while True:
+                if self._pending and (len(self._pending) >= self.batch_size or self._closed):
+                    count = min(self.batch_size, len(self._pending))
+                    return [self._pending.popleft() for _ in range(count)]
+                if self._closed:
+                    return None
+                self._cond.wait()
+
+    def _run(self) -> None:
+        while (batch := self._next_batch()) is not None:
+            self._deliver(batch)
+
+    def _adapt(self, ok: bool, latency: float = 0.0) -> None:
+        with self._cond:
+            if ok and latency <= self.target_latency:
+                self.batch_size = min(self.max_batch, self.batch_size + BATCH_INCREASE)
+            else:
+                self.batch_size = max(MIN_BATCH, self.batch_size // 2)
+            self._cond.notify_all()
+
+    def _post(self, batch: list[dict]) -> requests.Response:
+        body = json.dumps({"entries": batch}).encode("utf-8")
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+        }
+        if self.compress:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return self._session.post(self.url, data=body, headers=headers, timeout=self.timeout)
+
+    def _deliver(self, batch: list[dict]) -> None:
+        with self._cond:
+            self.batches += 1
+            batch_num = self.batches
+        log(f"  Batch {batch_num}: {len(batch)} entries")
+
+        for attempt in range(self.retries + 1):
+            start = time.monotonic()
+            retryable = True
+            try:
+                resp = self._post(batch)
+            except requests.RequestException as e:
+                error = str(e)
+            else:
+                result = None
+                if resp.status_code == 200:
+                    try:
+                        result = resp.json()
+                    except ValueError:
+                        # A proxy or error page answering 200: not a Worker
+                        # acknowledgement, so the batch is retried
+                        error = f"HTTP 200 without a JSON body: {resp.text[:200]}"
+                if result is not None:
+                    latency = time.monotonic() - start
+                    self._adapt(True, latency)
+                    with self._cond:
+                        self.processed += result.get("processed", 0)
+                        self.delivered += len(batch)
+                    log(
+                        f"    Batch {batch_num} OK in {latency:.1f}s: processed={result.get('processed', 0)}, "
+                        f"errors={result.get('errors', 0)}, pdfs={result.get('pdf_requests', 0)}"
+                    )
+                    if self.on_delivered:
+                        self.on_delivered(batch)
+                    return
+                if resp.status_code != 200:
+                    error = f"HTTP {resp.status_code}: {resp.text[:200]}"
+                    retryable = resp.status_code >= 500 or resp.status_code == 429
+
+            self._adapt(False)
+            if not retryable or attempt == self.retries:
+                log(f"    Batch {batch_num} error: {error}")
+                break
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            log(f"    Batch {batch_num} error: {error}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+        with self._cond:
+            self.failed_batches += 1
+            self._undelivered.extend(batch)
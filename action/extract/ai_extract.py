@@ -1,24 +1,48 @@
 import os
 import json
 import base64
-import anthropic
-from typing import Any
+from typing import Any, Optional
+
+from ..tracing import span
+from .lazy import lazy_import
+
+anthropic = lazy_import("anthropic")
+
+# Full vision model used for the final cascade tier
+DEFAULT_MODEL = "claude-sonnet-4-5-20250929"
+# Cheaper/faster model used for the early cascade tiers
+FAST_MODEL = "claude-haiku-4-5-20251001"
+
+
+def file_marker(label: str) -> str:
+    """Section marker preceding the pages of one file in a grouped call."""
+    return f"=== File {label} ==="
 
 
 def extract_data_from_images(
     image_paths: list[str],
     extraction_schema: dict[str, Any],
     expected_content: str,
+    model: str = DEFAULT_MODEL,
+    page_numbers: Optional[list[int]] = None,
+    file_labels: Optional[list[str]] = None,
 ) -> dict[str, Any]:
     """Send PDF page images to AI vision model for data extraction.
 
     Returns dict with 'data' (list of records) and 'confidence' (float).
+    When page_numbers is given, each image is preceded by a page marker and
+    every record is tagged with the '_page' it came from. When file_labels
+    (one per image) is given, the images of several files are sent
+    together, each file's pages after a file marker, and every record is
+    tagged with the '_file' it came from.
     """
-    client = anthropic.Anthropic(api_key=os.environ["ANTHRIPIC_API_KEY"])
-
     # Build content with images
     content: list[dict[str, Any]] = []
-    for path in image_paths:
+    for i, path in enumerate(image_paths):
+        if file_labels and (i == 0 or file_labels[i] != file_labels[i - 1]):
+            content.append({"type": "text", "text": file_marker(file_labels[i])})
+        if page_numbers:
+            content.append({"type": "text", "text": f"--- Page {page_numbers[i]} ---"})
         with open(path, "rb") as f:
             img_data = base64.standard_b64encode(f.read()).decode("utf-8")
         content.append({
@@ -30,14 +54,68 @@ def extract_data_from_images(
             },
         })
 
+    return _extract(
+        content, "these images", extraction_schema, expected_content, model,
+        tag_pages=bool(page_numbers), tag_files=bool(file_labels),
+    )
+
+
+def extract_data_from_text(
+    page_texts: list[str],
+    extraction_schema: dict[str, Any],
+    expected_content: str,
+    model: str = FAST_MODEL,
+    page_numbers: Optional[list[int]] = None,
+    file_labels: Optional[list[str]] = None,
+) -> dict[str, Any]:
+    """Send the PDF text layer to the AI model for data extraction.
+
+    Same return shape, page and file tagging as extract_data_from_images.
+    """
+    numbers = page_numbers or list(range(1, len(page_texts) + 1))
+    sections = []
+    for i, (n, text) in enumerate(zip(numbers, page_texts)):
+        if file_labels and (i == 0 or file_labels[i] != file_labels[i - 1]):
+            sections.append(file_marker(file_labels[i]))
+        sections.append(f"--- Page {n} ---\n{text}")
+    content: list[dict[str, Any]] = [{"type": "text", "text": "\n\n".join(sections)}]
+
+    return _extract(
+        content, "this text layer", extraction_schema, expected_content, model,
+        tag_pages=bool(page_numbers), tag_files=bool(file_labels),
+    )
+
+
+def _extract(
+    content: list[dict[str, Any]],
+    material: str,
+    extraction_schema: dict[str, Any],
+    expected_content: str,
+    model: str,
+    tag_pages: bool = False,
+    tag_files: bool = False,
+) -> dict[str, Any]:
+    client = anthropic.Anthropic(api_key=os.environ["ANTHRIPIC_API_KEY"])
+
     # Build the extraction prompt
     schema_type = extraction_schema.get("type", "unknown")
     fields = extraction_schema.get("fields", [])
+    page_rule = (
+        '\n- Add a "_page" field to each record with the number from the'
+        ' "--- Page N ---" marker of the page it came from'
+        if tag_pages else ""
+    )
+    file_rule = (
+        '\n- The material covers several files, each starting with a'
+        ' "=== File NAME ===" marker; add a "_file" field to each record with'
+        ' the NAME of the file it came from'
+        if tag_files else ""
+    )
 
-    prompt = f"""Analyze these images from an Israeli government statistical publication.
+    prompt = f"""Analyze {material} from an Israeli government statistical publication.
 The expected content is: {expected_content}
 
-Extract ALL data from the tables/text in the images and return it as a JSON array.
+Extract ALL data from the tables/text in {material} and return it as a JSON array.
 
 Each record in the array MUST have these fields: {json.dumps(fields)}
 
@@ -45,23 +123,28 @@ Schema type: {schema_type}
 
 Rules:
 - Return ONLY valid JSON, no markdown or commentary
-- Extract ALL rows/entries visible in the images
+- Extract ALL rows/entries visible in {material}
 - For Hebrew text, preserve the original Hebrew characters
 - Numbers should be parsed as numeric values (not strings)
 - If a value is missing or unclear, use null
-- Dates/periods should be preserved as shown in the source
+- Dates/periods should be preserved as shown in the source{page_rule}{file_rule}
 
 Return format: {{"data": [...records...], "confidence": 0.0-1.0}}
 Where confidence reflects your certainty about the extraction accuracy."""
 
-    content.append({"type": "text", "text": prompt})
+    content = content + [{"type": "text", "text": prompt}]
 
     # Call Claude
-    response = client.messages.create(
-        model="claude-sonnet-4-5-20250929",
-        max_tokens=8192,
-        messages=[{"role": "user", "content": content}],
-    )
+    with span("ai_extract", model=model, material=material, schema_type=schema_type) as attrs:
+        response = client.messages.create(
+            model=model,
+            max_tokens=8192,
+            messages=[{"role": "user", "content": content}],
+        )
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            attrs["input_tokens"] = getattr(usage, "input_tokens", None)
+            attrs["output_tokens"] = getattr(usage, "output_tokens", None)
 
     # Parse response
     response_text = response.content[0].text.strip()
@@ -91,12 +174,12 @@ Where confidence reflects your certainty about the extraction accuracy."""
 
     # Retry with more explicit prompt
     print("First extraction attempt returned invalid JSON, retrying...")
-    retry_content = content[:-1]  # Keep images
+    retry_content = content[:-1]  # Keep images / text layer
     retry_content.append({
         "type": "text",
         "text": f"""The previous extraction failed to return valid JSON.
 
-Please extract the data from these images and return ONLY a JSON object.
+Please extract the data from {material} and return ONLY a JSON object.
 No explanations, no markdown formatting, just the JSON object.
 
 Required format:
@@ -106,7 +189,7 @@ Return ONLY the JSON object, nothing else.""",
     })
 
     retry_response = client.messages.create(
-        model="claude-sonnet-4-5-20250929",
+        model=model,
         max_tokens=8192,
         messages=[{"role": "user", "content": retry_content}],
     )
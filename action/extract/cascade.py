@@ -0,0 +1,271 @@
+"""Confidence-driven extraction cascade.
+
+Each extraction_schema type has an ordered list of tiers, cheapest first:
+1. text_layer  — embedded PDF text sent to the fast model (no rendering)
+2. fast_vision — low-DPI page images sent to the fast model
+3. full_vision — high-DPI page images sent to the full vision model
+
+A tier is accepted when validation passes and the model's confidence meets
+the schema's threshold; otherwise the next tier runs. The tier that produced
+the result is recorded in extraction_method.
+
+Several PDFs of one publication can run through the cascade together
+(run_group_cascade): each tier sends the pending files' pages in one model
+call, every file's pages after a "=== File NAME ===" marker, and the
+records are split back by the '_file' tag the model adds. Files are
+accepted or escalated individually.
+
+The tier list per schema type can be overridden with the EXTRACTION_CASCADE
+environment variable, a JSON object mapping schema type to tier names, e.g.
+{"housing_price_index": ["fast_vision", "full_vision"]}. It is read once at
+import; an unreadable value is logged and the built-in CASCADES apply.
+"""
+
+import os
+import json
+from typing import Any, Optional
+
+from .pdf_to_images import pdf_to_images, pdf_text_layer, renderer
+from .ai_extract import (
+    extract_data_from_images,
+    extract_data_from_text,
+    DEFAULT_MODEL,
+    FAST_MODEL,
+)
+from .validate import validate_extraction
+
+TIERS: dict[str, dict[str, Any]] = {
+    "text_layer": {"mode": "text", "model": FAST_MODEL},
+    "fast_vision": {"mode": "vision", "model": FAST_MODEL, "dpi": 150},
+    "full_vision": {"mode": "vision", "model": DEFAULT_MODEL, "dpi": 300},
+}
+
+CASCADES: dict[str, list[str]] = {
+    "housing_price_index": ["text_layer", "fast_vision", "full_vision"],
+    "avg_apartment_prices": ["text_layer", "fast_vision", "full_vision"],
+    "consumer_price_index": ["text_layer", "fast_vision", "full_vision"],
+    "review_insights": ["text_layer", "full_vision"],
+}
+DEFAULT_CASCADE = ["fast_vision", "full_vision"]
+
+CONFIDENCE_THRESHOLDS: dict[str, float] = {
+    "housing_price_index": 0.85,
+    "avg_apartment_prices": 0.9,
+    "consumer_price_index": 0.9,
+    "review_insights": 0.7,
+}
+DEFAULT_CONFIDENCE_THRESHOLD = 0.85
+
+# Below this many characters of text layer the PDF is treated as scanned
+MIN_TEXT_LAYER_CHARS = 200
+
+
+def load_overrides(value: str) -> dict[str, list[str]]:
+    """Parse an EXTRACTION_CASCADE value; {} (logged) if it is not a JSON
+    object of tier name lists."""
+    if not value:
+        return {}
+    try:
+        configured = json.loads(value)
+    except json.JSONDecodeError as e:
+        print(f"WARNING: ignoring EXTRACTION_CASCADE, not valid JSON: {e}")
+        return {}
+    if not isinstance(configured, dict) or not all(isinstance(t, list) for t in configured.values()):
+        print("WARNING: ignoring EXTRACTION_CASCADE, expected an object of tier name lists")
+        return {}
+    return configured
+
+
+CASCADE_OVERRIDES = load_overrides(os.environ.get("EXTRACTION_CASCADE", ""))
+
+
+def cascade_for(schema_type: str) -> list[str]:
+    """Return the ordered tier names for a schema type."""
+    if schema_type in CASCADE_OVERRIDES:
+        return [t for t in CASCADE_OVERRIDES[schema_type] if t in TIERS]
+    return CASCADES.get(schema_type, DEFAULT_CASCADE)
+
+
+def strongest_tier(schema_type: str) -> str:
+    """The last, most capable tier of a schema type's cascade."""
+    return (cascade_for(schema_type) or DEFAULT_CASCADE)[-1]
+
+
+def extraction_method(tier_name: str) -> str:
+    """Describe a tier for the result's extraction_method field."""
+    tier = TIERS[tier_name]
+    if tier["mode"] == "text":
+        return f"cascade/{tier_name}:pymupdf_text+{tier['model']}"
+    return f"cascade/{tier_name}:{renderer()}@{tier['dpi']}dpi+{tier['model']}"
+
+
+def run_cascade(
+    pdf_path: str,
+    extraction_schema: dict[str, Any],
+    expected_content: str,
+    pages: Optional[list[int]] = None,
+    tiers: Optional[list[str]] = None,
+) -> dict[str, Any]:
+    """Run the cascade for one PDF until a tier is accepted.
+
+    Only the given 1-based pages are sent when pages is set (all pages
+    otherwise); every record is tagged with its '_page'. tiers overrides
+    the schema type's tier list.
+
+    Returns dict with 'data' (valid records), 'raw_data' (every record
+    returned), 'raw_count', 'errors',
+    'confidence', 'extraction_method', 'pages_processed' and 'image_paths'
+    (every rendered image, for the caller to clean up). When no tier is
+    accepted the last tier attempted is returned.
+    """
+    files = [{"label": os.path.basename(pdf_path), "pdf_path": pdf_path, "pages": pages}]
+    return run_group_cascade(files, extraction_schema, expected_content, tiers)[files[0]["label"]]
+
+
+def split_by_file(
+    records: list[dict[str, Any]],
+    labels: list[str],
+) -> dict[Optional[str], list[dict[str, Any]]]:
+    """Assign records of a grouped call to files by their '_file' tag.
+
+    Returns the records per label, plus those naming no sent file (missing
+    or unknown '_file') under None. With a single file every record is its
+    own.
+    """
+    by_file: dict[Optional[str], list[dict[str, Any]]] = {label: [] for label in labels}
+    by_file[None] = []
+    for record in records:
+        label = record.pop("_file", None) if isinstance(record, dict) else None
+        if len(labels) == 1:
+            label = labels[0]
+        by_file[label if label in labels else None].append(record)
+    return by_file
+
+
+def _call_tier(
+    tier_name: str,
+    sent: dict[str, dict[str, Any]],
+    extraction_schema: dict[str, Any],
+    expected_content: str,
+) -> tuple[dict[Optional[str], list[dict[str, Any]]], float]:
+    """One model call at a tier over the files in sent ({label: {"inputs",
+    "pages"}}), file markers only when there are several. Returns the
+    records grouped by file (None: naming no sent file) and the confidence."""
+    tier = TIERS[tier_name]
+    inputs = [i for s in sent.values() for i in s["inputs"]]
+    page_numbers = [p for s in sent.values() for p in s["pages"]]
+    labels = [label for label, s in sent.items() for _ in s["inputs"]]
+    extract = extract_data_from_text if tier["mode"] == "text" else extract_data_from_images
+    ai_result = extract(
+        inputs, extraction_schema, expected_content,
+        model=tier["model"],
+        page_numbers=page_numbers,
+        file_labels=labels if len(sent) > 1 else None,
+    )
+    return split_by_file(ai_result.get("data", []), list(sent)), ai_result.get("confidence", 0.0)
+
+
+def run_group_cascade(
+    files: list[dict[str, Any]],
+    extraction_schema: dict[str, Any],
+    expected_content: str,
+    tiers: Optional[list[str]] = None,
+) -> dict[str, dict[str, Any]]:
+    """Run the cascade for several PDFs sharing a schema in one model call
+    per tier.
+
+    files lists {"label", "pdf_path", "pages"} with unique labels. The pages
+    of all files still pending are sent together, each file's after a file
+    marker, and the records are split back by their '_file' tag (files the
+    reply loses track of are asked again alone at the same tier). Each file
+    is validated and accepted on its own; only files whose tier was not
+    accepted go on to the next tier, so a single file behaves exactly like
+    run_cascade.
+
+    Returns run_cascade's outcome per label, image_paths holding that
+    file's renders.
+    """
+    schema_type = extraction_schema.get("type", "")
+    threshold = CONFIDENCE_THRESHOLDS.get(schema_type, DEFAULT_CONFIDENCE_THRESHOLD)
+    image_paths: dict[str, list[str]] = {f["label"]: [] for f in files}
+    outcomes: dict[str, dict[str, Any]] = {}
+    pending = list(files)
+
+    for tier_name in tiers or cascade_for(schema_type):
+        if not pending:
+            break
+        tier = TIERS[tier_name]
+        sent: dict[str, dict[str, Any]] = {}
+
+        for f in pending:
+            if tier["mode"] == "text":
+                file_inputs = pdf_text_layer(f["pdf_path"], pages=f["pages"])
+                if sum(len(t.strip()) for t in file_inputs) < MIN_TEXT_LAYER_CHARS:
+                    print(f"Tier {tier_name}: no usable text layer in {f['label']}, skipping")
+                    continue
+            else:
+                file_inputs = pdf_to_images(f["pdf_path"], dpi=tier["dpi"], pages=f["pages"])
+                image_paths[f["label"]].extend(file_inputs)
+            sent[f["label"]] = {
+                "inputs": file_inputs,
+                "pages": list(f["pages"] or range(1, len(file_inputs) + 1)),
+            }
+
+        if not sent:
+            continue
+        by_file, confidence = _call_tier(tier_name, sent, extraction_schema, expected_content)
+        confidences = {label: confidence for label in sent}
+
+        # A grouped reply that lost track of files (records without a usable
+        # '_file', or a file with no records at all) is asked again file by
+        # file at the same tier before anything escalates. Records naming no
+        # file could be anyone's, so then every file is asked again.
+        if len(sent) > 1:
+            unassigned = by_file.pop(None, [])
+            if unassigned:
+                print(f"Tier {tier_name}: {len(unassigned)} records name no file of the group, "
+                      f"re-running each file on its own")
+            retry = list(sent) if unassigned else [label for label in sent if not by_file[label]]
+            for label in retry:
+                print(f"Tier {tier_name} [{label}]: re-running on its own")
+                single, confidences[label] = _call_tier(
+                    tier_name, {label: sent[label]}, extraction_schema, expected_content
+                )
+                by_file[label] = single[label]
+
+        for label, file_sent in sent.items():
+            raw_data = by_file[label]
+            valid_data, errors = validate_extraction(raw_data, extraction_schema)
+            outcomes[label] = {
+                "data": valid_data,
+                "raw_count": len(raw_data),
+                "raw_data": raw_data,
+                "errors": errors,
+                "confidence": confidences[label],
+                "extraction_method": extraction_method(tier_name),
+                "pages_processed": len(file_sent["inputs"]),
+            }
+            prefix = f"Tier {tier_name}" + (f" [{label}]" if len(files) > 1 else "")
+            print(
+                f"{prefix}: {len(valid_data)}/{len(raw_data)} valid "
+                f"(confidence: {confidences[label]}, threshold: {threshold})"
+            )
+
+        pending = [
+            f for f in pending
+            if f["label"] not in sent or not _accepted(outcomes[f["label"]], threshold)
+        ]
+
+    missing = [f["label"] for f in files if f["label"] not in outcomes]
+    if missing:
+        raise RuntimeError(
+            f"No cascade tier could run for schema type '{schema_type}' ({', '.join(missing)})"
+        )
+
+    for label, outcome in outcomes.items():
+        outcome["image_paths"] = image_paths[label]
+    return outcomes
+
+
+def _accepted(outcome: dict[str, Any], threshold: float) -> bool:
+    return bool(outcome["data"]) and not outcome["errors"] and outcome["confidence"] >= threshold
@@ -0,0 +1,170 @@
+"""Cross-period consistency checks on extracted index series.
+
+Row validation (validate.py) cannot see a misread digit that still gives a
+plausible index_value. Here a request's records are loaded into NumPy
+arrays, grouped into series by the schema type's SERIES_FIELDS (district
+and base_year for the housing price index) and keyed by period, and checked
+in vectorized passes over all series at once:
+
+- change: reported percentage changes (CHANGE_FIELDS: pct_change_monthly
+  one month back, pct_change_annual twelve) are recomputed
+  from index_value and must agree within PCT_TOLERANCE percentage points,
+  which allows for the rounding of published indexes and changes
+- jump: a month-over-month change above MIN_JUMP_PCT that is also more
+  than JUMP_MADS median absolute deviations from the series' median change.
+  A jump out and straight back (a spike) flags only the month in between
+
+Each flag carries the record's '_page', so main.py can re-extract only the
+pages involved rather than the whole PDF.
+"""
+
+import re
+from typing import Any, Optional
+
+from .lazy import lazy_import
+
+np = lazy_import("numpy")
+
+SERIES_FIELDS: dict[str, tuple[str, ...]] = {
+    "housing_price_index": ("district", "base_year"),
+    "consumer_price_index": ("index_code", "base_year"),
+}
+# Reported change field -> months back it is measured against. The district
+# table's (aa2_3) bare pct_change is left out: its schema does not say which
+# earlier period it compares with, so it cannot be recomputed.
+CHANGE_FIELDS: dict[str, int] = {
+    "pct_change_monthly": 1,
+    "pct_change_annual": 12,
+}
+PCT_TOLERANCE = 0.25
+MIN_JUMP_PCT = 5.0
+JUMP_MADS = 6.0
+
+_YEAR_MONTH = re.compile(r"^\s*(\d{4})\s*[-/.]\s*(\d{1,2})\s*$")
+_MONTH_YEAR = re.compile(r"^\s*(\d{1,2})\s*[-/.]\s*(\d{4})\s*$")
+
+
+def period_ordinal(period: Any) -> Optional[int]:
+    """Months since year 0 for 'YYYY-MM' or 'MM/YYYY' periods, else None."""
+    text = str(period or "")
+    match = _YEAR_MONTH.match(text)
+    if match:
+        year, month = int(match.group(1)), int(match.group(2))
+    else:
+        match = _MONTH_YEAR.match(text)
+        if not match:
+            return None
+        month, year = int(match.group(1)), int(match.group(2))
+    if not 1 <= month <= 12:
+        return None
+    return year * 12 + month - 1
+
+
+def _number(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def check_consistency(
+    records: list[dict[str, Any]],
+    schema: dict[str, Any],
+) -> list[dict[str, Any]]:
+    """Flag records that break their series.
+
+    Returns one flag per finding: {"record" (index into records), "page",
+    "period", "series", "check" ("change" or "jump"), "field", "reported",
+    "recomputed"}, ordered by record. Schema types without SERIES_FIELDS,
+    and records without a parseable period or index_value, are not checked.
+    """
+    series_fields = SERIES_FIELDS.get(schema.get("type", ""))
+    if not series_fields or not records:
+        return []
+
+    months = [period_ordinal(r.get("period")) for r in records]
+    rows = np.array([i for i, m in enumerate(months) if m is not None], dtype=np.int64)
+    if rows.size == 0:
+        return []
+    values = np.array([_number(records[i].get("index_value")) for i in rows])
+    keep = np.isfinite(values) & (values > 0)
+    rows, values = rows[keep], values[keep]
+    if rows.size < 2:
+        return []
+
+    labels = {int(i): tuple(str(records[i].get(f) or "") for f in series_fields) for i in rows}
+    series_names, series = np.unique(
+        np.array(["\x1f".join(labels[int(i)]) for i in rows]), return_inverse=True
+    )
+    month = np.array([months[i] for i in rows], dtype=np.int64)
+
+    # One sortable key per (series, month); a later duplicate row wins
+    span = int(month.max() - month.min()) + 13
+    key = series.astype(np.int64) * span + (month - month.min() + 12)
+    order = np.argsort(key, kind="stable")
+    key, rows, values, series, month = key[order], rows[order], values[order], series[order], month[order]
+    last = np.r_[key[1:] != key[:-1], True]
+    key, rows, values, series, month = key[last], rows[last], values[last], series[last], month[last]
+
+    def back(months_back: int):
+        """Index value months_back earlier in the same series (NaN if absent)."""
+        pos = np.searchsorted(key, key - months_back)
+        pos = np.minimum(pos, key.size - 1)
+        found = key[pos] == key - months_back
+        return np.where(found, values[pos], np.nan)
+
+    flags: list[dict[str, Any]] = []
+
+    def flag(mask, check: str, field: str, reported, recomputed) -> None:
+        for j in np.flatnonzero(mask):
+            record = records[int(rows[j])]
+            flags.append({
+                "record": int(rows[j]),
+                "page": record.get("_page"),
+                "period": record.get("period"),
+                "series": dict(zip(series_fields, labels[int(rows[j])])),
+                "check": check,
+                "field": field,
+                "reported": None if np.isnan(reported[j]) else round(float(reported[j]), 3),
+                "recomputed": round(float(recomputed[j]), 3),
+            })
+
+    # Reported changes against changes recomputed from the index
+    for field, months_back in CHANGE_FIELDS.items():
+        reported = np.array([_number(records[int(i)].get(field)) for i in rows])
+        if not np.isfinite(reported).any():
+            continue
+        recomputed = (values / back(months_back) - 1.0) * 100.0
+        mismatch = np.isfinite(reported) & np.isfinite(recomputed) & (np.abs(reported - recomputed) > PCT_TOLERANCE)
+        flag(mismatch, "change", field, reported, recomputed)
+
+    # Outlier month-over-month jumps, against each series' typical change
+    change = (values / back(1) - 1.0) * 100.0
+    has_change = np.isfinite(change)
+    if has_change.any():
+        n_series = len(series_names)
+        median = np.full(n_series, np.nan)
+        mad = np.full(n_series, np.nan)
+        for s in np.unique(series[has_change]):
+            c = change[has_change & (series == s)]
+            median[s] = np.median(c)
+            mad[s] = np.median(np.abs(c - median[s]))
+        deviation = np.abs(change - median[series])
+        outlier = has_change & (np.abs(change) > MIN_JUMP_PCT) & (deviation > JUMP_MADS * np.maximum(mad[series], 1e-9))
+
+        # A spike jumps out and straight back: keep the flag on the middle month
+        nxt = np.minimum(np.searchsorted(key, key + 1), key.size - 1)
+        has_next = key[nxt] == key + 1
+        returns = np.zeros_like(outlier)
+        returns[has_next] = outlier[nxt[has_next]] & (np.sign(change[nxt[has_next]]) == -np.sign(change[has_next]))
+        spike_end = np.zeros_like(outlier)
+        spike_end[nxt[has_next & outlier & returns]] = True
+        flag(outlier & ~spike_end, "jump", "index_value", np.full(values.size, np.nan), change)
+
+    flags.sort(key=lambda f: (f["record"], f["check"], f["field"]))
+    return flags
+
+
+def flagged_pages(flags: list[dict[str, Any]]) -> list[int]:
+    """Pages with at least one flag, in order (flags without a page skipped)."""
+    return sorted({f["page"] for f in flags if isinstance(f.get("page"), int)})
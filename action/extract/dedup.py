@@ -0,0 +1,134 @@
+"""Content-hash deduplication of extraction requests.
+
+The same PDF can reach extraction under several publications (media
+release and publication copies, re-uploads under a new URL). Each
+successful extraction is recorded in R2 under the file's full SHA-256
+(pipeline/by-sha256/{sha256}.json, see r2_client.write_content_index).
+A later request for a file with the same checksum and extraction schema
+reuses those records, re-tagged with its own publication and file, instead
+of running the cascade again.
+
+The planner keeps requests for the same checksum (the R2 object's
+"checksum" metadata, set by the Worker on archive) in one shard, first
+one first. Requests that still meet (other shards, pool workers in
+--serve mode) are serialized by a claim: before extracting, a request
+creates the index object as {"claimed_by", "expires_at"} with a
+conditional put (If-None-Match: *). A request finding someone else's live
+claim waits up to CONTENT_CLAIM_WAIT seconds for the indexed result and
+reuses it. A claim is released by overwriting it with an expired one
+(conditional on its ETag), and an expired claim is taken over like a
+stale lease (leases.py). Disable with EXTRACTION_DEDUP=0.
+"""
+
+import os
+import copy
+import time
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+CONTENT_INDEX_PREFIX = "pipeline/by-sha256/"
+CLAIM_TTL = 1800
+CLAIM_POLL_INTERVAL = 5
+CONTENT_CLAIM_WAIT = float(os.environ.get("CONTENT_CLAIM_WAIT", "300"))
+
+
+def dedup_enabled() -> bool:
+    return os.environ.get("EXTRACTION_DEDUP", "1") != "0"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def content_index_key(sha256: str) -> str:
+    return f"{CONTENT_INDEX_PREFIX}{sha256}.json"
+
+
+def claim_content(
+    store,
+    sha256: str,
+    request_id: str,
+    wait: float = CONTENT_CLAIM_WAIT,
+) -> tuple[str, Any]:
+    """Claim the extraction of a file by its checksum.
+
+    Returns ("claimed", etag) when this request is to extract it,
+    ("indexed", entry) when the file's extraction is already recorded, or
+    ("unclaimed", None) when another request still held its claim after
+    waiting (the caller extracts anyway rather than block longer). store is
+    r2_client or a stand-in with its conditional-put functions.
+    """
+    key = content_index_key(sha256)
+    deadline = time.monotonic() + wait
+    while True:
+        claim = {"claimed_by": request_id, "expires_at": time.time() + CLAIM_TTL}
+        etag = store.put_json_conditional(key, claim)
+        if etag is not None:
+            return "claimed", etag
+        existing = store.get_json_with_etag(key)
+        if existing is None:
+            continue  # released between our put and read
+        entry, current_etag = existing
+        if "claimed_by" not in entry:
+            return "indexed", entry
+        if entry.get("expires_at", 0) <= time.time():
+            etag = store.put_json_conditional(key, claim, if_match=current_etag)
+            if etag is not None:
+                return "claimed", etag
+            continue
+        if time.monotonic() >= deadline:
+            print(f"File {sha256[:12]} still claimed by {entry['claimed_by']}, extracting anyway")
+            return "unclaimed", None
+        print(f"File {sha256[:12]} is being extracted by {entry['claimed_by']}, waiting")
+        time.sleep(CLAIM_POLL_INTERVAL)
+
+
+def release_content_claim(store, sha256: str, request_id: str, etag: str) -> None:
+    """Give up a claim without a result, if it is still ours."""
+    expired = {"claimed_by": request_id, "expires_at": 0}
+    store.put_json_conditional(content_index_key(sha256), expired, if_match=etag)
+
+
+def content_entry(request: dict[str, Any], result: dict[str, Any]) -> dict[str, Any]:
+    """The content index entry recording a successful extraction."""
+    return {
+        "request_id": result["request_id"],
+        "publication_id": request["publication_id"],
+        "schema_type": request["extraction_schema"]["type"],
+        "status": result["status"],
+        "data": result["data"],
+        "confidence": result["confidence"],
+        "extraction_method": result["extraction_method"],
+        "recorded_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def reusable(entry: Optional[dict[str, Any]], request: dict[str, Any]) -> bool:
+    return (
+        entry is not None
+        and entry.get("status") == "success"
+        and entry.get("schema_type") == request["extraction_schema"]["type"]
+    )
+
+
+def fan_out(entry: dict[str, Any], request: dict[str, Any], file_id: str) -> list[dict[str, Any]]:
+    """The indexed records, re-tagged for this request's publication and file."""
+    records = copy.deepcopy(entry["data"])
+    for record in records:
+        record["publication_id"] = request["publication_id"]
+        record["file_id"] = file_id
+    return records
+
+
+def duplicate_groups(checksums: dict[str, str]) -> list[list[str]]:
+    """Group request IDs by file checksum (request_id -> checksum; requests
+    without one stay alone). Groups and their members are in ID order."""
+    groups: dict[str, list[str]] = {}
+    for request_id in sorted(checksums):
+        groups.setdefault(checksums[request_id] or request_id, []).append(request_id)
+    return sorted(groups.values())
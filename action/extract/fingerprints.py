@@ -0,0 +1,171 @@
+"""Per-page fingerprints for incremental re-extraction.
+
+CBS republishes the same templates every month (price01aa, aa2_x tables) and
+most pages barely change. Each rendered page gets two fingerprints:
+- text:  SHA-1 of the whitespace-normalised text layer (empty for scans)
+- image: 256-bit difference hash (dHash) of a low-resolution render
+
+A page matches a page of the prior publication when its text fingerprint is
+identical and its image hash is within a small Hamming distance. Pages
+without a text layer must have an identical image hash, since a changed digit
+barely moves a perceptual hash. Matched pages reuse the prior records; only
+the remaining pages are sent to the model.
+"""
+
+import os
+import hashlib
+from typing import Any, Optional
+
+from .lazy import lazy_import
+from .pdf_to_images import pdf_to_images, pdf_text_layer
+
+Image = lazy_import("PIL.Image")
+
+# Render resolution for fingerprinting only (never sent to the model)
+FINGERPRINT_DPI = 36
+HASH_SIZE = 16
+MAX_IMAGE_DISTANCE = 6
+
+
+def text_fingerprint(text: str) -> str:
+    """Fingerprint a page's text layer; empty string when there is no text."""
+    normalised = " ".join(text.split())
+    if not normalised:
+        return ""
+    return hashlib.sha1(normalised.encode("utf-8")).hexdigest()
+
+
+def image_fingerprint(image_path: str, hash_size: int = HASH_SIZE) -> str:
+    """Difference hash of a page image, as a hex string."""
+    with Image.open(image_path) as img:
+        small = img.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+        pixels = small.tobytes()
+
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming_distance(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def page_fingerprints(pdf_path: str) -> list[dict[str, Any]]:
+    """Fingerprint every page of a PDF.
+
+    Returns [{'page': 1-based number, 'text': ..., 'image': ...}, ...].
+    """
+    image_paths = pdf_to_images(pdf_path, dpi=FINGERPRINT_DPI)
+    texts = pdf_text_layer(pdf_path)
+
+    fingerprints = []
+    for i, path in enumerate(image_paths):
+        fingerprints.append({
+            "page": i + 1,
+            "text": text_fingerprint(texts[i]) if i < len(texts) else "",
+            "image": image_fingerprint(path),
+        })
+        os.unlink(path)
+
+    return fingerprints
+
+
+def pages_match(current: dict[str, Any], previous: dict[str, Any]) -> bool:
+    if current["text"] != previous.get("text", ""):
+        return False
+    distance = hamming_distance(current["image"], previous["image"])
+    if not current["text"]:
+        return distance == 0
+    return distance <= MAX_IMAGE_DISTANCE
+
+
+def match_pages(
+    current: list[dict[str, Any]],
+    previous: list[dict[str, Any]],
+) -> dict[int, int]:
+    """Map current page numbers to matching prior page numbers.
+
+    Each prior page is matched at most once; pages are allowed to move
+    (e.g. an extra page inserted ahead of the historic tables).
+    """
+    matches: dict[int, int] = {}
+    used: set[int] = set()
+
+    for page in current:
+        for prior in previous:
+            if prior["page"] in used:
+                continue
+            if pages_match(page, prior):
+                matches[page["page"]] = prior["page"]
+                used.add(prior["page"])
+                break
+
+    return matches
+
+
+def records_by_page(
+    records: list[dict[str, Any]],
+    pages: list[int],
+) -> Optional[dict[int, list[dict[str, Any]]]]:
+    """Group records by their '_page' tag.
+
+    Returns None when any record lacks a page from the given set: such a
+    result cannot be reused page by page next month.
+    """
+    grouped: dict[int, list[dict[str, Any]]] = {p: [] for p in pages}
+    for record in records:
+        page = record.get("_page")
+        if page not in grouped:
+            return None
+        grouped[page].append(record)
+    return grouped
+
+
+def build_index(
+    request: dict[str, Any],
+    fingerprints: list[dict[str, Any]],
+    page_records: dict[int, list[dict[str, Any]]],
+    confidence: float,
+) -> dict[str, Any]:
+    """Build the fingerprint index stored for the next publication."""
+    pages = []
+    for fp in fingerprints:
+        records = [
+            {k: v for k, v in r.items() if k not in ("publication_id", "file_id", "_page")}
+            for r in page_records.get(fp["page"], [])
+        ]
+        pages.append({**fp, "records": records})
+
+    return {
+        "request_id": request["request_id"],
+        "publication_id": request["publication_id"],
+        "created_at": request.get("created_at", ""),
+        "expected_content": request["file"]["expected_content"],
+        "confidence": confidence,
+        "pages": pages,
+    }
+
+
+def supersedes(index: dict[str, Any], current: dict[str, Any]) -> bool:
+    """Whether index may replace the stored current one: publications of
+    one expected_content finish out of order across shards, and an older
+    one must not displace a newer one's pages."""
+    def order(i: dict[str, Any]) -> tuple[str, str]:
+        return i.get("created_at", ""), i.get("request_id", "")
+    return order(index) >= order(current)
+
+
+def reuse_records(
+    index: dict[str, Any],
+    matches: dict[int, int],
+) -> list[dict[str, Any]]:
+    """Copy the prior records of matched pages, re-tagged with current pages."""
+    prior_pages = {p["page"]: p for p in index.get("pages", [])}
+    reused = []
+    for page, prior_page in sorted(matches.items()):
+        for record in prior_pages[prior_page].get("records", []):
+            reused.append({**record, "_page": page})
+    return reused
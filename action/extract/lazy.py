@@ -0,0 +1,37 @@
+"""Deferred imports of heavy dependencies.
+
+anthropic, boto3, PyMuPDF and Pillow together take seconds to import, and
+every matrix job, listing step and webhook starts a cold interpreter, most
+of them needing one of these or none. lazy_import returns a stand-in
+module that imports the real one on first attribute access, so a module can
+keep `anthropic.Anthropic(...)` call sites (and tests patching
+`extract.ai_extract.anthropic.Anthropic`) while paying for the import only
+when it runs.
+"""
+
+import sys
+import importlib
+import importlib.util
+from types import ModuleType
+
+
+class LazyModule(ModuleType):
+    """Stands in for a module until one of its attributes is read."""
+
+    def __getattr__(self, attr: str):
+        # import_module is thread-safe and, once loaded, a sys.modules lookup
+        return getattr(importlib.import_module(self.__name__), attr)
+
+    def __repr__(self) -> str:
+        loaded = "loaded" if self.__name__ in sys.modules else "not loaded"
+        return f"<lazy module {self.__name__!r} ({loaded})>"
+
+
+def lazy_import(name: str) -> ModuleType:
+    """The module if already imported, else a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def available(name: str) -> bool:
+    """Whether a top-level module can be imported, without importing it."""
+    return name in sys.modules or importlib.util.find_spec(name) is not None
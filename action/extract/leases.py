@@ -0,0 +1,238 @@
+"""Leased work queue over R2 for the long-running extraction service mode.
+
+Instead of one static request per matrix job, N workers claim pending
+requests through lease objects under pipeline/leases/:
+- a worker claims a request by creating its lease with a conditional put
+  (If-None-Match: *), so exactly one worker wins
+- while working it renews the lease (If-Match: <etag>) every ttl/3 seconds
+- on completion the result exists in pipeline/extracted/ and the lease is
+  released: overwritten as expired (If-Match: <etag>), never deleted, so a
+  lease another worker has taken over in the meantime stays intact. A
+  request whose result appeared between listing and claiming (another
+  worker just finished it) is released and skipped
+- a worker whose renewal fails has lost the lease: process is told through
+  its lost event and must not write a result
+- a lease whose expires_at has passed (crashed worker, or released) is
+  taken over with a conditional put against that lease's ETag
+- a request whose processing fails writes no result until its last
+  attempt (MAX_ATTEMPTS): its attempt count is kept under
+  pipeline/attempts/ and it is claimed again after RETRY_DELAY seconds
+
+The store is any object exposing list_keys, object_exists,
+get_json_with_etag, put_json_conditional and delete_object — the r2_client
+module in production, an in-memory stand-in in tests.
+"""
+
+import os
+import time
+import random
+import threading
+from typing import Any, Callable, Optional
+
+from . import r2_client
+
+REQUEST_PREFIX = "pipeline/extraction-requests/"
+RESULT_PREFIX = "pipeline/extracted/"
+LEASE_PREFIX = "pipeline/leases/"
+ATTEMPT_PREFIX = "pipeline/attempts/"
+
+DEFAULT_LEASE_TTL = 600
+DEFAULT_IDLE_POLLS = 3
+DEFAULT_POLL_INTERVAL = 30
+MAX_ATTEMPTS = int(os.environ.get("EXTRACT_MAX_ATTEMPTS", "3"))
+RETRY_DELAY = float(os.environ.get("EXTRACT_RETRY_DELAY", "300"))
+
+
+def lease_key(request_id: str) -> str:
+    return f"{LEASE_PREFIX}{request_id}.json"
+
+
+def attempt_key(request_id: str) -> str:
+    return f"{ATTEMPT_PREFIX}{request_id}.json"
+
+def result_key(request_id: str) -> str:
+    return f"{RESULT_PREFIX}{request_id}-result.json"
+
+
+def _lease_body(request_id: str, owner: str, ttl: float) -> dict[str, Any]:
+    return {"request_id": request_id, "owner": owner, "expires_at": time.time() + ttl}
+
+
+def acquire_lease(store, request_id: str, owner: str, ttl: float) -> Optional[dict[str, Any]]:
+    """Claim a request. Returns the lease, or None if someone else holds it."""
+    key = lease_key(request_id)
+    body = _lease_body(request_id, owner, ttl)
+
+    etag = store.put_json_conditional(key, body)
+    if etag is None:
+        existing = store.get_json_with_etag(key)
+        if existing is None:
+            # Released between our put and read; try once more
+            etag = store.put_json_conditional(key, body)
+        else:
+            current, current_etag = existing
+            if current.get("expires_at", 0) > time.time():
+                return None
+            if not current.get("released"):
+                print(f"Lease for {request_id} held by {current.get('owner')} expired, taking over")
+            etag = store.put_json_conditional(key, body, if_match=current_etag)
+
+    if etag is None:
+        return None
+    return {"key": key, "etag": etag, **body}
+
+
+def renew_lease(store, lease: dict[str, Any], ttl: float) -> bool:
+    """Extend a lease in place. Returns False if it was lost to another worker."""
+    body = _lease_body(lease["request_id"], lease["owner"], ttl)
+    etag = store.put_json_conditional(lease["key"], body, if_match=lease["etag"])
+    if etag is None:
+        return False
+    lease.update(body, etag=etag)
+    return True
+
+
+def release_lease(store, lease: dict[str, Any]) -> None:
+    """Expire a lease if it is still ours (a no-op once taken over)."""
+    body = {"request_id": lease["request_id"], "owner": lease["owner"], "expires_at": 0, "released": True}
+    store.put_json_conditional(lease["key"], body, if_match=lease["etag"])
+
+
+def finished_request_ids(store) -> set[str]:
+    """Request IDs that have a result (success or failure)."""
+    return {
+        key[len(RESULT_PREFIX):-len("-result.json")]
+        for key in store.list_keys(RESULT_PREFIX)
+        if key.endswith("-result.json")
+    }
+
+
+def pending_request_ids(store) -> list[str]:
+    """Request IDs that have no result yet and are not waiting out a retry
+    delay after a failed attempt."""
+    done = finished_request_ids(store)
+    now = time.time()
+    for key in store.list_keys(ATTEMPT_PREFIX):
+        existing = store.get_json_with_etag(key)
+        if existing is not None and existing[0].get("retry_after", 0) > now:
+            done.add(key[len(ATTEMPT_PREFIX):-len(".json")])
+    return [
+        key[len(REQUEST_PREFIX):-len(".json")]
+        for key in store.list_keys(REQUEST_PREFIX)
+        if key.endswith(".json") and key[len(REQUEST_PREFIX):-len(".json")] not in done
+    ]
+
+
+def claim_next(store, owner: str, ttl: float) -> Optional[dict[str, Any]]:
+    """Claim any pending request. Candidates are shuffled so workers spread out."""
+    candidates = pending_request_ids(store)
+    random.shuffle(candidates)
+    for request_id in candidates:
+        lease = acquire_lease(store, request_id, owner, ttl)
+        if not lease:
+            continue
+        # The listing is stale by now: another worker may have finished this
+        # request and released its lease in between
+        if store.object_exists(result_key(request_id)):
+            release_lease(store, lease)
+            continue
+        return lease
+    return None
+
+
+def _record_failure(store, request_id: str, attempts: Optional[tuple[dict[str, Any], str]]) -> int:
+    """Count a failed attempt; returns the number of attempts so far."""
+    count = (attempts[0].get("attempts", 0) if attempts else 0) + 1
+    body = {"request_id": request_id, "attempts": count, "retry_after": time.time() + RETRY_DELAY}
+    store.put_json_conditional(attempt_key(request_id), body, if_match=attempts[1] if attempts else None)
+    return count
+
+
+def _heartbeat(store, lease: dict[str, Any], ttl: float, stop: threading.Event, lost: threading.Event) -> None:
+    while not stop.wait(ttl / 3):
+        if not renew_lease(store, lease, ttl):
+            print(f"[{lease['owner']}] Lost lease for {lease['request_id']}")
+            lost.set()
+            return
+
+
+def worker_loop(
+    store,
+    owner: str,
+    process: Callable[[str, threading.Event, bool], bool],
+    ttl: float = DEFAULT_LEASE_TTL,
+    idle_polls: int = DEFAULT_IDLE_POLLS,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    max_attempts: int = MAX_ATTEMPTS,
+) -> int:
+    """Claim and process requests until the queue stays empty for idle_polls
+    consecutive polls. Returns the number of requests processed.
+
+    process(request_id, lost, last_attempt) returns whether it succeeded.
+    lost is set once the lease is lost to another worker; process should
+    then stop and skip writing a result. A failed attempt other than the
+    last should write no result either, so the request is claimed again."""
+    processed = 0
+    idle = 0
+
+    while idle < idle_polls:
+        lease = claim_next(store, owner, ttl)
+        if lease is None:
+            idle += 1
+            if idle < idle_polls:
+                time.sleep(poll_interval)
+            continue
+
+        idle = 0
+        request_id = lease["request_id"]
+        attempts = store.get_json_with_etag(attempt_key(request_id))
+        attempt = (attempts[0].get("attempts", 0) if attempts else 0) + 1
+        print(f"[{owner}] Claimed {request_id} (attempt {attempt}/{max_attempts})")
+        stop = threading.Event()
+        lost = threading.Event()
+        beat = threading.Thread(target=_heartbeat, args=(store, lease, ttl, stop, lost), daemon=True)
+        beat.start()
+        try:
+            ok = process(request_id, lost, attempt >= max_attempts)
+            if not lost.is_set():
+                if ok or attempt >= max_attempts:
+                    processed += 1
+                    if attempts:
+                        store.delete_object(attempt_key(request_id))
+                else:
+                    _record_failure(store, request_id, attempts)
+                    print(f"[{owner}] {request_id} failed, retrying after {RETRY_DELAY:.0f}s")
+        finally:
+            stop.set()
+            beat.join()
+            if not lost.is_set():
+                release_lease(store, lease)
+
+    print(f"[{owner}] Queue idle, exiting after {processed} requests")
+    return processed
+
+
+def serve(
+    process: Callable[[str, threading.Event, bool], bool],
+    workers: int,
+    store=r2_client,
+    ttl: float = DEFAULT_LEASE_TTL,
+    idle_polls: int = DEFAULT_IDLE_POLLS,
+    poll_interval: float = DEFAULT_POLL_INTERVAL,
+    owner_prefix: str = "worker",
+) -> int:
+    """Run N worker threads against the leased queue. Returns total processed."""
+    counts = [0] * workers
+
+    def run(i: int) -> None:
+        counts[i] = worker_loop(
+            store, f"{owner_prefix}-{i}", process, ttl, idle_polls, poll_interval
+        )
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    return sum(counts)
@@ -1,116 +1,546 @@
-"""Main entry point for PDF extraction matrix job.
+"""Main entry point for PDF extraction.
 
-Each job processes one extraction request:
+Matrix mode (default) processes the request named by REQUEST_ID, or each
+request of a planned shard named by REQUEST_IDS (comma-separated, see
+planner.py) in turn.
+Service mode (--serve, or EXTRACT_MODE=serve) runs EXTRACT_WORKERS workers
+that claim pending requests from R2 through leases until the queue is
+drained; see leases.py.
+With EXTRACTION_GROUPING=1, matrix mode extracts the requests of a shard
+that share a publication_id together: one model call per cascade tier for
+all their files, split back into one result per request (run_publication).
+
+Each request is processed as follows:
 1. Read request from R2
-2. Download PDF from R2
-3. Convert PDF to images
-4. Send images to AI for extraction
-5. Validate output
-6. Write result to R2
+2. Download PDF from R2; if a file with the same SHA-256 and schema was
+   already extracted, reuse its records for this publication (dedup.py)
+3. Fingerprint pages and reuse records of pages unchanged since the prior
+   publication with the same expected_content
+4. Run the extraction cascade (text layer, fast model, full vision model)
+   on the remaining pages, validating each tier and escalating on doubt
+5. Check each index series across periods (consistency.py) and re-extract
+   only the pages whose records break it, with the strongest tier
+6. Write result and the updated fingerprint and content indexes to R2
+
+Set TRACE_FILE to write a span trace of the run (see tracing.py).
 """
 
 import os
 import sys
 import tempfile
+import threading
 from datetime import datetime, timezone
+from typing import Any, Optional
 
-from .r2_client import read_request, download_pdf, write_result
-from .pdf_to_images import pdf_to_images
-from .ai_extract import extract_data_from_images
+from ..tracing import span, configure_from_env
+from .r2_client import (
+    read_request,
+    download_pdf,
+    write_result,
+    read_fingerprint_index,
+    write_fingerprint_index,
+    write_content_index,
+)
+from . import r2_client
+from .cascade import run_cascade, run_group_cascade, strongest_tier, extraction_method
+from .consistency import check_consistency, flagged_pages
 from .validate import validate_extraction
+from .leases import serve, DEFAULT_LEASE_TTL
+from .planner import grouping_enabled
+from .dedup import (
+    dedup_enabled,
+    file_sha256,
+    claim_content,
+    release_content_claim,
+    reusable,
+    fan_out,
+    content_entry,
+)
+from .fingerprints import (
+    page_fingerprints,
+    match_pages,
+    reuse_records,
+    records_by_page,
+    build_index,
+)
 
 
-def main():
-    request_id = os.environ.get("REQUEST_ID")
-    if not request_id:
-        print("ERROR: REQUEST_ID environment variable not set")
-        sys.exit(1)
+def incremental_enabled() -> bool:
+    return os.environ.get("INCREMENTAL_EXTRACTION", "1") != "0"
+
+
+def consistency_enabled() -> bool:
+    return os.environ.get("CONSISTENCY_CHECKS", "1") != "0"
+
+
+def run_request(
+    request_id: str,
+    request: Optional[dict[str, Any]] = None,
+    lost: Optional[threading.Event] = None,
+    write_failures: bool = True,
+) -> bool:
+    """Process one extraction request end to end.
+
+    Always writes a result (a failure result on error), unless lost is set
+    (service mode: the lease passed to another worker) or write_failures is
+    False (service mode: the request will be retried). Returns True on
+    success.
+    """
+    with span("extract.request", request_id=request_id) as attrs:
+        attrs["success"] = ok = _run_request(request_id, request, lost, write_failures)
+        return ok
+
 
+def serve_request(request_id: str, lost: threading.Event, last_attempt: bool) -> bool:
+    """run_request as called by the leased queue in service mode: a failure
+    result is only written on the request's last attempt."""
+    return run_request(request_id, lost=lost, write_failures=last_attempt)
+
+
+def _lease_lost(request_id: str, lost: Optional[threading.Event]) -> bool:
+    if lost is not None and lost.is_set():
+        print(f"Lease on {request_id} lost to another worker, not writing a result")
+        return True
+    return False
+
+
+def _run_request(
+    request_id: str,
+    request: Optional[dict[str, Any]],
+    lost: Optional[threading.Event] = None,
+    write_failures: bool = True,
+) -> bool:
     print(f"Processing extraction request: {request_id}")
 
+    job = None
     try:
-        # 1. Read request
-        request = read_request(request_id)
-        print(f"Request: source={request['source']}, file={request['file']['r2_key']}")
-
-        # 2. Download PDF
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
-            pdf_path = tmp.name
-        download_pdf(request["file"]["r2_key"], pdf_path)
-        print(f"Downloaded PDF to {pdf_path}")
-
-        # 3. Convert to images
-        image_paths = pdf_to_images(pdf_path)
-        print(f"Converted to {len(image_paths)} images")
-
-        # 4. AI extraction
-        ai_result = extract_data_from_images(
-            image_paths,
-            request["extraction_schema"],
-            request["file"]["expected_content"],
-        )
-        raw_data = ai_result.get("data", [])
-        confidence = ai_result.get("confidence", 0.0)
-        print(f"AI extracted {len(raw_data)} records (confidence: {confidence})")
+        job = _prepare(request_id, request, lost)
+        if job is None:
+            return True
+        if _lease_lost(request_id, lost):
+            _release_claim(job)
+            os.unlink(job["pdf_path"])
+            return False
 
-        # 5. Validate
-        valid_data, validation_errors = validate_extraction(
-            raw_data, request["extraction_schema"]
-        )
-        if validation_errors:
-            print(f"Validation: {len(valid_data)} valid, {len(validation_errors)} errors")
-            for err in validation_errors[:5]:
-                print(f"  - {err}")
-
-        # 6. Determine status
-        if len(valid_data) == 0 and len(raw_data) > 0:
-            status = "extraction_failed"
-        elif len(valid_data) < len(raw_data):
-            status = "partial"
-        elif len(valid_data) > 0:
-            status = "success"
+        # 4. Cascade: extract and validate changed pages, escalating tiers on doubt
+        if _all_reused(job):
+            outcome = _page_reuse_outcome(job)
         else:
-            status = "extraction_failed"
+            outcome = run_cascade(
+                job["pdf_path"],
+                job["request"]["extraction_schema"],
+                job["expected_content"],
+                pages=_cascade_pages(job),
+            )
+        _finish(job, outcome, lost=lost)
 
-        # Add publication and file references to each record
-        for record in valid_data:
-            record["publication_id"] = request["publication_id"]
-            record["file_id"] = f"{request['publication_id']}:{os.path.basename(request['file']['r2_key'])}"
+    except Exception as e:
+        if job is not None:
+            _release_claim(job)
+        if write_failures:
+            _write_failure(request_id, e, lost)
+        else:
+            print(f"ERROR: {e} (will retry)")
+        return False
 
-        # 7. Write result
-        result = {
-            "request_id": request_id,
-            "status": status,
-            "data": valid_data,
-            "confidence": confidence,
-            "extraction_method": "pdf2image+claude_vision",
-            "pages_processed": len(image_paths),
-            "processed_at": datetime.now(timezone.utc).isoformat(),
-        }
+    return True
 
-        if status == "extraction_failed":
-            result["error_details"] = "; ".join(validation_errors[:10])
 
-        write_result(request_id, result)
-        print(f"Result written: status={status}, records={len(valid_data)}")
+def _prepare(
+    request_id: str,
+    request: Optional[dict[str, Any]] = None,
+    lost: Optional[threading.Event] = None,
+) -> Optional[dict[str, Any]]:
+    """Steps 1-3: read the request (unless given), download and fingerprint
+    its PDF. Returns None when the request was finished by reusing an
+    identical file's extraction, else the job for the cascade."""
+    # 1. Read request
+    if request is None:
+        request = read_request(request_id)
+    print(f"Request: source={request['source']}, file={request['file']['r2_key']}")
 
-        # Clean up
-        os.unlink(pdf_path)
-        for p in image_paths:
-            os.unlink(p)
+    # 2. Download PDF
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        pdf_path = tmp.name
+    download_pdf(request["file"]["r2_key"], pdf_path)
+    print(f"Downloaded PDF to {pdf_path}")
 
-    except Exception as e:
-        print(f"ERROR: {e}")
-        # Write failure result
+    # Reuse the extraction of an identical file
+    sha256 = file_sha256(pdf_path)
+    file_id = f"{request['publication_id']}:{os.path.basename(request['file']['r2_key'])}"
+    # Claim the file so an identical copy in another shard or pool worker
+    # waits for this extraction instead of repeating it
+    claim, indexed = None, None
+    if dedup_enabled():
+        state, value = claim_content(r2_client, sha256, request_id)
+        if state == "claimed":
+            claim = value
+        elif state == "indexed":
+            indexed = value
+    if reusable(indexed, request):
+        data = fan_out(indexed, request, file_id)
+        os.unlink(pdf_path)
+        if _lease_lost(request_id, lost):
+            return None
         write_result(request_id, {
             "request_id": request_id,
-            "status": "extraction_failed",
-            "data": [],
-            "confidence": 0.0,
-            "extraction_method": "pdf2image+claude_vision",
+            "status": "success",
+            "data": data,
+            "confidence": indexed["confidence"],
+            "extraction_method": "dedup/sha256",
+            "pages_processed": 0,
+            "content_sha256": sha256,
+            "duplicate_of": indexed["request_id"],
             "processed_at": datetime.now(timezone.utc).isoformat(),
-            "error_details": str(e),
         })
+        print(f"Identical file already extracted by {indexed['request_id']}: reused {len(data)} records")
+        return None
+
+    # 3. Fingerprint pages and reuse unchanged ones
+    expected_content = request["file"]["expected_content"]
+    fingerprints, prior_index, matches, reused = [], None, {}, []
+    if incremental_enabled():
+        try:
+            fingerprints = page_fingerprints(pdf_path)
+        except Exception:
+            if claim:
+                release_content_claim(r2_client, sha256, request_id, claim)
+            raise
+        prior_index = read_fingerprint_index(expected_content)
+        matches = match_pages(fingerprints, prior_index["pages"]) if prior_index else {}
+        reused = reuse_records(prior_index, matches) if matches else []
+    all_pages = [fp["page"] for fp in fingerprints]
+    changed_pages = [p for p in all_pages if p not in matches]
+    if fingerprints:
+        print(f"Pages: {len(all_pages)} total, {len(matches)} unchanged, {len(changed_pages)} to extract")
+
+    return {
+        "request_id": request_id,
+        "request": request,
+        "pdf_path": pdf_path,
+        "sha256": sha256,
+        "content_claim": claim,
+        "file_id": file_id,
+        "expected_content": expected_content,
+        "fingerprints": fingerprints,
+        "all_pages": all_pages,
+        "prior_index": prior_index,
+        "matches": matches,
+        "reused": reused,
+        "changed_pages": changed_pages,
+    }
+
+
+def _cascade_pages(job: dict[str, Any]) -> Optional[list[int]]:
+    return job["changed_pages"] if job["matches"] else None
+
+
+def _all_reused(job: dict[str, Any]) -> bool:
+    """Every page matched the prior publication (never without fingerprints)."""
+    return bool(job["fingerprints"]) and not job["changed_pages"]
+
+
+def _page_reuse_outcome(job: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "data": [],
+        "raw_count": 0,
+        "errors": [],
+        "confidence": job["prior_index"].get("confidence", 0.0),
+        "extraction_method": "page_reuse",
+        "pages_processed": 0,
+        "image_paths": [],
+    }
+
+
+def _recheck_series(job: dict[str, Any], outcome: dict[str, Any]) -> dict[str, Any]:
+    """Step 5: re-extract the pages extracted in this run whose records are
+    inconsistent with their series, with the strongest tier, replacing
+    those pages' records. Returns the outcome with the 'consistency_flags'
+    still raised afterwards."""
+    schema = job["request"]["extraction_schema"]
+    flags = check_consistency(job["reused"] + outcome["data"], schema)
+    pages = [p for p in flagged_pages(flags) if p not in job["matches"]]
+    tier = strongest_tier(schema.get("type", ""))
+    if pages and outcome["extraction_method"] != extraction_method(tier):
+        print(f"Consistency: {len(flags)} flags, re-extracting pages {pages} with {tier}")
+        redo = run_cascade(
+            job["pdf_path"], schema, job["expected_content"], pages=pages, tiers=[tier]
+        )
+        if redo["data"]:
+            # Re-validate the merged raw records, so the counts and errors of
+            # the replaced pages' first reading are dropped with their records
+            raw_data = [r for r in outcome["raw_data"] if r.get("_page") not in pages] + redo["raw_data"]
+            data, errors = validate_extraction(raw_data, schema)
+            outcome = {
+                **outcome,
+                "data": data,
+                "raw_data": raw_data,
+                "raw_count": len(raw_data),
+                "errors": errors,
+                "pages_processed": outcome["pages_processed"] + redo["pages_processed"],
+                "image_paths": outcome["image_paths"] + redo["image_paths"],
+                "reextracted_pages": pages,
+            }
+        else:
+            outcome = {**outcome, "image_paths": outcome["image_paths"] + redo["image_paths"]}
+        flags = check_consistency(job["reused"] + outcome["data"], schema)
+    if flags:
+        print(f"Consistency: {len(flags)} flags remain")
+    return {**outcome, "consistency_flags": flags}
+
+
+def _finish(
+    job: dict[str, Any],
+    outcome: dict[str, Any],
+    grouped_with: Optional[list[str]] = None,
+    lost: Optional[threading.Event] = None,
+) -> None:
+    """Steps 5-6: check series consistency, merge reused and extracted
+    records, write the result and the content and fingerprint indexes, and
+    clean up. Nothing is written once lost is set."""
+    if consistency_enabled():
+        outcome = _recheck_series(job, outcome)
+    request_id = job["request_id"]
+    request = job["request"]
+    reused = job["reused"]
+    image_paths = outcome["image_paths"]
+    valid_data = sorted(reused + outcome["data"], key=lambda r: r.get("_page") or 0)
+    raw_count = len(reused) + outcome["raw_count"]
+    validation_errors = outcome["errors"]
+    confidence = outcome["confidence"]
+    print(f"Extracted {outcome['raw_count']} records via {outcome['extraction_method']} "
+          f"(confidence: {confidence}), reused {len(reused)}")
+
+    if validation_errors:
+        print(f"Validation: {len(valid_data)} valid, {len(validation_errors)} errors")
+        for err in validation_errors[:5]:
+            print(f"  - {err}")
+
+    # Determine status
+    if len(valid_data) == 0 and raw_count > 0:
+        status = "extraction_failed"
+    elif len(valid_data) < raw_count:
+        status = "partial"
+    elif len(valid_data) > 0:
+        status = "success"
+    else:
+        status = "extraction_failed"
+
+    # Add publication and file references to each record
+    for record in valid_data:
+        record["publication_id"] = request["publication_id"]
+        record["file_id"] = job["file_id"]
+    # The '_page' tags are only kept for the fingerprint index
+    page_records = records_by_page(valid_data, job["all_pages"]) if job["fingerprints"] else None
+    data = [{k: v for k, v in r.items() if k != "_page"} for r in valid_data]
+
+    # 6. Write result and fingerprint index
+    result = {
+        "request_id": request_id,
+        "status": status,
+        "data": data,
+        "confidence": confidence,
+        "extraction_method": outcome["extraction_method"],
+        "pages_processed": outcome["pages_processed"],
+        "pages_reused": len(job["matches"]),
+        "page_fingerprints": job["fingerprints"],
+        "content_sha256": job["sha256"],
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    if grouped_with:
+        result["grouped_with"] = grouped_with
+    if outcome.get("reextracted_pages"):
+        result["reextracted_pages"] = outcome["reextracted_pages"]
+    consistent = not outcome.get("consistency_flags")
+    if not consistent:
+        result["consistency_flags"] = [
+            {k: v for k, v in f.items() if k != "record"} for f in outcome["consistency_flags"]
+        ]
+
+    if status == "extraction_failed":
+        result["error_details"] = "; ".join(validation_errors[:10])
+
+    if _lease_lost(request_id, lost):
+        _release_claim(job)
+        _clean_up(job["pdf_path"], image_paths)
+        return
+    write_result(request_id, result)
+    print(f"Result written: status={status}, records={len(valid_data)}")
+
+    # Only a clean result is safe to reuse for identical files or, fully
+    # page-tagged, next month
+    if status == "success" and consistent and dedup_enabled():
+        write_content_index(job["sha256"], content_entry(request, result))
+        job["content_claim"] = None
+    _release_claim(job)
+
+    if status == "success" and consistent and page_records is not None:
+        index = build_index(request, job["fingerprints"], page_records, confidence)
+        write_fingerprint_index(job["expected_content"], index)
+
+    _clean_up(job["pdf_path"], image_paths)
+
+
+def _release_claim(job: dict[str, Any]) -> None:
+    """Let identical copies be extracted again when this request records
+    no reusable result (the content index entry replaces the claim)."""
+    if job.get("content_claim"):
+        release_content_claim(r2_client, job["sha256"], job["request_id"], job["content_claim"])
+        job["content_claim"] = None
+
+
+def _clean_up(pdf_path: str, image_paths: list[str]) -> None:
+    os.unlink(pdf_path)
+    for p in image_paths:
+        os.unlink(p)
+
+
+def _write_failure(request_id: str, error: Exception, lost: Optional[threading.Event] = None) -> None:
+    print(f"ERROR: {error}")
+    if _lease_lost(request_id, lost):
+        return
+    write_result(request_id, {
+        "request_id": request_id,
+        "status": "extraction_failed",
+        "data": [],
+        "confidence": 0.0,
+        "extraction_method": "cascade",
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+        "error_details": str(error),
+    })
+
+
+def file_labels(jobs: list[dict[str, Any]]) -> list[str]:
+    """Unique file-marker labels for jobs (PDF name, numbered on a clash)."""
+    labels: list[str] = []
+    for job in jobs:
+        name = os.path.basename(job["request"]["file"]["r2_key"])
+        label, n = name, 2
+        while label in labels:
+            label, n = f"{name}#{n}", n + 1
+        labels.append(label)
+    return labels
+
+
+def run_publication(requests: list[dict[str, Any]]) -> list[str]:
+    """Process the requests of one publication with one model call per
+    cascade tier (see cascade.run_group_cascade).
+
+    Requests finished by file reuse, or with no changed pages, complete on
+    their own; the rest are extracted together per schema type and split
+    back into per-request results. If a grouped cascade fails, its requests
+    are extracted one by one. Returns the IDs of failed requests.
+    """
+    failed: list[str] = []
+    pending: dict[str, list[dict[str, Any]]] = {}
+
+    for request in requests:
+        request_id = request["request_id"]
+        print(f"Processing extraction request: {request_id} (publication {request['publication_id']})")
+        job = None
+        try:
+            job = _prepare(request_id, request)
+            if job is None:
+                continue
+            if _all_reused(job):
+                _finish(job, _page_reuse_outcome(job))
+                continue
+            pending.setdefault(request["extraction_schema"]["type"], []).append(job)
+        except Exception as e:
+            if job is not None:
+                _release_claim(job)
+            _write_failure(request_id, e)
+            failed.append(request_id)
+
+    for jobs in pending.values():
+        labels = file_labels(jobs)
+        request_ids = [job["request_id"] for job in jobs]
+        outcomes: Optional[dict[str, dict[str, Any]]] = None
+        if len(jobs) > 1:
+            files = [
+                {"label": label, "pdf_path": job["pdf_path"], "pages": _cascade_pages(job)}
+                for label, job in zip(labels, jobs)
+            ]
+            expected_content = "; ".join(dict.fromkeys(job["expected_content"] for job in jobs))
+            print(f"Extracting {len(jobs)} files of {jobs[0]['request']['publication_id']} together")
+            try:
+                with span("extract.group", requests=len(jobs)):
+                    outcomes = run_group_cascade(files, jobs[0]["request"]["extraction_schema"], expected_content)
+            except Exception as e:
+                print(f"Grouped extraction failed ({e}); extracting files one by one")
+
+        for label, job in zip(labels, jobs):
+            try:
+                if outcomes is not None:
+                    others = [r for r in request_ids if r != job["request_id"]]
+                    _finish(job, outcomes[label], grouped_with=others)
+                    continue
+                outcome = run_cascade(
+                    job["pdf_path"],
+                    job["request"]["extraction_schema"],
+                    job["expected_content"],
+                    pages=_cascade_pages(job),
+                )
+                _finish(job, outcome)
+            except Exception as e:
+                _release_claim(job)
+                _write_failure(job["request_id"], e)
+                failed.append(job["request_id"])
+
+    return failed
+
+
+def run_grouped(request_ids: list[str]) -> list[str]:
+    """Matrix mode with EXTRACTION_GROUPING=1: requests of a shard sharing a
+    publication_id run together (run_publication), in order of each
+    publication's first request. Returns the IDs of failed requests."""
+    publications: dict[str, list[dict[str, Any]]] = {}
+    failed: list[str] = []
+    for request_id in request_ids:
+        try:
+            request = read_request(request_id)
+        except Exception as e:
+            _write_failure(request_id, e)
+            failed.append(request_id)
+            continue
+        publications.setdefault(request["publication_id"], []).append(
+            {**request, "request_id": request_id}
+        )
+
+    for publication_id, requests in publications.items():
+        if len(requests) == 1:
+            if not run_request(requests[0]["request_id"], requests[0]):
+                failed.append(requests[0]["request_id"])
+            continue
+        with span("extract.publication", publication_id=publication_id, requests=len(requests)):
+            failed.extend(run_publication(requests))
+    return failed
+
+
+def main():
+    configure_from_env()
+
+    if "--serve" in sys.argv[1:] or os.environ.get("EXTRACT_MODE") == "serve":
+        workers = int(os.environ.get("EXTRACT_WORKERS", "4"))
+        ttl = float(os.environ.get("LEASE_TTL_SECONDS", DEFAULT_LEASE_TTL))
+        print(f"Starting extraction service: {workers} workers, lease TTL {ttl}s")
+        processed = serve(serve_request, workers, ttl=ttl)
+        print(f"Extraction service done: {processed} requests processed")
+        return
+
+    request_ids = [r for r in os.environ.get("REQUEST_IDS", "").split(",") if r]
+    if not request_ids and os.environ.get("REQUEST_ID"):
+        request_ids = [os.environ["REQUEST_ID"]]
+    if not request_ids:
+        print("ERROR: REQUEST_ID or REQUEST_IDS environment variable not set")
+        sys.exit(1)
+
+    if grouping_enabled():
+        failed = run_grouped(request_ids)
+    else:
+        failed = [r for r in request_ids if not run_request(r)]
+    if failed:
+        print(f"{len(failed)}/{len(request_ids)} requests failed: {', '.join(failed)}")
         sys.exit(1)
 
 
@@ -1,43 +1,63 @@
 import tempfile
 import os
+import threading
+from typing import Optional
 
-try:
-    import fitz  # PyMuPDF
-    HAS_PYMUPDF = True
-except ImportError:
-    HAS_PYMUPDF = False
+from ..tracing import traced
+from .lazy import lazy_import, available
 
-try:
-    from pdf2image import convert_from_path
-    HAS_PDF2IMAGE = True
-except ImportError:
-    HAS_PDF2IMAGE = False
+# Imported on first render; checking for them does not load them
+HAS_PYMUPDF = available("fitz")
+HAS_PDF2IMAGE = available("pdf2image")
+fitz = lazy_import("fitz")  # PyMuPDF
+
+# PyMuPDF is not thread-safe; service mode runs several workers per process
+_fitz_lock = threading.Lock()
 
 
-def pdf_to_images(pdf_path: str, dpi: int = 300) -> list[str]:
+def renderer() -> str:
+    """Name of the library pdf_to_images renders with."""
+    if HAS_PYMUPDF:
+        return "pymupdf"
+    if HAS_PDF2IMAGE:
+        return "pdf2image"
+    return "none"
+
+
+@traced("pdf_to_images")
+def pdf_to_images(
+    pdf_path: str,
+    dpi: int = 300,
+    pages: Optional[list[int]] = None,
+) -> list[str]:
     """Convert PDF pages to PNG images at specified DPI.
 
     Returns list of image file paths. Uses PyMuPDF if available,
-    falls back to pdf2image (requires poppler).
+    falls back to pdf2image (requires poppler). When pages (1-based page
+    numbers) is given, only those pages are rendered, in that order.
     """
     output_dir = tempfile.mkdtemp(prefix="pdf_images_")
 
     if HAS_PYMUPDF:
-        return _convert_with_pymupdf(pdf_path, output_dir, dpi)
+        with _fitz_lock:
+            return _convert_with_pymupdf(pdf_path, output_dir, dpi, pages)
     elif HAS_PDF2IMAGE:
-        return _convert_with_pdf2image(pdf_path, output_dir, dpi)
+        return _convert_with_pdf2image(pdf_path, output_dir, dpi, pages)
     else:
         raise RuntimeError("No PDF library available. Install PyMuPDF or pdf2image.")
 
 
-def _convert_with_pymupdf(pdf_path: str, output_dir: str, dpi: int) -> list[str]:
+def _convert_with_pymupdf(
+    pdf_path: str, output_dir: str, dpi: int, pages: Optional[list[int]]
+) -> list[str]:
     doc = fitz.open(pdf_path)
     image_paths = []
 
     zoom = dpi / 72  # Default PDF resolution is 72 DPI
     matrix = fitz.Matrix(zoom, zoom)
 
-    for page_num in range(len(doc)):
+    page_nums = [p - 1 for p in pages] if pages else range(len(doc))
+    for page_num in page_nums:
         page = doc[page_num]
         pix = page.get_pixmap(matrix=matrix)
         img_path = os.path.join(output_dir, f"page_{page_num + 1:03d}.png")
@@ -49,14 +69,44 @@ def _convert_with_pymupdf(pdf_path: str, output_dir: str, dpi: int) -> list[str]
     return image_paths
 
 
-def _convert_with_pdf2image(pdf_path: str, output_dir: str, dpi: int) -> list[str]:
-    images = convert_from_path(pdf_path, dpi=dpi, output_folder=output_dir, fmt="png")
+def _convert_with_pdf2image(
+    pdf_path: str, output_dir: str, dpi: int, pages: Optional[list[int]]
+) -> list[str]:
+    from pdf2image import convert_from_path
+
+    if pages:
+        images = [
+            convert_from_path(pdf_path, dpi=dpi, first_page=p, last_page=p, fmt="png")[0]
+            for p in pages
+        ]
+    else:
+        images = convert_from_path(pdf_path, dpi=dpi, output_folder=output_dir, fmt="png")
+    page_nums = pages or list(range(1, len(images) + 1))
     image_paths = []
 
-    for i, img in enumerate(images):
-        img_path = os.path.join(output_dir, f"page_{i + 1:03d}.png")
+    for page_num, img in zip(page_nums, images):
+        img_path = os.path.join(output_dir, f"page_{page_num:03d}.png")
         img.save(img_path, "PNG")
         image_paths.append(img_path)
 
     print(f"Converted {len(image_paths)} pages from {pdf_path}")
     return image_paths
+
+
+@traced("pdf_text_layer")
+def pdf_text_layer(pdf_path: str, pages: Optional[list[int]] = None) -> list[str]:
+    """Return the embedded text layer of each PDF page (or of the given
+    1-based pages, in that order).
+
+    Returns an empty list when PyMuPDF is unavailable (pdf2image cannot
+    read text). Scanned pages come back as empty strings.
+    """
+    if not HAS_PYMUPDF:
+        return []
+
+    with _fitz_lock:
+        doc = fitz.open(pdf_path)
+        page_nums = [p - 1 for p in pages] if pages else range(len(doc))
+        texts = [doc[n].get_text() for n in page_nums]
+        doc.close()
+    return texts
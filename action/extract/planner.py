@@ -0,0 +1,216 @@
+"""Cost-aware shard planner for the extraction matrix.
+
+Estimates each pending request's cost from its PDF's size (an R2 HEAD;
+nothing records page counts, so pages are estimated at BYTES_PER_PAGE) and
+its extraction_schema type, then bin-packs the
+requests into a fixed number of shards with longest-processing-time-first
+(LPT): requests sorted by descending cost, each placed on the currently
+lightest shard. LPT keeps the makespan within 4/3 of optimal.
+
+Requests for byte-identical PDFs (same R2 "checksum" metadata) are packed
+as one unit in one shard: the first is extracted, the rest reuse its
+records (see dedup.py) at DUPLICATE_COST each. With EXTRACTION_GROUPING=1
+the requests of one publication are packed together too, since main.py
+then extracts them in shared model calls; each after the first saves
+GROUPED_SAVING.
+
+Run as the discover-work step:
+    python -m action.extract.planner
+Writes matrix=[{"shard": 0, "request_ids": "req-a,req-b", ...}, ...] and
+has_work to GITHUB_OUTPUT; each matrix job runs main.py with REQUEST_IDS.
+Requests that already have a result (left for the Worker's pickup) are
+not planned again.
+"""
+
+import os
+import json
+import heapq
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+
+from . import r2_client
+from .r2_client import list_extraction_requests, head_object
+from .dedup import dedup_enabled, duplicate_groups
+from .leases import finished_request_ids
+
+DEFAULT_SHARDS = 10
+HEAD_CONCURRENCY = int(os.environ.get("PLANNER_HEAD_CONCURRENCY", "16"))
+
+# Estimated seconds: fixed per-request overhead (download, render setup,
+# model round trip) plus a per-page cost scaled by schema complexity
+BASE_COST = 20.0
+PAGE_COST = 6.0
+SCHEMA_WEIGHTS: dict[str, float] = {
+    "housing_price_index": 0.5,  # usually resolved by the fast cascade tier
+    "avg_apartment_prices": 1.0,
+    "consumer_price_index": 1.0,
+    "review_insights": 1.5,
+}
+# Rough size of a CBS PDF page (text and tables, few images)
+BYTES_PER_PAGE = 80_000
+# Download and hash only: a duplicate reuses the first copy's extraction
+DUPLICATE_COST = 5.0
+# Model round trip and prompt shared with the publication's other files
+GROUPED_SAVING = 10.0
+
+
+def grouping_enabled() -> bool:
+    return os.environ.get("EXTRACTION_GROUPING", "0") == "1"
+
+
+def estimate_pages(size_bytes: int) -> int:
+    """Page count estimated from the PDF's size."""
+    return max(1, round(size_bytes / BYTES_PER_PAGE))
+
+
+def estimate_cost(request: dict[str, Any], pages: int) -> float:
+    schema_type = request.get("extraction_schema", {}).get("type", "")
+    weight = SCHEMA_WEIGHTS.get(schema_type, 1.0)
+    return BASE_COST + PAGE_COST * weight * pages
+
+
+def plan_shards(
+    costs: dict[str, float],
+    shards: int,
+    groups: Optional[list[list[str]]] = None,
+) -> list[dict[str, Any]]:
+    """Bin-pack request costs into at most `shards` shards (LPT).
+
+    groups optionally lists request IDs that must share a shard, in order
+    (copies of one file, files of one publication); a group costs the sum
+    of its requests. Every request must be in exactly one group.
+
+    Returns non-empty shards, heaviest first, each with 'request_ids' and
+    'estimated_cost'. Ties are broken by request ID so plans are stable.
+    """
+    units = groups if groups is not None else [[request_id] for request_id in costs]
+    unit_costs = [(sum(costs[r] for r in g), g) for g in units if g]
+    shards = max(1, min(shards, len(unit_costs)))
+    heap = [(0.0, i) for i in range(shards)]
+    assigned: list[list[str]] = [[] for _ in range(shards)]
+    loads = [0.0] * shards
+
+    for cost, group in sorted(unit_costs, key=lambda u: (-u[0], u[1][0])):
+        load, i = heapq.heappop(heap)
+        assigned[i].extend(group)
+        loads[i] = load + cost
+        heapq.heappush(heap, (loads[i], i))
+
+    plan = [
+        {"request_ids": ids, "estimated_cost": round(loads[i], 1)}
+        for i, ids in enumerate(assigned)
+        if ids
+    ]
+    plan.sort(key=lambda s: -s["estimated_cost"])
+    return plan
+
+
+def merge_groups(*groupings: list[list[str]]) -> list[list[str]]:
+    """Union of groupings of request IDs: requests linked through any group
+    end up in one group. Groups and their members are in ID order."""
+    parent: dict[str, str] = {}
+
+    def find(r: str) -> str:
+        while parent.setdefault(r, r) != r:
+            parent[r] = parent[parent[r]]
+            r = parent[r]
+        return r
+
+    for grouping in groupings:
+        for group in grouping:
+            for r in group[1:]:
+                parent[find(r)] = find(group[0])
+            find(group[0])
+
+    merged: dict[str, list[str]] = {}
+    for r in sorted(parent):
+        merged.setdefault(find(r), []).append(r)
+    return sorted(merged.values())
+
+
+def publication_groups(requests: list[dict[str, Any]]) -> list[list[str]]:
+    """Request IDs grouped by publication_id, in ID order."""
+    groups: dict[str, list[str]] = {}
+    for request in sorted(requests, key=lambda r: r["request_id"]):
+        groups.setdefault(request.get("publication_id") or request["request_id"], []).append(request["request_id"])
+    return sorted(groups.values())
+
+
+def _head(request: dict[str, Any]) -> Optional[dict[str, Any]]:
+    try:
+        return head_object(request["file"]["r2_key"])
+    except Exception as e:
+        print(f"Warning: no R2 metadata for {request['request_id']}: {e}")
+        return None
+
+
+def estimate_costs(
+    requests: list[dict[str, Any]],
+    max_workers: int = HEAD_CONCURRENCY,
+) -> tuple[dict[str, float], dict[str, str]]:
+    """Cost and file checksum of each request, from parallel R2 HEADs."""
+    costs: dict[str, float] = {}
+    checksums: dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        heads = list(pool.map(_head, requests))
+    for request, head in zip(requests, heads):
+        pages = estimate_pages(head["size"]) if head else 1
+        checksums[request["request_id"]] = head["metadata"].get("checksum", "") if head else ""
+        costs[request["request_id"]] = estimate_cost(request, pages)
+    return costs, checksums
+
+
+def main():
+    shards = int(os.environ.get("EXTRACT_SHARDS", DEFAULT_SHARDS))
+    finished = finished_request_ids(r2_client)
+    requests = [
+        r for r in list_extraction_requests(os.environ.get("RUN_ID", ""))
+        if r["request_id"] not in finished
+    ]
+    if finished:
+        print(f"Skipping requests with a result awaiting pickup: {len(finished)}")
+
+    costs, checksums = estimate_costs(requests)
+
+    groupings = []
+    copies: set[str] = set()
+    if dedup_enabled():
+        duplicates = duplicate_groups(checksums)
+        copies = {r for g in duplicates for r in g[1:]}
+        for r in copies:
+            costs[r] = DUPLICATE_COST
+        if copies:
+            print(f"{len(copies)} requests are copies of another request's file")
+        groupings.append(duplicates)
+    if grouping_enabled():
+        publications = publication_groups(requests)
+        for g in publications:
+            for r in g[1:]:
+                if r not in copies:
+                    costs[r] = max(DUPLICATE_COST, costs[r] - GROUPED_SAVING)
+        print(f"{len(publications)} publications across {len(costs)} requests")
+        groupings.append(publications)
+    groups = merge_groups(*groupings) if groupings else None
+    plan = plan_shards(costs, shards, groups) if costs else []
+    matrix = [
+        {
+            "shard": i,
+            "request_ids": ",".join(s["request_ids"]),
+            "estimated_cost": s["estimated_cost"],
+        }
+        for i, s in enumerate(plan)
+    ]
+
+    print(f"Found {len(costs)} extraction requests, planned {len(matrix)} shards")
+    for s in matrix:
+        print(f"  Shard {s['shard']}: ~{s['estimated_cost']}s  {s['request_ids']}")
+
+    github_output = os.environ.get("GITHUB_OUTPUT", "")
+    if github_output:
+        with open(github_output, "a") as f:
+            f.write(f"matrix={json.dumps(matrix)}\n")
+            f.write(f"has_work={'true' if matrix else 'false'}\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
 import os
 import json
-import boto3
-from typing import Any
+import hashlib
+from typing import Any, Optional
+
+from ..tracing import traced
+from .lazy import lazy_import
+from .dedup import content_index_key
+from .fingerprints import supersedes
+
+boto3 = lazy_import("boto3")
+botocore_exceptions = lazy_import("botocore.exceptions")
 
 
 def _get_client():
@@ -19,6 +27,7 @@ def _bucket() -> str:
     return os.environ["R2_BUCKET_NAME"]
 
 
+@traced("r2.list_extraction_requests")
 def list_extraction_requests(run_id: str) -> list[dict[str, Any]]:
     """List all pending extraction requests from R2."""
     client = _get_client()
@@ -45,6 +54,7 @@ def list_extraction_requests(run_id: str) -> list[dict[str, Any]]:
     return requests
 
 
+@traced("r2.read_request")
 def read_request(request_id: str) -> dict[str, Any]:
     """Read a specific extraction request from R2."""
     client = _get_client()
@@ -53,6 +63,15 @@ def read_request(request_id: str) -> dict[str, Any]:
     return json.loads(body)
 
 
+@traced("r2.head_object")
+def head_object(r2_key: str) -> dict[str, Any]:
+    """Return an object's size and custom metadata without downloading it."""
+    client = _get_client()
+    head = client.head_object(Bucket=_bucket(), Key=r2_key)
+    return {"size": head["ContentLength"], "metadata": head.get("Metadata", {})}
+
+
+@traced("r2.download_pdf")
 def download_pdf(r2_key: str, local_path: str) -> str:
     """Download a PDF file from R2 to a local path."""
     client = _get_client()
@@ -60,6 +79,7 @@ def download_pdf(r2_key: str, local_path: str) -> str:
     return local_path
 
 
+@traced("r2.write_result")
 def write_result(request_id: str, result: dict[str, Any]) -> None:
     """Write an extraction result to R2."""
     client = _get_client()
@@ -71,3 +91,121 @@ def write_result(request_id: str, result: dict[str, Any]) -> None:
         ContentType="application/json",
     )
     print(f"Wrote result to R2: {key}")
+
+
+def _fingerprint_key(expected_content: str) -> str:
+    digest = hashlib.sha1(expected_content.encode("utf-8")).hexdigest()[:16]
+    return f"pipeline/fingerprints/{digest}.json"
+
+
+@traced("r2.read_fingerprint_index")
+def read_fingerprint_index(expected_content: str) -> Optional[dict[str, Any]]:
+    """Read the page fingerprint index of the latest publication with this
+    expected_content, or None if there is none yet."""
+    client = _get_client()
+    try:
+        body = client.get_object(
+            Bucket=_bucket(), Key=_fingerprint_key(expected_content)
+        )["Body"].read()
+    except client.exceptions.NoSuchKey:
+        return None
+    return json.loads(body)
+
+
+@traced("r2.write_fingerprint_index")
+def write_fingerprint_index(expected_content: str, index: dict[str, Any]) -> None:
+    """Replace the page fingerprint index for this expected_content, unless
+    it already holds a later publication's. The put is conditional on the
+    ETag read, so a concurrent writer is never silently overwritten."""
+    key = _fingerprint_key(expected_content)
+    while True:
+        existing = get_json_with_etag(key)
+        if existing is not None and not supersedes(index, existing[0]):
+            print(f"Fingerprint index {key} already holds {existing[0].get('request_id')}, keeping it")
+            return
+        if put_json_conditional(key, index, if_match=existing[1] if existing else None) is not None:
+            print(f"Wrote fingerprint index to R2: {key}")
+            return
+
+
+@traced("r2.write_content_index")
+def write_content_index(sha256: str, entry: dict[str, Any]) -> None:
+    """Record the extraction of a file by its SHA-256."""
+    client = _get_client()
+    key = content_index_key(sha256)
+    client.put_object(
+        Bucket=_bucket(),
+        Key=key,
+        Body=json.dumps(entry, ensure_ascii=False),
+        ContentType="application/json",
+    )
+    print(f"Wrote content index to R2: {key}")
+
+
+@traced("r2.list_keys")
+def list_keys(prefix: str) -> list[str]:
+    """List every object key under a prefix (paginated)."""
+    client = _get_client()
+    keys = []
+    for page in client.get_paginator("list_objects_v2").paginate(Bucket=_bucket(), Prefix=prefix):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
+    return keys
+
+
+@traced("r2.object_exists")
+def object_exists(key: str) -> bool:
+    """Whether an object exists (a HEAD request, no body transferred)."""
+    client = _get_client()
+    try:
+        client.head_object(Bucket=_bucket(), Key=key)
+    except botocore_exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
+
+
+@traced("r2.get_json_with_etag")
+def get_json_with_etag(key: str) -> Optional[tuple[dict[str, Any], str]]:
+    """Read a JSON object and its ETag, or None if it does not exist."""
+    client = _get_client()
+    try:
+        obj = client.get_object(Bucket=_bucket(), Key=key)
+    except client.exceptions.NoSuchKey:
+        return None
+    return json.loads(obj["Body"].read()), obj["ETag"]
+
+
+@traced("r2.put_json_conditional")
+def put_json_conditional(
+    key: str,
+    data: dict[str, Any],
+    if_match: Optional[str] = None,
+) -> Optional[str]:
+    """Write a JSON object only if the precondition holds.
+
+    Without if_match the object must not exist yet; with if_match its current
+    ETag must equal it. Returns the new ETag, or None if the precondition
+    failed (another writer got there first).
+    """
+    client = _get_client()
+    condition = {"IfMatch": if_match} if if_match else {"IfNoneMatch": "*"}
+    try:
+        resp = client.put_object(
+            Bucket=_bucket(),
+            Key=key,
+            Body=json.dumps(data),
+            ContentType="application/json",
+            **condition,
+        )
+    except botocore_exceptions.ClientError as e:
+        if e.response["Error"]["Code"] in ("PreconditionFailed", "ConditionalRequestConflict"):
+            return None
+        raise
+    return resp["ETag"]
+
+
+@traced("r2.delete_object")
+def delete_object(key: str) -> None:
+    client = _get_client()
+    client.delete_object(Bucket=_bucket(), Key=key)
@@ -1,6 +1,9 @@
 from typing import Any
 
+from ..tracing import traced
 
+
+@traced("validate_extraction")
 def validate_extraction(
     data: list[dict[str, Any]],
     schema: dict[str, Any],
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The packages are imported as action.* (as in `python -m action.extract.main`)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
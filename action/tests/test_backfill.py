@@ -0,0 +1,126 @@
+"""Tests for the historical backfill command."""
+
+import json
+from unittest.mock import patch
+
+import pytest
+
+from action.discover import backfill as backfill_mod
+
+
+class FakeUploader:
+    """Delivers each submitted batch at once unless its URL is in fail."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.submitted: list[list[dict]] = []
+        self.on_delivered = None
+        self.delivered = 0
+
+    def submit(self, entries):
+        self.submitted.append(entries)
+        ok = [e for e in entries if e["url"] not in self.fail]
+        self.delivered += len(ok)
+        if ok and self.on_delivered:
+            self.on_delivered(ok)
+
+    def close(self):
+        return self.delivered, 0
+
+
+def _folders(section, year, since=None):
+    return [{"Name": f"f{i}", "TimeLastModified": f"{year}-01-01T00:00:00Z"} for i in range(3)]
+
+
+def _files(section, year, folder, signature=None, since=None):
+    return [{
+        "name": f"{folder}.pdf",
+        "server_url": f"/he/{section}/Madad/DocLib/{year}/{folder}/{folder}.pdf",
+        "size": 1,
+        "ext": "pdf",
+    }]
+
+
+@pytest.fixture
+def crawl():
+    known = {"https://www.cbs.gov.il/he/publications/Madad/DocLib/2020/f0/f0.pdf"}
+    with patch.dict("os.environ", {"CBS_KNOWN_URLS_SNAPSHOT": "", "CBS_MANIFEST_SPOOL": ""}), \
+         patch.object(backfill_mod, "known_among", side_effect=lambda base, token, urls: set(urls) & known), \
+         patch.object(backfill_mod, "get_page_items", return_value=[]), \
+         patch.object(backfill_mod, "list_doclib_folder_info", side_effect=_folders), \
+         patch.object(backfill_mod, "fetch_folder_files", side_effect=_files) as fetch, \
+         patch.object(backfill_mod, "save_cache"):
+        yield fetch
+
+
+def _run(tmp_path, uploader, **kwargs):
+    return backfill_mod.backfill(
+        ["publications"], [2020, 2021], "https://worker.test", "t",
+        str(tmp_path / "checkpoint.json"), uploader=uploader, **kwargs,
+    )
+
+
+def test_streams_folders_and_checkpoints(crawl, tmp_path):
+    uploader = FakeUploader()
+    summary = _run(tmp_path, uploader)
+
+    assert summary["folders"] == 6
+    assert summary["new_entries"] == 5  # one URL already known
+    assert summary["complete"]
+    # One submission per listed folder, not one at the end
+    assert len(uploader.submitted) == 6
+    done = json.loads((tmp_path / "checkpoint.json").read_text())["done"]
+    assert len(done) == 6 and "publications/2020/f0" in done
+
+
+def test_resume_skips_done_folders(crawl, tmp_path):
+    _run(tmp_path, FakeUploader())
+    crawl.reset_mock()
+
+    summary = _run(tmp_path, FakeUploader())
+
+    assert summary["skipped"] == 6
+    assert summary["folders"] == 0
+    crawl.assert_not_called()
+
+
+def test_undelivered_folder_is_not_checkpointed(crawl, tmp_path):
+    failing = "https://www.cbs.gov.il/he/publications/Madad/DocLib/2021/f2/f2.pdf"
+    summary = _run(tmp_path, FakeUploader(fail=[failing]))
+
+    assert not summary["complete"]
+    done = json.loads((tmp_path / "checkpoint.json").read_text())["done"]
+    assert "publications/2021/f2" not in done
+    assert len(done) == 5
+
+
+def test_request_budget_defers_remaining_folders(crawl, tmp_path):
+    sent = [0]
+
+    def listing(*args):
+        sent[0] += 1  # one request per folder listing
+        return _files(*args)
+
+    crawl.side_effect = listing
+    with patch.object(backfill_mod, "request_count", side_effect=lambda: sent[0]):
+        summary = _run(tmp_path, FakeUploader(), max_requests=4)
+    assert summary["folders"] == 4
+    assert summary["deferred"] == 2
+    assert not summary["complete"]
+
+    summary = _run(tmp_path, FakeUploader(), max_requests=100)
+    assert summary["folders"] == 2
+    assert summary["complete"]
+
+
+def test_each_folder_is_checked_by_hash_prefix(crawl, tmp_path):
+    _run(tmp_path, FakeUploader())
+    checked = backfill_mod.known_among.call_args_list
+    assert len(checked) == 6
+    assert all(len(c.args[2]) == 1 for c in checked)
+
+
+def test_rejects_unknown_section():
+    env = {"INGEST_WEBHOOK_URL": "https://worker.test", "INGEST_AUTH_TOKEN": "t"}
+    with patch.dict("os.environ", env), pytest.raises(SystemExit):
+        backfill_mod.main(["--from-year", "2020", "--to-year", "2021", "--sections", "nope"])
@@ -0,0 +1,174 @@
+"""Tests for the confidence-driven extraction cascade."""
+
+import json
+from unittest.mock import patch
+
+from action.extract import cascade
+from action.extract.ai_extract import DEFAULT_MODEL, FAST_MODEL
+
+HPI_SCHEMA = {
+    "type": "housing_price_index",
+    "fields": ["period", "index_value", "base_year"],
+}
+GOOD_ROWS = [
+    {"period": "2025-01", "index_value": 150.5, "base_year": 2020},
+    {"period": "2025-02", "index_value": 151.2, "base_year": 2020},
+]
+TEXT_LAYER = ["מדד מחירי דירות " * 20]
+
+
+def test_text_layer_tier_accepted_when_confident():
+    with patch.object(cascade, "pdf_text_layer", return_value=TEXT_LAYER), \
+         patch.object(cascade, "extract_data_from_text",
+                      return_value={"data": GOOD_ROWS, "confidence": 0.95}) as text_mock, \
+         patch.object(cascade, "pdf_to_images") as render_mock, \
+         patch.object(cascade, "extract_data_from_images") as vision_mock:
+        outcome = cascade.run_cascade("doc.pdf", HPI_SCHEMA, "Housing Price Index")
+
+    assert len(outcome["data"]) == 2
+    assert outcome["extraction_method"].startswith("cascade/text_layer")
+    assert text_mock.call_args.kwargs["model"] == FAST_MODEL
+    render_mock.assert_not_called()
+    vision_mock.assert_not_called()
+    assert outcome["image_paths"] == []
+
+
+def test_low_confidence_escalates_to_fast_vision():
+    with patch.object(cascade, "pdf_text_layer", return_value=TEXT_LAYER), \
+         patch.object(cascade, "extract_data_from_text",
+                      return_value={"data": GOOD_ROWS, "confidence": 0.5}), \
+         patch.object(cascade, "pdf_to_images", return_value=["p1.png"]) as render_mock, \
+         patch.object(cascade, "extract_data_from_images",
+                      return_value={"data": GOOD_ROWS, "confidence": 0.9}) as vision_mock, \
+         patch("action.extract.pdf_to_images.HAS_PYMUPDF", True):
+        outcome = cascade.run_cascade("doc.pdf", HPI_SCHEMA, "Housing Price Index")
+
+    assert outcome["extraction_method"] == "cascade/fast_vision:pymupdf@150dpi+" + FAST_MODEL
+    assert render_mock.call_args.kwargs["dpi"] == 150
+    assert vision_mock.call_count == 1
+    assert outcome["image_paths"] == ["p1.png"]
+
+
+def test_validation_failure_escalates_to_full_vision():
+    bad_rows = [{"index_value": 150.5}]  # missing period
+    with patch.object(cascade, "pdf_text_layer", return_value=[""]), \
+         patch.object(cascade, "extract_data_from_text") as text_mock, \
+         patch.object(cascade, "pdf_to_images", side_effect=[["low.png"], ["high.png"]]), \
+         patch.object(cascade, "extract_data_from_images", side_effect=[
+             {"data": bad_rows, "confidence": 0.95},
+             {"data": GOOD_ROWS, "confidence": 0.9},
+         ]) as vision_mock:
+        outcome = cascade.run_cascade("scan.pdf", HPI_SCHEMA, "Housing Price Index")
+
+    # Scanned PDF: text tier skipped without a model call
+    text_mock.assert_not_called()
+    assert vision_mock.call_args.kwargs["model"] == DEFAULT_MODEL
+    assert outcome["extraction_method"].startswith("cascade/full_vision")
+    assert outcome["errors"] == []
+    assert outcome["image_paths"] == ["low.png", "high.png"]
+
+
+def test_last_tier_returned_when_nothing_accepted():
+    with patch.object(cascade, "CASCADE_OVERRIDES", {"housing_price_index": ["full_vision"]}), \
+         patch.object(cascade, "pdf_to_images", return_value=["p1.png"]), \
+         patch.object(cascade, "extract_data_from_images",
+                      return_value={"data": GOOD_ROWS, "confidence": 0.4}):
+        outcome = cascade.run_cascade("doc.pdf", HPI_SCHEMA, "Housing Price Index")
+
+    assert outcome["extraction_method"].startswith("cascade/full_vision")
+    assert outcome["confidence"] == 0.4
+    assert len(outcome["data"]) == 2
+
+
+def test_vision_label_names_the_renderer_used():
+    with patch("action.extract.pdf_to_images.HAS_PYMUPDF", False), \
+         patch("action.extract.pdf_to_images.HAS_PDF2IMAGE", True):
+        assert cascade.extraction_method("full_vision") == "cascade/full_vision:pdf2image@300dpi+" + DEFAULT_MODEL
+
+
+def test_cascade_override_parsed_with_fallback(capsys):
+    assert cascade.load_overrides(json.dumps({"review_insights": ["full_vision"]})) == {"review_insights": ["full_vision"]}
+    assert cascade.load_overrides("{not json") == {}
+    assert cascade.load_overrides('["full_vision"]') == {}
+    assert capsys.readouterr().out.count("ignoring EXTRACTION_CASCADE") == 2
+
+
+def test_cascade_for_unknown_schema_uses_default():
+    assert cascade.cascade_for("something_else") == cascade.DEFAULT_CASCADE
+    assert cascade.cascade_for("housing_price_index")[0] == "text_layer"
+
+
+def test_group_cascade_splits_records_and_escalates_per_file():
+    files = [
+        {"label": "aa2_1.pdf", "pdf_path": "aa2_1.pdf", "pages": None},
+        {"label": "aa2_2.pdf", "pdf_path": "aa2_2.pdf", "pages": [2]},
+    ]
+    text_rows = [
+        {**GOOD_ROWS[0], "_file": "aa2_1.pdf", "_page": 1},
+        {"index_value": 1.0, "_file": "aa2_2.pdf", "_page": 2},  # missing period
+    ]
+    with patch.object(cascade, "pdf_text_layer", return_value=TEXT_LAYER), \
+         patch.object(cascade, "extract_data_from_text",
+                      return_value={"data": text_rows, "confidence": 0.95}) as text_mock, \
+         patch.object(cascade, "pdf_to_images", return_value=["aa2_2-p2.png"]) as render_mock, \
+         patch.object(cascade, "extract_data_from_images",
+                      return_value={"data": [{**GOOD_ROWS[1], "_page": 2}], "confidence": 0.9}) as vision_mock:
+        outcomes = cascade.run_group_cascade(files, HPI_SCHEMA, "Housing Price Index")
+
+    # One call covers both files, each after its own marker label
+    assert text_mock.call_count == 1
+    assert text_mock.call_args.kwargs["file_labels"] == ["aa2_1.pdf", "aa2_2.pdf"]
+    assert text_mock.call_args.kwargs["page_numbers"] == [1, 2]
+
+    first, second = outcomes["aa2_1.pdf"], outcomes["aa2_2.pdf"]
+    assert first["extraction_method"].startswith("cascade/text_layer")
+    assert first["data"] == [{**GOOD_ROWS[0], "_page": 1}]
+    # Only the file that failed validation escalates, alone and without markers
+    assert render_mock.call_args.args == ("aa2_2.pdf",)
+    assert vision_mock.call_args.kwargs["file_labels"] is None
+    assert second["extraction_method"].startswith("cascade/fast_vision")
+    assert second["image_paths"] == ["aa2_2-p2.png"] and first["image_paths"] == []
+
+
+def test_group_records_without_file_tags_rerun_each_file_alone():
+    files = [
+        {"label": "aa2_1.pdf", "pdf_path": "aa2_1.pdf", "pages": None},
+        {"label": "aa2_2.pdf", "pdf_path": "aa2_2.pdf", "pages": None},
+    ]
+    # The grouped reply omits '_file' entirely; the single-file calls are fine
+    with patch.object(cascade, "pdf_text_layer", return_value=TEXT_LAYER), \
+         patch.object(cascade, "extract_data_from_text", side_effect=[
+             {"data": GOOD_ROWS, "confidence": 0.95},
+             {"data": [GOOD_ROWS[0]], "confidence": 0.95},
+             {"data": [GOOD_ROWS[1]], "confidence": 0.92},
+         ]) as text_mock, \
+         patch.object(cascade, "extract_data_from_images") as vision_mock:
+        outcomes = cascade.run_group_cascade(files, HPI_SCHEMA, "Housing Price Index")
+
+    assert text_mock.call_count == 3
+    assert [c.kwargs["file_labels"] for c in text_mock.call_args_list] == [["aa2_1.pdf", "aa2_2.pdf"], None, None]
+    vision_mock.assert_not_called()
+    assert outcomes["aa2_1.pdf"]["data"] == [GOOD_ROWS[0]]
+    assert outcomes["aa2_2.pdf"]["data"] == [GOOD_ROWS[1]]
+    assert outcomes["aa2_2.pdf"]["confidence"] == 0.92
+    assert outcomes["aa2_2.pdf"]["extraction_method"].startswith("cascade/text_layer")
+
+
+def test_group_file_without_records_reruns_alone_at_same_tier():
+    files = [
+        {"label": "aa2_1.pdf", "pdf_path": "aa2_1.pdf", "pages": None},
+        {"label": "aa2_2.pdf", "pdf_path": "aa2_2.pdf", "pages": None},
+    ]
+    with patch.object(cascade, "pdf_text_layer", return_value=TEXT_LAYER), \
+         patch.object(cascade, "extract_data_from_text", side_effect=[
+             {"data": [{**GOOD_ROWS[0], "_file": "aa2_1.pdf"}], "confidence": 0.95},
+             {"data": [GOOD_ROWS[1]], "confidence": 0.95},
+         ]) as text_mock, \
+         patch.object(cascade, "extract_data_from_images") as vision_mock:
+        outcomes = cascade.run_group_cascade(files, HPI_SCHEMA, "Housing Price Index")
+
+    assert text_mock.call_count == 2
+    assert text_mock.call_args.args[0] == TEXT_LAYER
+    assert text_mock.call_args.kwargs["file_labels"] is None
+    vision_mock.assert_not_called()
+    assert outcomes["aa2_2.pdf"]["data"] == [GOOD_ROWS[1]]
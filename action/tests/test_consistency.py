@@ -0,0 +1,88 @@
+"""Tests for cross-period consistency checks on extracted index series."""
+
+from unittest.mock import patch
+
+from action.extract import main as extract_main
+from action.extract.consistency import check_consistency, flagged_pages, period_ordinal
+
+HPI = {"type": "housing_price_index", "fields": ["period", "district", "index_value", "pct_change_monthly"]}
+
+
+def _series(district, start_value, months=36, growth=0.004, page=1):
+    """Monthly records over several years with consistent rounded changes."""
+    records, value = [], start_value
+    for m in range(months):
+        prev, value = value, round(start_value * (1 + growth) ** m, 1)
+        records.append({
+            "period": f"{2022 + m // 12}-{m % 12 + 1:02d}",
+            "district": district,
+            "base_year": 2020,
+            "index_value": value,
+            "pct_change_monthly": round((value / prev - 1) * 100, 1) if m else None,
+            "_page": page + m // 12,
+        })
+    return records
+
+
+def test_period_ordinal_formats():
+    assert period_ordinal("2025-01") == period_ordinal("01/2025") == 2025 * 12
+    assert period_ordinal("2025-13") is None
+    assert period_ordinal("Q1 2025") is None
+
+
+def test_consistent_series_raise_no_flags():
+    records = _series("North", 120.0) + _series("Haifa", 135.0, growth=0.006)
+    assert check_consistency(records, HPI) == []
+    assert check_consistency(records, {"type": "review_insights"}) == []
+
+
+def test_misread_digit_flags_its_series_and_page():
+    north = _series("North", 120.0)
+    haifa = _series("Haifa", 120.0)
+    # 2023-06 in Haifa read as 181.x instead of 131.x: plausible, wrong
+    bad = haifa[17]
+    bad["index_value"] = round(bad["index_value"] + 50, 1)
+    records = north + haifa
+
+    flags = check_consistency(records, HPI)
+
+    assert {f["series"]["district"] for f in flags} == {"Haifa"}
+    jump = [f for f in flags if f["check"] == "jump"]
+    assert [f["period"] for f in jump] == ["2023-06"]  # the spike, not the month after
+    change = [f for f in flags if f["check"] == "change"]
+    assert {f["period"] for f in change} == {"2023-06", "2023-07"}
+    assert flagged_pages(flags) == [bad["_page"]]
+
+
+def test_inconsistent_pages_are_reextracted_with_the_strongest_tier():
+    records = _series("North", 120.0, months=24)
+    good_page_2 = [dict(r) for r in records if r["_page"] == 2]
+    records[15]["index_value"] = 199.9
+    unreadable = {"index_value": 120.0, "district": "North", "_page": 2}  # missing period
+    outcome = {"data": records, "raw_data": records + [unreadable], "raw_count": 25,
+               "errors": ["Record 24: missing 'period'"], "confidence": 0.95,
+               "extraction_method": "cascade/text_layer:pymupdf_text+fast", "pages_processed": 2,
+               "image_paths": []}
+    job = {"request": {"extraction_schema": HPI}, "reused": [], "matches": {},
+           "pdf_path": "hpi.pdf", "expected_content": "Housing Price Index"}
+    redo = {"data": good_page_2, "raw_data": good_page_2, "raw_count": 12, "errors": [], "confidence": 0.9,
+            "extraction_method": "cascade/full_vision", "pages_processed": 1, "image_paths": ["p2.png"]}
+
+    with patch.object(extract_main, "run_cascade", return_value=redo) as cascade_mock:
+        checked = extract_main._recheck_series(job, outcome)
+
+    assert cascade_mock.call_args.kwargs["pages"] == [2]
+    assert cascade_mock.call_args.kwargs["tiers"] == ["full_vision"]
+    assert checked["consistency_flags"] == []
+    assert checked["reextracted_pages"] == [2]
+    # Page 2's first reading, unreadable record included, is fully replaced
+    assert len(checked["data"]) == 24 and checked["raw_count"] == 24
+    assert checked["errors"] == []
+    assert checked["image_paths"] == ["p2.png"]
+
+
+def test_bare_pct_change_is_not_checked():
+    records = _series("North", 120.0)
+    for r in records:
+        r["pct_change"] = 9.9  # the district table's change, base period unknown
+    assert check_consistency(records, {**HPI, "fields": HPI["fields"] + ["pct_change"]}) == []
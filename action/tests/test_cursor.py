@@ -0,0 +1,69 @@
+"""Tests for the discovery cursor and watermark-filtered SharePoint listing."""
+
+from unittest.mock import patch, MagicMock
+
+from action.discover import cbs_client
+from action.discover.cursor import load_cursor, save_cursor, advance, watermark, discovery_years
+
+
+def _response(status, payload=None):
+    resp = MagicMock(status_code=status, headers={"content-type": "application/json"})
+    resp.json.return_value = payload
+    return resp
+
+
+def test_year_window_covers_previous_year():
+    # Early January still lists last December's publications
+    assert discovery_years(2026, 2, None) == [2025, 2026]
+    assert discovery_years(2026, 1, "2026-01-10T00:00:00Z") == [2026]
+    # A long gap since the last successful run is caught up
+    assert discovery_years(2026, 2, "2023-06-01T00:00:00Z") == [2023, 2024, 2025, 2026]
+
+
+def test_cursor_round_trip_and_advance_never_moves_back(tmp_path):
+    path = str(tmp_path / "state" / "cursor.json")
+    assert load_cursor(path) == {}
+
+    cursor = {}
+    advance(cursor, "publications", "2026-02-01T00:00:00Z")
+    advance(cursor, "publications", "2026-01-01T00:00:00Z")
+    advance(cursor, "mediarelease", "")
+    save_cursor(path, cursor)
+
+    reloaded = load_cursor(path)
+    assert watermark(reloaded, "publications") == "2026-02-01T00:00:00Z"
+    assert watermark(reloaded, "mediarelease") is None
+
+
+def test_folder_listing_filters_and_follows_next_link():
+    pages = [
+        _response(200, {"value": [{"Name": "a"}], "odata.nextLink": "https://cbs/next?$skiptoken=Paged%3dTRUE"}),
+        _response(200, {"value": [{"Name": "b"}]}),
+    ]
+    with patch.object(cbs_client, "_get", side_effect=pages) as get:
+        folders = cbs_client.list_doclib_folder_info("publications", 2026, since="2026-01-15T10:00:00Z")
+
+    assert [f["Name"] for f in folders] == ["a", "b"]
+    first_url = get.call_args_list[0].args[0]
+    assert "$filter=TimeLastModified%20gt%20datetime'2026-01-15T10:00:00Z'" in first_url
+    assert get.call_args_list[1].args[0] == "https://cbs/next?$skiptoken=Paged%3dTRUE"
+
+
+def test_failed_page_counts_as_failure():
+    pages = [
+        _response(200, {"value": [{"Name": "a"}], "odata.nextLink": "https://cbs/next"}),
+        _response(503),
+    ]
+    before = cbs_client.request_failures()
+    with patch.object(cbs_client, "_get", side_effect=pages):
+        folders = cbs_client.list_doclib_folder_info("publications", 2026)
+
+    assert folders == []
+    assert cbs_client.request_failures() == before + 1
+
+
+def test_missing_year_folder_is_empty_not_failure():
+    before = cbs_client.request_failures()
+    with patch.object(cbs_client, "_get", return_value=_response(404)):
+        assert cbs_client.list_doclib_folder_info("mediarelease", 2027) == []
+    assert cbs_client.request_failures() == before
@@ -0,0 +1,129 @@
+"""Tests for duplicate detection in discovery and content-hash reuse in extraction."""
+
+import threading
+import time
+from unittest.mock import patch
+
+from action.discover.dedup import group_duplicates, canonical_entry, head_hasher
+from action.extract import dedup
+from action.extract import main as extract_main
+from action.extract.dedup import duplicate_groups, fan_out, reusable, content_entry
+from tests.test_leases import MemoryStore
+
+
+def _entry(source, pub, name, size):
+    return {
+        "source": source,
+        "url": f"https://www.cbs.gov.il/he/{source}/{pub}/{name}",
+        "filename": name,
+        "publication_id": pub,
+        "metadata": {"size": size},
+    }
+
+
+def test_groups_copies_by_size_and_name():
+    media = _entry("cbs-media", "cbs-media-2026-10_26_045", "Table1.pdf", 5000)
+    pub = _entry("cbs-publications", "cbs-pub-2026-price01", "table1.pdf", 5000)
+    other = _entry("cbs-publications", "cbs-pub-2026-price01", "table2.pdf", 5000)
+    unknown_size = _entry("cbs-media", "cbs-media-2026-x", "table1.pdf", 0)
+
+    groups = group_duplicates([media, other, pub, unknown_size])
+
+    assert groups == [[media, pub], [other], [unknown_size]]
+    canonical = canonical_entry(groups[0])
+    assert canonical["url"] == media["url"]
+    # The Worker needs each copy's full entry to record its publication's file
+    assert canonical["metadata"]["duplicates"] == [pub]
+    assert "duplicates" not in media["metadata"]
+
+
+def test_leading_bytes_split_coincidental_matches():
+    a = _entry("cbs-media", "m1", "t.pdf", 10)
+    b = _entry("cbs-publications", "p1", "t.pdf", 10)
+    c = _entry("cbs-publications", "p2", "t.pdf", 10)
+    heads = {a["url"]: b"%PDF-same", b["url"]: b"%PDF-same", c["url"]: b"%PDF-other"}
+    fetched = []
+
+    def fetch(url, nbytes):
+        fetched.append((url, nbytes))
+        return heads[url]
+
+    groups = group_duplicates([a, b, c], head_hasher(fetch, 4096))
+
+    assert groups == [[a, b], [c]]
+    assert all(n == 4096 for _, n in fetched)
+
+
+def test_content_claim_is_exclusive_until_indexed():
+    store = MemoryStore()
+    status, etag = dedup.claim_content(store, "ab" * 32, "req-1")
+    assert status == "claimed"
+
+    def finish():
+        time.sleep(0.05)
+        store.objects[dedup.content_index_key("ab" * 32)] = ({"status": "success", "data": []}, '"i"')
+
+    threading.Thread(target=finish).start()
+    with patch.object(dedup, "CLAIM_POLL_INTERVAL", 0.01):
+        status, entry = dedup.claim_content(store, "ab" * 32, "req-2", wait=5)
+    assert status == "indexed" and entry["status"] == "success"
+
+
+def test_released_or_expired_claim_is_taken_over():
+    store = MemoryStore()
+    _, etag = dedup.claim_content(store, "cd" * 32, "req-1")
+    dedup.release_content_claim(store, "cd" * 32, "req-1", etag)
+    assert dedup.claim_content(store, "cd" * 32, "req-2", wait=0)[0] == "claimed"
+    with patch.object(dedup, "CLAIM_POLL_INTERVAL", 0):
+        assert dedup.claim_content(store, "cd" * 32, "req-3", wait=0) == ("unclaimed", None)
+
+
+def test_duplicate_groups_by_checksum():
+    checksums = {"req-3": "abc", "req-1": "abc", "req-2": "", "req-4": "def"}
+    assert duplicate_groups(checksums) == [["req-1", "req-3"], ["req-2"], ["req-4"]]
+
+
+def test_fan_out_retags_records():
+    entry = {"status": "success", "schema_type": "consumer_price_index",
+             "data": [{"value": 1, "publication_id": "old", "file_id": "old:f.pdf"}]}
+    request = {"publication_id": "new", "extraction_schema": {"type": "consumer_price_index"}}
+    assert reusable(entry, request)
+    assert not reusable({**entry, "status": "partial"}, request)
+    assert not reusable(entry, {**request, "extraction_schema": {"type": "review_insights"}})
+
+    records = fan_out(entry, request, "new:f.pdf")
+    assert records == [{"value": 1, "publication_id": "new", "file_id": "new:f.pdf"}]
+    assert entry["data"][0]["publication_id"] == "old"
+
+
+def test_run_request_reuses_identical_file(tmp_path):
+    request = {
+        "source": "cbs-publications",
+        "publication_id": "cbs-pub-2026-price01",
+        "file": {"r2_key": "raw-files/cbs/price01/t.pdf", "expected_content": "cpi"},
+        "extraction_schema": {"type": "consumer_price_index", "fields": []},
+    }
+    indexed = content_entry(
+        {**request, "publication_id": "cbs-media-2026-045"},
+        {"request_id": "req-2026-01-01-001", "status": "success", "confidence": 0.9,
+         "extraction_method": "cascade/text_layer", "data": [{"value": 1}]},
+    )
+    written = {}
+
+    def download(key, path):
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4 identical bytes")
+
+    with patch.object(extract_main, "read_request", return_value=request), \
+         patch.object(extract_main, "download_pdf", side_effect=download), \
+         patch.object(extract_main, "claim_content", return_value=("indexed", indexed)) as claim, \
+         patch.object(extract_main, "run_cascade") as cascade, \
+         patch.object(extract_main, "write_result", side_effect=lambda rid, r: written.update(r)):
+        assert extract_main.run_request("req-2026-02-01-002")
+
+    cascade.assert_not_called()
+    assert len(claim.call_args[0][1]) == 64
+    assert written["extraction_method"] == "dedup/sha256"
+    assert written["duplicate_of"] == "req-2026-01-01-001"
+    assert written["data"] == [{"value": 1, "publication_id": "cbs-pub-2026-price01",
+                                "file_id": "cbs-pub-2026-price01:t.pdf"}]
@@ -0,0 +1,230 @@
+"""Tests for CBS discovery orchestration."""
+
+import random
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+import pytest
+
+from action.discover import cbs_client
+from action.discover import main as discover_main
+from action.discover.cursor import load_cursor
+from action.discover.governor import Governor
+
+
+def _fake_files(section, year, folder, signature=None, since=None):
+    time.sleep(random.uniform(0.01, 0.05))
+    return [{
+        "name": f"{folder}.pdf",
+        "server_url": f"/he/{section}/{year}/{folder}.pdf",
+        "size": 1,
+        "ext": "pdf",
+        "modified": f"{year}-01-{int(folder[-2:]) + 1:02d}T00:00:00Z",
+    }]
+
+
+def test_discover_section_is_concurrent_and_ordered():
+    folders = [f"folder{i:02d}" for i in range(20)]
+    with patch.object(discover_main, "get_page_items", return_value=[]), \
+         patch.object(discover_main, "list_doclib_folder_info", return_value=[{"Name": f} for f in folders]), \
+         patch.object(discover_main, "list_folder_files", side_effect=_fake_files):
+        start = time.monotonic()
+        entries, high_water = discover_main.discover_section("publications", "cbs-publications", "guid", [2026])
+        elapsed = time.monotonic() - start
+
+    assert [e["metadata"]["folder"] for e in entries] == folders
+    assert high_water == "2026-01-20T00:00:00Z"
+    # 20 folders at up to 50ms each would take ~0.6s sequentially
+    assert elapsed < 0.5
+
+
+def test_get_caps_in_flight_requests():
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_get(url, headers=None, timeout=None):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        return MagicMock(status_code=200)
+
+    session = MagicMock()
+    session.get.side_effect = slow_get
+    governor = Governor(3, rate=1000)
+
+    with patch.object(cbs_client, "get_session", return_value=session), \
+         patch.object(cbs_client, "_governor", governor):
+        threads = [threading.Thread(target=cbs_client._get, args=(f"u{i}",)) for i in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert session.get.call_count == 12
+    assert 1 < peak <= 3
+
+
+def test_session_is_shared_and_sends_sharepoint_headers():
+    with patch.object(cbs_client, "_session", None):
+        first = cbs_client.get_session()
+        second = cbs_client.get_session()
+        assert first is second
+        assert first.headers["Accept"] == cbs_client.SP_HEADERS["Accept"]
+
+
+def test_discover_section_spans_year_window_in_order():
+    def folder_info(section, year, since=None):
+        assert since == "2025-12-01T00:00:00Z"
+        return [{"Name": f"folder{year % 100:02d}", "TimeLastModified": f"{year}-12-31T00:00:00Z"}]
+
+    with patch.object(discover_main, "get_page_items", return_value=[]), \
+         patch.object(discover_main, "list_doclib_folder_info", side_effect=folder_info), \
+         patch.object(discover_main, "list_folder_files", side_effect=_fake_files):
+        entries, high_water = discover_main.discover_section(
+            "mediarelease", "cbs-media", "guid", [2025, 2026], since="2025-12-01T00:00:00Z"
+        )
+
+    assert [e["publication_id"] for e in entries] == ["cbs-media-2025-folder25", "cbs-media-2026-folder26"]
+    assert high_water == "2026-12-31T00:00:00Z"
+
+
+def _run_main(tmp_path, post_errors):
+    cursor_path = tmp_path / "cursor.json"
+    entry = {"url": "https://www.cbs.gov.il/new.pdf"}
+    env = {
+        "INGEST_WEBHOOK_URL": "https://worker.test",
+        "INGEST_AUTH_TOKEN": "t",
+        "CBS_DISCOVERY_CURSOR": str(cursor_path),
+    }
+    with patch.dict("os.environ", env), \
+         patch.object(discover_main, "known_among", return_value=set()), \
+         patch.object(discover_main, "discover_section", return_value=([entry], "2026-03-01T00:00:00Z")), \
+         patch.object(discover_main, "post_manifest", return_value=(1, post_errors)), \
+         patch.object(discover_main, "request_failures", return_value=0), \
+         patch.object(discover_main, "blocked_requests", return_value=0), \
+         patch.object(discover_main, "save_cache"):
+        discover_main.main()
+    return cursor_path
+
+
+def test_watermark_advances_after_successful_post(tmp_path):
+    cursor_path = _run_main(tmp_path, post_errors=0)
+    cursor = load_cursor(str(cursor_path))
+    assert cursor["publications"]["watermark"] == "2026-03-01T00:00:00Z"
+    assert cursor["mediarelease"]["watermark"] == "2026-03-01T00:00:00Z"
+
+
+def test_watermark_kept_when_post_fails(tmp_path):
+    cursor_path = _run_main(tmp_path, post_errors=1)
+    assert not cursor_path.exists()
+
+
+def test_copies_under_other_publications_are_all_posted(tmp_path):
+    media = {"url": "https://www.cbs.gov.il/he/mediarelease/DocLib/2026/045/aa2_1.pdf",
+             "filename": "aa2_1.pdf", "metadata": {"size": 5000}}
+    pub = {"url": "https://www.cbs.gov.il/he/publications/Madad/DocLib/2026/price01aa/aa2_1.pdf",
+           "filename": "aa2_1.pdf", "metadata": {"size": 5000}}
+    env = {"INGEST_WEBHOOK_URL": "https://worker.test", "INGEST_AUTH_TOKEN": "t"}
+    with patch.dict("os.environ", env), \
+         patch.object(discover_main, "known_among", return_value={media["url"]}), \
+         patch.object(discover_main, "discover_section", side_effect=[([media], ""), ([pub], "")]), \
+         patch.object(discover_main, "post_manifest", return_value=(1, 0)) as post, \
+         patch.object(discover_main, "request_failures", return_value=0), \
+         patch.object(discover_main, "blocked_requests", return_value=0), \
+         patch.object(discover_main, "save_cache"):
+        discover_main.main()
+
+    # Same name and size as a known file, but its own publication's file
+    assert post.call_args.args[0] == [pub]
+
+
+def test_new_copies_are_posted_once_with_their_duplicates(tmp_path):
+    media = {"url": "https://www.cbs.gov.il/he/mediarelease/DocLib/2026/045/aa2_1.pdf",
+             "filename": "aa2_1.pdf", "publication_id": "cbs-media-2026-045", "metadata": {"size": 5000}}
+    pub = {"url": "https://www.cbs.gov.il/he/publications/Madad/DocLib/2026/price01aa/aa2_1.pdf",
+           "filename": "aa2_1.pdf", "publication_id": "cbs-pub-2026-price01aa", "metadata": {"size": 5000}}
+    env = {"INGEST_WEBHOOK_URL": "https://worker.test", "INGEST_AUTH_TOKEN": "t"}
+    with patch.dict("os.environ", env), \
+         patch.object(discover_main, "known_among", return_value=set()), \
+         patch.object(discover_main, "discover_section", side_effect=[([media], ""), ([pub], "")]), \
+         patch.object(discover_main, "post_manifest", return_value=(1, 0)) as post, \
+         patch.object(discover_main, "request_failures", return_value=0), \
+         patch.object(discover_main, "blocked_requests", return_value=0), \
+         patch.object(discover_main, "save_cache"):
+        discover_main.main()
+
+    [posted] = post.call_args.args[0]
+    assert posted["url"] == media["url"]
+    assert posted["metadata"]["duplicates"] == [pub]
+
+
+def test_entries_get_their_own_folders_page_item():
+    page_items = [
+        {"Title": "Newer", "Created": "2026-02-01T00:00:00Z",
+         "FileRef": "/he/publications/Madad/Pages/2026/folder01.aspx"},
+        {"Title": "Older duplicate", "Created": "2026-01-15T00:00:00Z",
+         "FileRef": "/he/publications/Madad/Pages/2026/folder01.aspx"},
+        {"Title": "First", "ArticleStartDate": "2026-01-10T00:00:00Z",
+         "FileRef": "/he/publications/Madad/Pages/2026/Folder00.aspx"},
+    ]
+    folders = [{"Name": "folder00"}, {"Name": "folder01"}, {"Name": "folder02"}]
+    with patch.object(discover_main, "get_page_items", return_value=page_items) as get_items, \
+         patch.object(discover_main, "list_doclib_folder_info", return_value=folders), \
+         patch.object(discover_main, "list_folder_files", side_effect=_fake_files):
+        entries, _ = discover_main.discover_section("publications", "cbs-publications", "guid", [2025, 2026])
+
+    get_items.assert_called_once_with("publications", "guid", 2025)
+    by_pub = {e["publication_id"]: e for e in entries}
+    assert by_pub["cbs-pub-2026-folder00"]["metadata"]["title"] == "First"
+    assert by_pub["cbs-pub-2026-folder00"]["publish_date"] == "2026-01-10T00:00:00Z"
+    assert by_pub["cbs-pub-2026-folder01"]["metadata"]["title"] == "Newer"
+    assert by_pub["cbs-pub-2025-folder01"]["metadata"]["title"] == ""
+    assert by_pub["cbs-pub-2026-folder02"]["metadata"]["title"] == ""
+
+
+def test_page_items_fetched_in_one_paged_listing():
+    pages = {
+        "first": {"value": [{"Id": 1}, {"Id": 2}], "odata.nextLink": "second"},
+        "second": {"value": [{"Id": 3}]},
+    }
+    requested = []
+
+    def fetch(url, label, signature=None, missing_ok=False):
+        requested.append(url)
+        return pages["second" if url == "second" else "first"]
+
+    with patch.object(cbs_client, "_fetch_json", side_effect=fetch):
+        items = cbs_client.get_page_items("publications", "guid", since_year=2025)
+
+    assert [i["Id"] for i in items] == [1, 2, 3]
+    assert len(requested) == 2
+    assert "$filter=Created%20ge%20datetime'2025-01-01T00:00:00Z'" in requested[0]
+
+
+def test_page_item_key_parses_file_ref():
+    assert cbs_client.page_item_key("/he/mediarelease/Madad/Pages/2026/10_26_045.aspx") == ("2026", "10_26_045")
+    assert cbs_client.page_item_key("/he/publications/Madad/Pages/2026/%D7%9E%D7%93%D7%93.aspx") == ("2026", "מדד")
+    assert cbs_client.page_item_key("/he/publications/Madad/Pages/about.aspx") is None
+
+
+def test_blocked_run_exits_without_posting(tmp_path):
+    env = {
+        "INGEST_WEBHOOK_URL": "https://worker.test",
+        "INGEST_AUTH_TOKEN": "t",
+        "CBS_DISCOVERY_CURSOR": str(tmp_path / "cursor.json"),
+    }
+    with patch.dict("os.environ", env), \
+         patch.object(discover_main, "discover_section", return_value=([], "")), \
+         patch.object(discover_main, "blocked_requests", return_value=2), \
+         patch.object(discover_main, "post_manifest") as post, \
+         patch.object(discover_main, "save_cache"):
+        with pytest.raises(SystemExit):
+            discover_main.main()
+    post.assert_not_called()
+    assert not (tmp_path / "cursor.json").exists()
@@ -0,0 +1,135 @@
+"""Tests for page fingerprinting and record reuse across publications."""
+
+import os
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from action.extract import fingerprints as fp
+
+
+def _make_pdf(page_texts: list[str]) -> str:
+    fitz = pytest.importorskip("fitz")
+    doc = fitz.open()
+    for text in page_texts:
+        page = doc.new_page()
+        page.insert_text((72, 72), text, fontsize=14)
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        path = f.name
+    doc.save(path)
+    doc.close()
+    return path
+
+
+def test_text_fingerprint_ignores_whitespace():
+    assert fp.text_fingerprint("Index  150.5\n") == fp.text_fingerprint(" Index 150.5")
+    assert fp.text_fingerprint("Index 150.5") != fp.text_fingerprint("Index 150.6")
+    assert fp.text_fingerprint("  \n ") == ""
+
+
+def test_unchanged_pages_match_changed_pages_do_not():
+    jan = _make_pdf(["Methodology notes", "Historic rows 2019-2024", "January 2026: 150.5"])
+    feb = _make_pdf(["Methodology notes", "Historic rows 2019-2024", "February 2026: 151.2"])
+    try:
+        matches = fp.match_pages(fp.page_fingerprints(feb), fp.page_fingerprints(jan))
+    finally:
+        os.unlink(jan)
+        os.unlink(feb)
+
+    assert matches == {1: 1, 2: 2}
+
+
+def test_moved_page_still_matches():
+    previous = [
+        {"page": 1, "text": "aaa", "image": "00ff"},
+        {"page": 2, "text": "bbb", "image": "ff00"},
+    ]
+    current = [
+        {"page": 1, "text": "new", "image": "0f0f"},
+        {"page": 2, "text": "aaa", "image": "00ff"},
+        {"page": 3, "text": "bbb", "image": "ff01"},
+    ]
+    assert fp.match_pages(current, previous) == {2: 1, 3: 2}
+
+
+def test_scanned_pages_need_identical_image_hash():
+    previous = [{"page": 1, "text": "", "image": "00ff"}]
+    assert fp.match_pages([{"page": 1, "text": "", "image": "00fe"}], previous) == {}
+    assert fp.match_pages([{"page": 1, "text": "", "image": "00ff"}], previous) == {1: 1}
+
+
+def test_index_round_trip_reuses_prior_records():
+    request = {
+        "request_id": "req-2026-01-15-001",
+        "publication_id": "cbs-pub-2026-price01aa",
+        "file": {"expected_content": "Housing Price Index (national)"},
+    }
+    records = [
+        {"period": "2019-01", "index_value": 100.0, "_page": 2,
+         "publication_id": "cbs-pub-2026-price01aa", "file_id": "x"},
+        {"period": "2026-01", "index_value": 150.5, "_page": 3},
+    ]
+    page_records = fp.records_by_page(records, [1, 2, 3])
+    fingerprints = [{"page": p, "text": str(p), "image": "00"} for p in (1, 2, 3)]
+    index = fp.build_index(request, fingerprints, page_records, 0.9)
+
+    reused = fp.reuse_records(index, {4: 2})
+    assert reused == [{"period": "2019-01", "index_value": 100.0, "_page": 4}]
+
+
+def test_records_by_page_rejects_untagged_records():
+    assert fp.records_by_page([{"period": "2026-01"}], [1, 2]) is None
+    assert fp.records_by_page([{"_page": 2}], [1, 2]) == {1: [], 2: [{"_page": 2}]}
+
+
+def test_older_publication_does_not_replace_newer_index():
+    from action.extract import r2_client
+    from tests.test_leases import MemoryStore
+
+    store = MemoryStore()
+    newer = {"request_id": "req-2026-03-01-001", "created_at": "2026-03-01T06:00:00Z", "pages": []}
+    older = {"request_id": "req-2026-02-01-004", "created_at": "2026-02-01T06:00:00Z", "pages": []}
+    key = r2_client._fingerprint_key("cpi")
+    with patch.object(r2_client, "get_json_with_etag", store.get_json_with_etag), \
+         patch.object(r2_client, "put_json_conditional", store.put_json_conditional):
+        r2_client.write_fingerprint_index("cpi", newer)
+        r2_client.write_fingerprint_index("cpi", older)
+        assert store.get_json_with_etag(key)[0]["request_id"] == newer["request_id"]
+        later = {**newer, "request_id": "req-2026-04-01-001", "created_at": "2026-04-01T06:00:00Z"}
+        r2_client.write_fingerprint_index("cpi", later)
+    assert store.get_json_with_etag(key)[0]["request_id"] == "req-2026-04-01-001"
+
+
+def test_incremental_off_skips_fingerprints_and_result_has_no_page_tags():
+    from action.extract import main as extract_main
+
+    request = {
+        "request_id": "req-2026-03-01-001",
+        "source": "cbs-publications",
+        "publication_id": "cbs-pub-2026-price01",
+        "file": {"r2_key": "raw-files/cbs/price01/t.pdf", "expected_content": "cpi"},
+        "extraction_schema": {"type": "consumer_price_index", "fields": []},
+    }
+    outcome = {"data": [{"index_code": "120010", "value": 101.2, "_page": 1}], "raw_count": 1,
+               "errors": [], "confidence": 0.95, "extraction_method": "cascade/full_vision",
+               "pages_processed": 1, "image_paths": []}
+    written = {}
+    with patch.dict(os.environ, {"INCREMENTAL_EXTRACTION": "0", "CONSISTENCY_CHECKS": "0"}), \
+         patch.object(extract_main, "download_pdf", side_effect=lambda key, path: open(path, "wb").close()), \
+         patch.object(extract_main, "claim_content", return_value=("unclaimed", None)), \
+         patch.object(extract_main, "write_content_index"), \
+         patch.object(extract_main, "page_fingerprints") as fingerprints, \
+         patch.object(extract_main, "read_fingerprint_index") as read_index, \
+         patch.object(extract_main, "write_fingerprint_index") as write_index, \
+         patch.object(extract_main, "run_cascade", return_value=outcome) as cascade, \
+         patch.object(extract_main, "write_result", side_effect=lambda rid, r: written.update({rid: r})):
+        assert extract_main.run_request(request["request_id"], request)
+
+    fingerprints.assert_not_called()
+    read_index.assert_not_called()
+    write_index.assert_not_called()
+    assert cascade.call_args.kwargs["pages"] is None
+    result = written[request["request_id"]]
+    assert result["status"] == "success"
+    assert "_page" not in result["data"][0]
@@ -0,0 +1,151 @@
+"""Tests for the CBS request governor, against a local server that blocks on demand."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from action.discover import cbs_client
+from action.discover.governor import Governor, CbsBlocked
+
+
+class BlockingServer:
+    """Serves SharePoint-style JSON, or the WAF's HTML block page / 429
+    for the next `block` requests."""
+
+    def __init__(self):
+        self.block = 0
+        self.block_status = 200  # 200 = HTML block page
+        self.requests = 0
+        self.times: list[float] = []
+        self.lock = threading.Lock()
+
+    def handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requests += 1
+                    server.times.append(time.monotonic())
+                    blocked = server.block > 0
+                    if blocked:
+                        server.block -= 1
+                if blocked:
+                    body, ctype, status = b"<html>Request blocked</html>", "text/html", server.block_status
+                else:
+                    body, ctype, status = json.dumps({"value": [{"Name": "050"}]}).encode(), "application/json", 200
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def server():
+    fake = BlockingServer()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), fake.handler())
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    fake.url = f"http://127.0.0.1:{httpd.server_port}"
+    yield fake
+    httpd.shutdown()
+
+
+def _get(governor, url):
+    return governor.call(url, lambda: requests.get(url, timeout=5))
+
+
+def test_blocks_halve_limit_and_successes_restore_it(server):
+    governor = Governor(8, rate=1000, breaker_threshold=100, backoff=0)
+    server.block = 2
+    _get(governor, server.url)
+    assert governor.limit == 2.5  # 8 -> 4 -> 2, then +1/2 for the success
+    for _ in range(20):
+        _get(governor, server.url)
+    assert governor.limit > 4
+
+
+def test_breaker_pauses_then_probes_and_recovers(server):
+    governor = Governor(4, rate=1000, breaker_threshold=2, cooldown=0.2, backoff=0)
+    server.block = 2
+    start = time.monotonic()
+    resp = _get(governor, server.url)
+
+    assert resp.json() == {"value": [{"Name": "050"}]}
+    assert governor.trips == 1
+    assert governor.open_until == 0.0  # closed again after the probe
+    assert server.times[2] - server.times[1] >= 0.2
+    assert time.monotonic() - start >= 0.2
+
+
+def test_failed_probe_doubles_cooldown(server):
+    governor = Governor(4, rate=1000, breaker_threshold=1, cooldown=0.05, backoff=0)
+    server.block = 2
+    server.block_status = 429
+    _get(governor, server.url)
+    assert governor.blocked == 2
+    assert governor.cooldown == 0.05  # reset once the second probe succeeded
+    assert server.times[2] - server.times[1] >= 0.1
+
+
+def test_persistent_block_raises(server):
+    governor = Governor(4, rate=1000, breaker_threshold=100, max_attempts=3, backoff=0)
+    server.block = 10
+    with pytest.raises(CbsBlocked):
+        _get(governor, server.url)
+    assert server.requests == 3
+    assert governor.gave_up == 1
+
+
+def test_token_bucket_paces_requests_per_host(server):
+    governor = Governor(4, rate=20, burst=1)
+    start = time.monotonic()
+    for _ in range(6):
+        _get(governor, server.url)
+    # 1 burst token, then 5 more at 20/s
+    assert time.monotonic() - start >= 0.2
+
+
+def test_blocked_listing_is_a_failure_not_an_empty_folder(server):
+    governor = Governor(4, rate=1000, breaker_threshold=2, cooldown=0.05, max_attempts=3, backoff=0)
+    server.block = 100
+    failures = cbs_client.request_failures()
+    with patch.object(cbs_client, "CBS_BASE", server.url), \
+         patch.object(cbs_client, "_governor", governor), \
+         patch.dict("os.environ", {"CBS_HTTP_CACHE": ""}):
+        assert cbs_client.fetch_folder_files("publications", 2026, "050") is None
+        assert cbs_client.blocked_requests() == 1
+    assert cbs_client.request_failures() == failures + 1
+
+
+def test_listing_recovers_after_transient_block(server):
+    governor = Governor(4, rate=1000, breaker_threshold=2, cooldown=0.05, backoff=0)
+    server.block = 3
+    with patch.object(cbs_client, "CBS_BASE", server.url), \
+         patch.object(cbs_client, "_governor", governor), \
+         patch.dict("os.environ", {"CBS_HTTP_CACHE": ""}):
+        folders = cbs_client.list_doclib_folder_info("publications", 2026)
+    assert folders == [{"Name": "050"}]
+    assert governor.gave_up == 0
+
+
+def test_server_errors_are_retried_without_throttling(server):
+    governor = Governor(4, rate=1000, breaker_threshold=2, cooldown=0.05, max_attempts=3, backoff=0)
+    server.block, server.block_status = 2, 500
+    assert _get(governor, server.url).status_code == 200
+    assert governor.retries == 2
+    assert governor.limit == 4 and governor.open_until == 0
+
+    server.block = 100
+    assert _get(governor, server.url).status_code == 500  # not a block: no CbsBlocked
+    assert governor.gave_up == 0
@@ -0,0 +1,111 @@
+"""Tests for extracting the files of one publication in shared model calls."""
+
+import json
+import os
+from unittest.mock import MagicMock, patch
+
+from action.extract import main as extract_main
+from action.extract.ai_extract import extract_data_from_text
+
+SCHEMA = {"type": "avg_apartment_prices", "fields": ["district", "avg_price"]}
+
+
+def _request(request_id, publication_id, name):
+    return {
+        "request_id": request_id,
+        "source": "cbs-publications",
+        "publication_id": publication_id,
+        "file": {"r2_key": f"raw-files/cbs/{publication_id}/{name}", "expected_content": f"prices {name}"},
+        "extraction_schema": SCHEMA,
+    }
+
+
+def test_text_call_marks_each_file_section():
+    response = MagicMock()
+    response.content = [MagicMock(text=json.dumps({"data": [], "confidence": 0.9}))]
+    with patch.dict(os.environ, {"ANTHRIPIC_API_KEY": "test-key"}), \
+         patch("action.extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
+        mock_anthropic.return_value.messages.create.return_value = response
+        extract_data_from_text(
+            ["north", "north 2", "south"], SCHEMA, "prices",
+            page_numbers=[1, 2, 1], file_labels=["aa2_1.pdf", "aa2_1.pdf", "aa2_2.pdf"],
+        )
+
+    content = mock_anthropic.return_value.messages.create.call_args.kwargs["messages"][0]["content"]
+    material, prompt = content[0]["text"], content[-1]["text"]
+    assert material.count("=== File aa2_1.pdf ===") == 1
+    assert material.index("=== File aa2_2.pdf ===") > material.index("--- Page 2 ---\nnorth 2")
+    assert '"_file"' in prompt
+
+
+def test_run_grouped_splits_one_publication_into_per_request_results():
+    requests = {
+        "req-2026-03-01-001": _request("req-2026-03-01-001", "cbs-pub-2026-price01aa", "aa2_1.pdf"),
+        "req-2026-03-01-002": _request("req-2026-03-01-002", "cbs-media-2026-045", "table.pdf"),
+        "req-2026-03-01-003": _request("req-2026-03-01-003", "cbs-pub-2026-price01aa", "aa2_2.pdf"),
+    }
+    written = {}
+
+    def download(key, path):
+        with open(path, "wb") as f:
+            f.write(key.encode())
+
+    def outcome(rows, method="cascade/text_layer:pymupdf_text+fast"):
+        return {"data": rows, "raw_count": len(rows), "errors": [], "confidence": 0.95,
+                "extraction_method": method, "pages_processed": 1, "image_paths": []}
+
+    group_outcomes = {
+        "aa2_1.pdf": outcome([{"district": "North", "avg_price": 1.5, "_page": 1}]),
+        "aa2_2.pdf": outcome([{"district": "South", "avg_price": 2.5, "_page": 1}]),
+    }
+    with patch.object(extract_main, "read_request", side_effect=lambda rid: requests[rid]), \
+         patch.object(extract_main, "download_pdf", side_effect=download), \
+         patch.object(extract_main, "claim_content", return_value=("unclaimed", None)), \
+         patch.object(extract_main, "write_content_index"), \
+         patch.object(extract_main, "page_fingerprints", return_value=[{"page": 1}]), \
+         patch.object(extract_main, "read_fingerprint_index", return_value=None), \
+         patch.object(extract_main, "write_fingerprint_index"), \
+         patch.object(extract_main, "run_group_cascade", return_value=group_outcomes) as group_mock, \
+         patch.object(extract_main, "run_cascade",
+                      return_value=outcome([{"district": "All", "avg_price": 2.0, "_page": 1}])) as single_mock, \
+         patch.object(extract_main, "write_result", side_effect=lambda rid, r: written.update({rid: r})):
+        failed = extract_main.run_grouped(list(requests))
+
+    assert failed == []
+    files, schema, expected = group_mock.call_args.args
+    assert [f["label"] for f in files] == ["aa2_1.pdf", "aa2_2.pdf"]
+    assert expected == "prices aa2_1.pdf; prices aa2_2.pdf"
+    assert single_mock.call_count == 1  # the other publication's only file
+
+    first = written["req-2026-03-01-001"]
+    assert first["grouped_with"] == ["req-2026-03-01-003"]
+    assert first["data"][0]["file_id"] == "cbs-pub-2026-price01aa:aa2_1.pdf"
+    assert written["req-2026-03-01-003"]["data"][0]["district"] == "South"
+    assert written["req-2026-03-01-003"]["data"][0]["file_id"] == "cbs-pub-2026-price01aa:aa2_2.pdf"
+    assert "grouped_with" not in written["req-2026-03-01-002"]
+
+
+def test_failed_group_call_falls_back_to_single_files():
+    requests = [
+        _request("req-2026-03-01-001", "cbs-pub-2026-price01aa", "aa2_1.pdf"),
+        _request("req-2026-03-01-002", "cbs-pub-2026-price01aa", "aa2_2.pdf"),
+    ]
+    written = {}
+    single = {"data": [{"district": "North", "avg_price": 1.5, "_page": 1}], "raw_count": 1, "errors": [],
+              "confidence": 0.95, "extraction_method": "cascade/full_vision", "pages_processed": 1,
+              "image_paths": []}
+
+    with patch.object(extract_main, "download_pdf", side_effect=lambda key, path: open(path, "wb").close()), \
+         patch.object(extract_main, "claim_content", return_value=("unclaimed", None)), \
+         patch.object(extract_main, "write_content_index"), \
+         patch.object(extract_main, "page_fingerprints", return_value=[{"page": 1}]), \
+         patch.object(extract_main, "read_fingerprint_index", return_value=None), \
+         patch.object(extract_main, "write_fingerprint_index"), \
+         patch.object(extract_main, "run_group_cascade", side_effect=RuntimeError("bad split")), \
+         patch.object(extract_main, "run_cascade", return_value=single) as single_mock, \
+         patch.object(extract_main, "write_result", side_effect=lambda rid, r: written.update({rid: r})):
+        failed = extract_main.run_publication(requests)
+
+    assert failed == []
+    assert single_mock.call_count == 2
+    assert {r["status"] for r in written.values()} == {"success"}
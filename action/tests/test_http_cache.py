@@ -0,0 +1,87 @@
+"""Tests for the CBS SharePoint HTTP cache, against a local stand-in server."""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from action.discover import cbs_client
+from action.discover.http_cache import HttpCache
+
+
+class _Handler(BaseHTTPRequestHandler):
+    requests_seen: list = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps({"value": [
+            {"Name": "aa2_1.pdf", "ServerRelativeUrl": "/he/x/aa2_1.pdf", "Length": "10"},
+        ]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}", _Handler.requests_seen
+    httpd.shutdown()
+
+
+def test_stale_entry_is_revalidated_with_etag(server, tmp_path):
+    base, seen = server
+    url = f"{base}/he/publications/Madad/_api/items"
+    with patch.dict("os.environ", {"CBS_HTTP_CACHE": str(tmp_path / "cache.json")}), \
+         patch.object(cbs_client, "CACHE_MAX_AGE", 0):
+        first = cbs_client._fetch_json(url, "items")
+        second = cbs_client._fetch_json(url, "items")
+        cache = cbs_client.get_cache()
+
+    assert first == second
+    assert [h for _, h in seen] == [None, '"v1"']
+    assert cache.revalidated == 1
+
+
+def test_unchanged_folder_signature_skips_request(server, tmp_path):
+    base, seen = server
+    with patch.dict("os.environ", {"CBS_HTTP_CACHE": str(tmp_path / "cache.json")}), \
+         patch.object(cbs_client, "CACHE_MAX_AGE", 0), \
+         patch.object(cbs_client, "CBS_BASE", base):
+        first = cbs_client.list_folder_files("publications", 2025, "price01aa", "2025-01-15T10:00:00Z|4")
+        again = cbs_client.list_folder_files("publications", 2025, "price01aa", "2025-01-15T10:00:00Z|4")
+        changed = cbs_client.list_folder_files("publications", 2025, "price01aa", "2025-02-15T10:00:00Z|5")
+
+    assert first == again == changed
+    assert first[0]["name"] == "aa2_1.pdf"
+    # Second call served from cache; changed signature revalidates
+    assert len(seen) == 2
+
+
+def test_fresh_entries_survive_save_and_reload(tmp_path):
+    path = str(tmp_path / "nested" / "cache.json")
+    cache = HttpCache(path, max_age=3600)
+    cache.store("https://cbs/x", {"value": [1]}, {"ETag": '"e"'})
+    cache.save()
+
+    reloaded = HttpCache(path, max_age=3600)
+    assert reloaded.lookup("https://cbs/x") == {"value": [1]}
+    assert reloaded.conditional_headers("https://cbs/x") == {"If-None-Match": '"e"'}
+
+    expired = HttpCache(path, max_age=0)
+    assert expired.lookup("https://cbs/x") is None
@@ -0,0 +1,42 @@
+"""Import budget: light entry points must not load heavy dependencies."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from action.extract.lazy import LazyModule, lazy_import
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HEAVY = ("anthropic", "fitz", "pymupdf", "boto3", "botocore", "pdf2image", "PIL", "numpy")
+
+
+def _loaded_after_import(module: str) -> set[str]:
+    code = (
+        f"import sys, {module}\n"
+        "print(' '.join(sorted({m.split('.')[0] for m in sys.modules})))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return set(out.split())
+
+
+@pytest.mark.parametrize(
+    "entry_point",
+    ["action.extract.main", "action.extract.planner", "action.extract.webhook", "action.discover.main"],
+)
+def test_entry_points_defer_heavy_imports(entry_point):
+    assert _loaded_after_import(entry_point).isdisjoint(HEAVY)
+
+
+def test_lazy_module_loads_on_first_attribute():
+    sys.modules.pop("colorsys", None)
+    colorsys = lazy_import("colorsys")
+    assert isinstance(colorsys, LazyModule)
+    assert "colorsys" not in sys.modules
+
+    assert colorsys.rgb_to_hsv(1.0, 0.0, 0.0) == (0.0, 1.0, 1.0)
+    assert "colorsys" in sys.modules
+    assert lazy_import("colorsys") is sys.modules["colorsys"]
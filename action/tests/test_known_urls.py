@@ -0,0 +1,138 @@
+"""Tests for compact known-URL sync, against a local stand-in for the Worker."""
+
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+from action.discover import known_urls
+
+
+class FakeWorker:
+    """In-process stand-in for /api/known-urls and /api/known-urls/check."""
+
+    def __init__(self, delta=True, check=True):
+        self.rows: list[tuple[str, str]] = []  # (url, created_at)
+        self.delta = delta
+        self.check = check
+        self.calls: list[str] = []
+        self.bytes_sent = 0
+
+    def add(self, url, created_at):
+        self.rows.append((url, created_at))
+
+    def handler(self):
+        worker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode()
+                worker.bytes_sent += len(body)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                worker.calls.append(f"GET {parsed.path}?{parsed.query}")
+                if self.headers.get("Authorization") != "Bearer t":
+                    return self._reply(401, {})
+                since = parse_qs(parsed.query).get("since", [None])[0]
+                version = max((c for _, c in worker.rows), default="")
+                if since and worker.delta:
+                    added = [u for u, c in worker.rows if c >= since]
+                    return self._reply(200, {"added": added, "version": version})
+                return self._reply(200, {"urls": [u for u, _ in worker.rows], "version": version})
+
+            def do_POST(self):
+                worker.calls.append(f"POST {self.path}")
+                if not worker.check:
+                    return self._reply(404, {"error": "Not found"})
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prefixes = set(payload["prefixes"])
+                hashes = [
+                    h for h in (hashlib.sha256(u.encode()).hexdigest() for u, _ in worker.rows)
+                    if h[:8] in prefixes
+                ]
+                return self._reply(200, {"hashes": hashes})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+@pytest.fixture
+def worker():
+    fake = FakeWorker()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), fake.handler())
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    fake.base_url = f"http://127.0.0.1:{httpd.server_port}"
+    yield fake
+    httpd.shutdown()
+
+
+def test_snapshot_sync_fetches_only_delta(worker, tmp_path):
+    snapshot = str(tmp_path / "known.json")
+    for i in range(50):
+        worker.add(f"https://www.cbs.gov.il/old{i}.pdf", f"2026-01-01 00:00:{i:02d}")
+
+    first = known_urls.sync_known_urls(worker.base_url, "t", snapshot)
+    assert len(first) == 50
+    full_bytes = worker.bytes_sent
+
+    worker.add("https://www.cbs.gov.il/new.pdf", "2026-02-01 00:00:00")
+    second = known_urls.sync_known_urls(worker.base_url, "t", snapshot)
+
+    assert "https://www.cbs.gov.il/new.pdf" in second
+    assert len(second) == 51
+    assert "since=2026-01-01%2000%3A00%3A49" in worker.calls[-1]
+    # The delta response is a fraction of the full list
+    assert worker.bytes_sent - full_bytes < full_bytes / 5
+
+
+def test_snapshot_sync_accepts_full_list_from_old_worker(worker, tmp_path):
+    worker.delta = False
+    snapshot = str(tmp_path / "known.json")
+    worker.add("https://www.cbs.gov.il/a.pdf", "2026-01-01 00:00:00")
+    known_urls.sync_known_urls(worker.base_url, "t", snapshot)
+    worker.add("https://www.cbs.gov.il/b.pdf", "2026-02-01 00:00:00")
+    assert len(known_urls.sync_known_urls(worker.base_url, "t", snapshot)) == 2
+
+
+def test_snapshot_used_when_worker_unreachable(tmp_path):
+    snapshot = str(tmp_path / "known.json")
+    known_urls.save_snapshot(snapshot, {"version": "v", "urls": ["https://www.cbs.gov.il/a.pdf"]})
+    urls = known_urls.sync_known_urls("http://127.0.0.1:9", "t", snapshot)
+    assert urls == {"https://www.cbs.gov.il/a.pdf"}
+
+
+def test_hash_prefix_check_without_snapshot(worker):
+    for i in range(100):
+        worker.add(f"https://www.cbs.gov.il/old{i}.pdf", "2026-01-01 00:00:00")
+    candidates = ["https://www.cbs.gov.il/old7.pdf", "https://www.cbs.gov.il/brand-new.pdf"]
+
+    known = known_urls.known_among(worker.base_url, "t", candidates)
+
+    assert known == {"https://www.cbs.gov.il/old7.pdf"}
+    assert worker.calls == ["POST /api/known-urls/check"]
+
+
+def test_falls_back_to_full_list_without_check_endpoint(worker):
+    worker.check = False
+    worker.add("https://www.cbs.gov.il/a.pdf", "2026-01-01 00:00:00")
+    known = known_urls.known_among(
+        worker.base_url, "t", ["https://www.cbs.gov.il/a.pdf", "https://www.cbs.gov.il/b.pdf"]
+    )
+    assert known == {"https://www.cbs.gov.il/a.pdf"}
+    assert worker.calls[-1].startswith("GET /api/known-urls")
+
+
+def test_no_candidates_no_requests(worker):
+    assert known_urls.known_among(worker.base_url, "t", []) == set()
+    assert worker.calls == []
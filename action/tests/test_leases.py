@@ -0,0 +1,221 @@
+"""Tests for the leased work queue, against an in-memory stand-in for R2."""
+
+import threading
+import time
+from unittest.mock import patch
+
+from action.extract import leases
+
+
+class MemoryStore:
+    """In-memory stand-in for the r2_client conditional-put functions."""
+
+    def __init__(self):
+        self.objects: dict[str, tuple[dict, str]] = {}
+        self._lock = threading.Lock()
+        self._version = 0
+
+    def list_keys(self, prefix):
+        with self._lock:
+            return sorted(k for k in self.objects if k.startswith(prefix))
+
+    def get_json_with_etag(self, key):
+        with self._lock:
+            return self.objects.get(key)
+
+    def put_json_conditional(self, key, data, if_match=None):
+        with self._lock:
+            current = self.objects.get(key)
+            if if_match is None and current is not None:
+                return None
+            if if_match is not None and (current is None or current[1] != if_match):
+                return None
+            self._version += 1
+            etag = f'"{self._version}"'
+            self.objects[key] = (dict(data), etag)
+            return etag
+
+    def object_exists(self, key):
+        with self._lock:
+            return key in self.objects
+
+    def delete_object(self, key):
+        with self._lock:
+            self.objects.pop(key, None)
+
+    def add_request(self, request_id):
+        self.objects[f"{leases.REQUEST_PREFIX}{request_id}.json"] = ({"request_id": request_id}, '"r"')
+
+    def add_result(self, request_id):
+        self.objects[f"{leases.RESULT_PREFIX}{request_id}-result.json"] = ({}, '"r"')
+
+
+def test_only_one_worker_acquires_a_lease():
+    store = MemoryStore()
+    first = leases.acquire_lease(store, "req-1", "a", ttl=60)
+    second = leases.acquire_lease(store, "req-1", "b", ttl=60)
+    assert first is not None and first["owner"] == "a"
+    assert second is None
+
+
+def test_expired_lease_is_taken_over():
+    store = MemoryStore()
+    stale = leases.acquire_lease(store, "req-1", "crashed", ttl=-1)
+    taken = leases.acquire_lease(store, "req-1", "b", ttl=60)
+    assert taken is not None and taken["owner"] == "b"
+    # The crashed owner can no longer renew
+    assert leases.renew_lease(store, stale, ttl=60) is False
+    assert leases.renew_lease(store, taken, ttl=60) is True
+
+
+def test_release_only_expires_own_lease():
+    store = MemoryStore()
+    stale = leases.acquire_lease(store, "req-1", "a", ttl=-1)
+    leases.acquire_lease(store, "req-1", "b", ttl=60)
+    leases.release_lease(store, stale)
+    assert store.get_json_with_etag(leases.lease_key("req-1"))[0]["owner"] == "b"
+
+
+def test_released_lease_can_be_claimed_again():
+    store = MemoryStore()
+    lease = leases.acquire_lease(store, "req-1", "a", ttl=60)
+    leases.release_lease(store, lease)
+    assert leases.acquire_lease(store, "req-1", "b", ttl=60)["owner"] == "b"
+
+
+def test_pending_excludes_completed_requests():
+    store = MemoryStore()
+    for rid in ("req-1", "req-2", "req-3"):
+        store.add_request(rid)
+    store.add_result("req-2")
+    assert sorted(leases.pending_request_ids(store)) == ["req-1", "req-3"]
+
+
+def test_serve_processes_every_request_exactly_once():
+    store = MemoryStore()
+    ids = [f"req-{i}" for i in range(12)]
+    for rid in ids:
+        store.add_request(rid)
+
+    seen = []
+    seen_lock = threading.Lock()
+
+    def process(request_id, lost, last_attempt):
+        time.sleep(0.01)
+        with seen_lock:
+            seen.append(request_id)
+        store.add_result(request_id)
+        return True
+
+    processed = leases.serve(process, workers=4, store=store, ttl=60, idle_polls=1, poll_interval=0)
+
+    assert processed == 12
+    assert sorted(seen) == sorted(ids)
+    assert all(store.get_json_with_etag(k)[0]["released"] for k in store.list_keys(leases.LEASE_PREFIX))
+
+
+def test_heartbeat_keeps_lease_alive_during_slow_request():
+    store = MemoryStore()
+    store.add_request("req-slow")
+    expiries = []
+
+    def process(request_id, lost, last_attempt):
+        lease_body = store.get_json_with_etag(leases.lease_key(request_id))[0]
+        expiries.append(lease_body["expires_at"])
+        time.sleep(0.25)
+        expiries.append(store.get_json_with_etag(leases.lease_key(request_id))[0]["expires_at"])
+        store.add_result(request_id)
+        return True
+
+    leases.worker_loop(store, "w", process, ttl=0.3, idle_polls=1, poll_interval=0)
+    assert expiries[1] > expiries[0]
+
+
+def test_claim_skips_request_finished_after_listing():
+    store = MemoryStore()
+    store.add_request("req-1")
+    store.add_request("req-2")
+    listed = leases.pending_request_ids(store)
+    store.add_result("req-1")  # another worker finishes req-1 and releases
+
+    with patch.object(leases, "pending_request_ids", return_value=listed), \
+         patch.object(leases.random, "shuffle"):
+        lease = leases.claim_next(store, "w", ttl=60)
+
+    assert lease["request_id"] == "req-2"
+    assert store.get_json_with_etag(leases.lease_key("req-1"))[0]["released"]
+
+
+def test_lost_lease_is_signalled_and_not_released():
+    store = MemoryStore()
+    store.add_request("req-1")
+    signalled = []
+
+    def process(request_id, lost, last_attempt):
+        # Another worker takes over the lease mid-request
+        store.objects[leases.lease_key(request_id)] = ({"owner": "other", "expires_at": time.time() + 60}, '"x"')
+        signalled.append(lost.wait(1))
+        store.add_result(request_id)
+        return True
+
+    processed = leases.worker_loop(store, "w", process, ttl=0.15, idle_polls=1, poll_interval=0)
+
+    assert signalled == [True]
+    assert processed == 0
+    assert store.get_json_with_etag(leases.lease_key("req-1"))[0]["owner"] == "other"
+
+
+def test_run_request_writes_nothing_after_losing_its_lease():
+    from action.extract import main as extract_main
+
+    request = {
+        "source": "cbs-publications",
+        "publication_id": "cbs-pub-2026-price01",
+        "file": {"r2_key": "raw-files/cbs/price01/t.pdf", "expected_content": "cpi"},
+        "extraction_schema": {"type": "consumer_price_index", "fields": []},
+    }
+
+    def download(key, path):
+        with open(path, "wb") as f:
+            f.write(b"%PDF-1.4")
+
+    lost = threading.Event()
+    lost.set()
+    with patch.object(extract_main, "read_request", return_value=request), \
+         patch.object(extract_main, "download_pdf", side_effect=download), \
+         patch.object(extract_main, "claim_content", return_value=("unclaimed", None)), \
+         patch.object(extract_main, "read_fingerprint_index", return_value=None), \
+         patch.object(extract_main, "page_fingerprints", return_value=[{"page": 1}]), \
+         patch.object(extract_main, "run_cascade") as cascade, \
+         patch.object(extract_main, "write_result") as write:
+        assert not extract_main.serve_request("req-2026-02-01-002", lost, True)
+
+    cascade.assert_not_called()
+    write.assert_not_called()
+
+
+def test_failed_request_is_retried_until_the_last_attempt():
+    store = MemoryStore()
+    store.add_request("req-1")
+    calls = []
+
+    def process(request_id, lost, last_attempt):
+        calls.append(last_attempt)
+        if last_attempt:
+            store.add_result(request_id)  # the failure result
+        return False
+
+    with patch.object(leases, "RETRY_DELAY", 0):
+        processed = leases.worker_loop(store, "w", process, ttl=60, idle_polls=1, poll_interval=0, max_attempts=3)
+
+    assert calls == [False, False, True]
+    assert processed == 1
+    assert store.list_keys(leases.ATTEMPT_PREFIX) == []
+
+
+def test_pending_skips_requests_waiting_to_retry():
+    store = MemoryStore()
+    store.add_request("req-1")
+    store.add_request("req-2")
+    store.put_json_conditional(leases.attempt_key("req-1"), {"attempts": 1, "retry_after": time.time() + 60})
+    assert leases.pending_request_ids(store) == ["req-2"]
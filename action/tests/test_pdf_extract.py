@@ -14,7 +14,7 @@ import pytest
 
 def test_ai_extract_prompt_construction():
     """Verify the AI extraction prompt includes schema fields and content type."""
-    from extract.ai_extract import extract_data_from_images
+    from action.extract.ai_extract import extract_data_from_images
 
     schema = {
         "type": "housing_price_index",
@@ -34,7 +34,7 @@ def test_ai_extract_prompt_construction():
     ]
 
     with patch.dict(os.environ, {"ANTHRIPIC_API_KEY": "test-key"}):
-        with patch("extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
+        with patch("action.extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
             mock_client = MagicMock()
             mock_client.messages.create.return_value = mock_response
             mock_anthropic.return_value = mock_client
@@ -72,7 +72,7 @@ def test_ai_extract_prompt_construction():
 
 def test_ai_extract_retry_on_invalid_json():
     """Verify retry logic when first response isn't valid JSON."""
-    from extract.ai_extract import extract_data_from_images
+    from action.extract.ai_extract import extract_data_from_images
 
     schema = {"type": "test", "fields": ["value"]}
 
@@ -86,7 +86,7 @@ def test_ai_extract_retry_on_invalid_json():
     ]
 
     with patch.dict(os.environ, {"ANTHRIPIC_API_KEY": "test-key"}):
-        with patch("extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
+        with patch("action.extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
             mock_client = MagicMock()
             mock_client.messages.create.side_effect = [mock_response_bad, mock_response_good]
             mock_anthropic.return_value = mock_client
@@ -108,7 +108,7 @@ def test_ai_extract_retry_on_invalid_json():
 
 def test_ai_extract_json_in_markdown():
     """Verify extraction of JSON from markdown code blocks."""
-    from extract.ai_extract import extract_data_from_images
+    from action.extract.ai_extract import extract_data_from_images
 
     schema = {"type": "test", "fields": ["value"]}
 
@@ -120,7 +120,7 @@ def test_ai_extract_json_in_markdown():
     ]
 
     with patch.dict(os.environ, {"ANTHRIPIC_API_KEY": "test-key"}):
-        with patch("extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
+        with patch("action.extract.ai_extract.anthropic.Anthropic") as mock_anthropic:
             mock_client = MagicMock()
             mock_client.messages.create.return_value = mock_response
             mock_anthropic.return_value = mock_client
@@ -139,7 +139,7 @@ def test_ai_extract_json_in_markdown():
 
 def test_pdf_to_images_no_library():
     """Verify proper error when no PDF library is available."""
-    from extract import pdf_to_images as module
+    from action.extract import pdf_to_images as module
 
     # Temporarily disable both libraries
     orig_pymupdf = module.HAS_PYMUPDF
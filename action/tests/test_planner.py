@@ -0,0 +1,110 @@
+"""Tests for the cost-aware extraction shard planner."""
+
+import threading
+import time
+from unittest.mock import patch
+
+from action.extract import planner
+from action.extract.planner import (
+    estimate_pages,
+    estimate_costs,
+    estimate_cost,
+    plan_shards,
+    merge_groups,
+    publication_groups,
+    DUPLICATE_COST,
+)
+
+
+def test_estimate_pages_from_size():
+    assert estimate_pages(800_000) == 10
+    assert estimate_pages(1_000) == 1
+
+
+def test_estimate_costs_heads_in_parallel():
+    requests = [
+        {"request_id": f"req-{i}", "file": {"r2_key": f"raw-files/{i}.pdf"},
+         "extraction_schema": {"type": "consumer_price_index"}}
+        for i in range(8)
+    ]
+    in_flight = peak = 0
+    lock = threading.Lock()
+
+    def head(key):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.02)
+        with lock:
+            in_flight -= 1
+        if key == "raw-files/7.pdf":
+            raise RuntimeError("404")
+        return {"size": 800_000, "metadata": {"checksum": key}}
+
+    with patch.object(planner, "head_object", side_effect=head):
+        costs, checksums = estimate_costs(requests, max_workers=4)
+
+    assert peak > 1
+    assert costs["req-0"] == estimate_cost(requests[0], 10)
+    assert costs["req-7"] == estimate_cost(requests[7], 1)
+    assert checksums["req-0"] == "raw-files/0.pdf" and checksums["req-7"] == ""
+
+
+def test_estimate_cost_scales_with_schema_and_pages():
+    hpi = {"extraction_schema": {"type": "housing_price_index"}}
+    review = {"extraction_schema": {"type": "review_insights"}}
+    assert estimate_cost(hpi, 1) < estimate_cost(review, 1)
+    assert estimate_cost(review, 150) > 10 * estimate_cost(review, 1)
+
+
+def test_large_report_gets_its_own_shard():
+    costs = {f"req-small-{i}": 25.0 for i in range(10)}
+    costs["req-report"] = 900.0
+
+    plan = plan_shards(costs, shards=3)
+
+    assert len(plan) == 3
+    assert plan[0]["request_ids"] == ["req-report"]
+    small_shards = plan[1:]
+    assert sorted(len(s["request_ids"]) for s in small_shards) == [5, 5]
+    assert sum(len(s["request_ids"]) for s in plan) == 11
+
+
+def test_lpt_balances_makespan():
+    costs = {"a": 7.0, "b": 6.0, "c": 5.0, "d": 4.0, "e": 3.0, "f": 3.0}
+    plan = plan_shards(costs, shards=2)
+    loads = sorted(s["estimated_cost"] for s in plan)
+    assert loads == [14.0, 14.0]
+
+
+def test_fewer_requests_than_shards():
+    plan = plan_shards({"a": 1.0, "b": 2.0}, shards=10)
+    assert [s["request_ids"] for s in plan] == [["b"], ["a"]]
+
+
+def test_copies_of_one_file_share_a_shard_in_order():
+    costs = {"a": 100.0, "b": 100.0, "c": DUPLICATE_COST, "d": 90.0}
+    groups = [["a", "c"], ["b"], ["d"]]
+    plan = plan_shards(costs, shards=3, groups=groups)
+
+    shard_of = {r: i for i, s in enumerate(plan) for r in s["request_ids"]}
+    assert shard_of["a"] == shard_of["c"]
+    together = plan[shard_of["a"]]["request_ids"]
+    assert together.index("a") < together.index("c")
+    assert plan[shard_of["a"]]["estimated_cost"] == 105.0
+
+
+def test_publication_and_duplicate_groups_merge():
+    requests = [
+        {"request_id": "r1", "publication_id": "price01"},
+        {"request_id": "r2", "publication_id": "media-045"},
+        {"request_id": "r3", "publication_id": "price01"},
+        {"request_id": "r4", "publication_id": "review"},
+    ]
+    publications = publication_groups(requests)
+    assert publications == [["r1", "r3"], ["r2"], ["r4"]]
+
+    # r2 is a copy of r3's file: its publication joins price01's shard
+    duplicates = [["r1"], ["r2", "r3"], ["r4"]]
+    assert merge_groups(duplicates, publications) == [["r1", "r2", "r3"], ["r4"]]
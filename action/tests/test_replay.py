@@ -0,0 +1,113 @@
+"""Tests for the record/replay transport and the offline discovery benchmark."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+import requests
+
+from action.discover import bench, cbs_client
+from action.discover.replay import FixtureStore, RecordingAdapter, ReplayAdapter
+
+
+@pytest.fixture
+def live():
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = json.dumps({"value": [{"Name": "050", "path": self.path}]}).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def fresh_client():
+    cbs_client.reset_client()
+    yield
+    cbs_client.reset_client()
+
+
+def _session(adapter):
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def test_record_then_replay_offline(live, tmp_path):
+    url = f"{live}/he/publications/Madad/_api/web/GetFolderByServerRelativeUrl('/x')/Folders?$select=Name"
+    recorded = _session(RecordingAdapter(FixtureStore(str(tmp_path)))).get(url).json()
+
+    replay = ReplayAdapter(FixtureStore(str(tmp_path)))
+    resp = _session(replay).get(url)
+
+    assert resp.status_code == 200
+    assert resp.json() == recorded
+    assert resp.headers["etag"] == '"v1"'
+    assert _session(replay).get(f"{live}/not-recorded").status_code == 404
+    assert replay.missing == [f"{live}/not-recorded"]
+
+
+def test_replay_answers_conditional_requests():
+    store = FixtureStore()
+    store.put("https://www.cbs.gov.il/a", 200, {"value": []}, {"etag": '"e"'})
+    session = _session(ReplayAdapter(store))
+    assert session.get("https://www.cbs.gov.il/a", headers={"If-None-Match": '"e"'}).status_code == 304
+    assert session.get("https://www.cbs.gov.il/a", headers={"If-None-Match": '"old"'}).status_code == 200
+
+
+def test_replay_injects_latency_and_errors():
+    store = FixtureStore()
+    store.put("https://www.cbs.gov.il/a", 200, {"value": []})
+
+    start = time.monotonic()
+    _session(ReplayAdapter(store, latency=0.1)).get("https://www.cbs.gov.il/a")
+    assert time.monotonic() - start >= 0.1
+
+    assert _session(ReplayAdapter(store, error_rate=1.0, error_status=503)).get(
+        "https://www.cbs.gov.il/a"
+    ).status_code == 503
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        _session(ReplayAdapter(store, error_rate=1.0, error_status=0)).get("https://www.cbs.gov.il/a")
+
+
+def test_client_replays_from_env(tmp_path, fresh_client):
+    store = FixtureStore(str(tmp_path))
+    store.put(cbs_client.folders_url("publications", 2026), 200, {"value": [{"Name": "050"}]})
+
+    with patch.dict("os.environ", {"CBS_HTTP_REPLAY": str(tmp_path), "CBS_HTTP_CACHE": ""}):
+        cbs_client.reset_client()
+        assert cbs_client.list_doclib_folders("publications", 2026) == ["050"]
+        # Unrecorded year folder replays as SharePoint's 404: empty, not a failure
+        assert cbs_client.list_doclib_folders("publications", 2027) == []
+        assert cbs_client.request_failures() == 0
+
+
+def test_bench_small_scale():
+    results = bench.bench([10], latency=0.0, concurrency=4)
+    cold, warm = results
+    assert cold["run"] == "cold" and cold["requests"] == 12  # folders + page items + 10 folders
+    assert cold["entries"] == 30 and cold["failures"] == 0
+    assert warm["requests"] == 0 and warm["entries"] == 30
+
+
+def test_bench_injected_errors_are_retried():
+    # One worker, so the seeded errors hit the same requests on every run
+    cold, warm = bench.bench([10], latency=0.0, error_rate=0.3, concurrency=1, backoff=0)
+    assert cold["retries"] > 0
+    assert cold["requests"] == 12 + cold["retries"]
+    assert cold["failures"] == 0 and cold["entries"] == 30
@@ -0,0 +1,73 @@
+"""Tests for span tracing and opt-in profiling."""
+
+import os
+
+import pytest
+
+from action import tracing
+from action.tracing import configure, load_spans, shutdown, span, summarize, traced
+
+
+@pytest.fixture
+def trace_file(tmp_path):
+    path = str(tmp_path / "trace.jsonl")
+    yield path
+    shutdown()
+
+
+@traced("stage.work")
+def work(n):
+    return sum(range(n))
+
+
+def test_disabled_tracing_is_a_no_op(tmp_path):
+    shutdown()
+    with span("anything", x=1) as attrs:
+        attrs["y"] = 2
+    assert work(10) == 45
+    assert tracing._tracer is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_spans_nest_and_record_errors(trace_file):
+    configure(trace_file, run="run-1")
+    with span("outer", section="publications") as attrs:
+        assert work(10) == 45
+        attrs["folders"] = 3
+    with pytest.raises(ValueError):
+        with span("failing"):
+            raise ValueError("boom")
+    shutdown()
+
+    inner, outer, failing = load_spans(trace_file)
+    assert inner["name"] == "stage.work" and inner["parent_id"] == outer["span_id"]
+    assert outer["parent_id"] is None
+    assert outer["section"] == "publications" and outer["folders"] == 3
+    assert outer["duration_ms"] >= inner["duration_ms"] >= 0
+    assert {s["run"] for s in (inner, outer, failing)} == {"run-1"}
+    assert failing["status"] == "error" and failing["error"] == "ValueError: boom"
+
+
+def test_profiles_and_memory_snapshots_for_chosen_stages(trace_file):
+    configure(trace_file, profile=("stage",), memory=("stage.work",))
+    work(1000)
+    with span("other"):
+        pass
+    shutdown()
+
+    profiled, other = load_spans(trace_file)
+    assert os.path.exists(profiled["profile"])
+    assert profiled["mem_peak_kib"] >= 0
+    assert os.path.exists(profiled["profile"].replace(".prof", ".mem.txt"))
+    assert "profile" not in other and "mem_peak_kib" not in other
+
+
+def test_summary_orders_by_total_time():
+    spans = [
+        {"name": "r2.download_pdf", "duration_ms": 50.0, "status": "ok"},
+        {"name": "ai_extract", "duration_ms": 900.0, "status": "ok"},
+        {"name": "r2.download_pdf", "duration_ms": 70.0, "status": "error"},
+    ]
+    ai, r2 = summarize(spans)
+    assert ai["name"] == "ai_extract"
+    assert r2 == {"name": "r2.download_pdf", "count": 2, "total_ms": 120.0, "max_ms": 70.0, "errors": 1}
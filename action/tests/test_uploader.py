@@ -0,0 +1,156 @@
+"""Tests for the manifest uploader, against a local stand-in for the Worker."""
+
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from action.discover.uploader import ManifestUploader, idempotency_key, load_spool
+
+
+class FakeManifestWorker:
+    """In-process /api/manifest that records batches and can inject failures."""
+
+    def __init__(self):
+        self.batches: list[list[dict]] = []
+        self.encodings: list[str] = []
+        self.fail_statuses: list[int] = []  # consumed one per request
+        self.html_replies = 0  # 200s with an HTML body, before the real ones
+        self.delay = 0.0
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def handler(self):
+        worker = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                with worker.lock:
+                    worker.in_flight += 1
+                    worker.peak = max(worker.peak, worker.in_flight)
+                    status = worker.fail_statuses.pop(0) if worker.fail_statuses else 200
+                    html = status == 200 and worker.html_replies > 0
+                    if html:
+                        worker.html_replies -= 1
+                try:
+                    time.sleep(worker.delay)
+                    body = self.rfile.read(int(self.headers["Content-Length"]))
+                    encoding = self.headers.get("Content-Encoding", "")
+                    if encoding == "gzip":
+                        body = gzip.decompress(body)
+                    if html:
+                        out = b"<html><body>Gateway page</body></html>"
+                        self.send_response(200)
+                        self.send_header("Content-Type", "text/html")
+                        self.send_header("Content-Length", str(len(out)))
+                        self.end_headers()
+                        self.wfile.write(out)
+                        return
+                    if status == 200:
+                        entries = json.loads(body)["entries"]
+                        with worker.lock:
+                            worker.batches.append(entries)
+                            worker.encodings.append(encoding)
+                        payload = {"processed": len(entries), "errors": 0, "pdf_requests": 0}
+                    else:
+                        payload = {"error": "unavailable"}
+                    out = json.dumps(payload).encode()
+                    self.send_response(status)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(out)))
+                    self.end_headers()
+                    self.wfile.write(out)
+                finally:
+                    with worker.lock:
+                        worker.in_flight -= 1
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def delivered_urls(self):
+        return [e["url"] for batch in self.batches for e in batch]
+
+
+@pytest.fixture
+def worker():
+    fake = FakeManifestWorker()
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), fake.handler())
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    fake.base_url = f"http://127.0.0.1:{httpd.server_port}"
+    yield fake
+    httpd.shutdown()
+
+
+def _entries(n, prefix="f"):
+    return [{"url": f"https://www.cbs.gov.il/{prefix}{i}.pdf"} for i in range(n)]
+
+
+def test_concurrent_gzip_batches_with_idempotency_keys(worker):
+    worker.delay = 0.05
+    uploader = ManifestUploader(worker.base_url, "t", concurrency=4, batch_size=5)
+    uploader.submit(_entries(60))
+    uploader.submit(_entries(5))  # repeats are dropped
+    processed, errors = uploader.close()
+
+    assert (processed, errors) == (60, 0)
+    assert sorted(worker.delivered_urls()) == sorted(e["url"] for e in _entries(60))
+    assert set(worker.encodings) == {"gzip"}
+    assert worker.peak > 1
+    entry = worker.batches[0][0]
+    assert entry["idempotency_key"] == idempotency_key(entry)
+
+
+def test_retries_server_errors_without_losing_entries(worker):
+    worker.fail_statuses = [503, 502]
+    uploader = ManifestUploader(worker.base_url, "t", concurrency=1, batch_size=10, backoff=0.01)
+    uploader.submit(_entries(10))
+    processed, errors = uploader.close()
+
+    assert (processed, errors) == (10, 0)
+    assert len(worker.delivered_urls()) == 10
+
+
+def test_undelivered_entries_are_spooled_and_replayed_first(worker, tmp_path):
+    spool = str(tmp_path / "spool.json")
+    worker.fail_statuses = [401]  # not retried
+    first = ManifestUploader(worker.base_url, "t", spool_path=spool, concurrency=1, batch_size=10)
+    first.submit(_entries(3, "old"))
+    assert first.close() == (0, 1)
+    assert len(load_spool(spool)) == 3
+
+    second = ManifestUploader(worker.base_url, "t", spool_path=spool, concurrency=1, batch_size=10)
+    second.submit(_entries(2, "new"))
+    assert second.close() == (5, 0)
+
+    assert worker.delivered_urls()[:3] == [e["url"] for e in _entries(3, "old")]
+    assert load_spool(spool) == []
+
+
+def test_non_json_200_is_retried_then_spooled(worker, tmp_path):
+    spool = str(tmp_path / "spool.json")
+    worker.html_replies = 3
+    uploader = ManifestUploader(worker.base_url, "t", spool_path=spool, concurrency=1,
+                                batch_size=10, retries=2, backoff=0.01)
+    uploader.submit(_entries(4))
+    assert uploader.close() == (0, 1)
+    assert [e["url"] for e in load_spool(spool)] == [e["url"] for e in _entries(4)]
+    assert uploader.batch_size < 10
+
+
+def test_batch_size_adapts_to_latency(worker):
+    uploader = ManifestUploader(worker.base_url, "t", concurrency=1, batch_size=4, target_latency=0.1)
+    uploader.submit(_entries(40))
+    uploader.close()
+    assert uploader.batch_size > 4
+
+    worker.delay = 0.15
+    slow = ManifestUploader(worker.base_url, "t", concurrency=1, batch_size=8, target_latency=0.1)
+    slow.submit(_entries(8))
+    slow.close()
+    assert slow.batch_size == 4
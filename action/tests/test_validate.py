@@ -1,6 +1,6 @@
 """Tests for the extraction validation module."""
 
-from extract.validate import validate_extraction
+from action.extract.validate import validate_extraction
 
 
 def test_housing_price_index_valid():
@@ -0,0 +1,267 @@
+"""Span tracing and opt-in profiling for the discover and extract runs.
+
+    TRACE_FILE=.trace/extract.jsonl python -m action.extract.main
+
+With TRACE_FILE set, every span (a CBS request, an R2 call, page rendering,
+a model call, validation, a whole extraction request) appends one JSON line
+to it when it ends:
+
+    {"name": "r2.download_pdf", "span_id": "...", "parent_id": "...",
+     "run": "...", "pid": 123, "thread": "...", "start": 1760000000.0,
+     "duration_ms": 84.2, "status": "ok", ...span attributes}
+
+Spans nest per thread through parent_id. Hot stages can also be profiled,
+chosen by span name or by the prefix before the first "." ("r2" matches
+every r2.* span):
+
+    TRACE_PROFILE=pdf_to_images,ai_extract   cProfile each matching span into
+                                             <trace dir>/<name>-<span_id>.prof
+    TRACE_MEMORY=pdf_to_images               tracemalloc: the span records
+                                             mem_peak_kib and writes its top
+                                             allocations to <...>.mem.txt
+
+Only one cProfile profiler can run at a time, so with several workers some
+matching spans go unprofiled (profiled: false). The tracemalloc peak is
+process-wide. Without TRACE_FILE, span() returns a shared no-op and traced
+functions are called straight through.
+
+    python -m action.tracing summary .trace/extract.jsonl
+
+prints time per span name, slowest first.
+"""
+
+from __future__ import annotations
+
+import os
+import sys
+import json
+import time
+import uuid
+import atexit
+import cProfile
+import argparse
+import threading
+import functools
+import tracemalloc
+from typing import Any, Callable, Optional
+
+TOP_ALLOCATIONS = 25
+
+
+class Tracer:
+    """Writes finished spans to a JSONL file and runs the opt-in profilers."""
+
+    def __init__(self, path: str, profile: tuple[str, ...] = (), memory: tuple[str, ...] = (), run: str = ""):
+        self.path = path
+        self.directory = os.path.dirname(path) or "."
+        self.profile = frozenset(profile)
+        self.memory = frozenset(memory)
+        self.run = run or uuid.uuid4().hex[:12]
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def stack(self) -> list[str]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def wants(self, stages: frozenset[str], name: str) -> bool:
+        return bool(stages) and (name in stages or name.split(".", 1)[0] in stages)
+
+    def write(self, record: dict[str, Any]) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line + "\n")
+                self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "attrs", "span_id", "parent_id", "start", "t0", "profiler", "memory")
+
+    def __init__(self, tracer: Tracer, name: str, attrs: dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.profiler: Optional[cProfile.Profile] = None
+        self.memory = False
+
+    def __enter__(self) -> dict[str, Any]:
+        tracer = self.tracer
+        stack = tracer.stack()
+        self.parent_id = stack[-1] if stack else None
+        self.span_id = uuid.uuid4().hex[:16]
+        stack.append(self.span_id)
+
+        if tracer.wants(tracer.memory, self.name):
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.memory = True
+        if tracer.wants(tracer.profile, self.name):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+                self.profiler = profiler
+            except ValueError:  # another span's profiler is active
+                self.attrs["profiled"] = False
+
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.t0
+        tracer = self.tracer
+        base = os.path.join(tracer.directory, f"{self.name}-{self.span_id}")
+
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(f"{base}.prof")
+            self.attrs["profile"] = f"{base}.prof"
+        if self.memory:
+            _, peak = tracemalloc.get_traced_memory()
+            self.attrs["mem_peak_kib"] = round(peak / 1024, 1)
+            stats = tracemalloc.take_snapshot().statistics("lineno")[:TOP_ALLOCATIONS]
+            with open(f"{base}.mem.txt", "w") as f:
+                f.write("\n".join(str(s) for s in stats) + "\n")
+
+        stack = tracer.stack()
+        if stack and stack[-1] == self.span_id:
+            stack.pop()
+
+        record = {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "run": tracer.run,
+            "pid": os.getpid(),
+            "thread": threading.current_thread().name,
+            "start": round(self.start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "status": "error" if exc_type else "ok",
+        }
+        if exc_type:
+            record["error"] = f"{exc_type.__name__}: {exc}"
+        record.update(self.attrs)
+        tracer.write(record)
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> dict[str, Any]:
+        return {}
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        return None
+
+
+_NO_SPAN = _NoSpan()
+_tracer: Optional[Tracer] = None
+
+
+def configure(
+    path: str,
+    profile: tuple[str, ...] = (),
+    memory: tuple[str, ...] = (),
+    run: str = "",
+) -> Optional[Tracer]:
+    """Start writing spans to path (an empty path turns tracing off)."""
+    global _tracer
+    shutdown()
+    _tracer = Tracer(path, profile, memory, run) if path else None
+    return _tracer
+
+
+def _stages(value: str) -> tuple[str, ...]:
+    return tuple(s.strip() for s in value.split(",") if s.strip())
+
+
+def configure_from_env() -> Optional[Tracer]:
+    """configure() from TRACE_FILE, TRACE_PROFILE, TRACE_MEMORY and the
+    GitHub run ID; the trace is closed at exit."""
+    tracer = configure(
+        os.environ.get("TRACE_FILE", ""),
+        _stages(os.environ.get("TRACE_PROFILE", "")),
+        _stages(os.environ.get("TRACE_MEMORY", "")),
+        os.environ.get("GITHUB_RUN_ID", ""),
+    )
+    if tracer:
+        atexit.register(shutdown)
+    return tracer
+
+
+def shutdown() -> None:
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def span(name: str, **attrs: Any):
+    """Context manager timing a block as a span; yields its attribute dict,
+    which the block may add to (e.g. a response status)."""
+    tracer = _tracer
+    if tracer is None:
+        return _NO_SPAN
+    return _Span(tracer, name, attrs)
+
+
+def traced(name: str) -> Callable[[Callable], Callable]:
+    """Decorator running each call of a function as a span."""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            tracer = _tracer
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with _Span(tracer, name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def load_spans(path: str) -> list[dict[str, Any]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(spans: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Count, total, max and errors per span name, by total time."""
+    by_name: dict[str, dict[str, Any]] = {}
+    for s in spans:
+        row = by_name.setdefault(s["name"], {"name": s["name"], "count": 0, "total_ms": 0.0, "max_ms": 0.0, "errors": 0})
+        row["count"] += 1
+        row["total_ms"] += s["duration_ms"]
+        row["max_ms"] = max(row["max_ms"], s["duration_ms"])
+        row["errors"] += s["status"] != "ok"
+    return sorted(by_name.values(), key=lambda r: -r["total_ms"])
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Summarize a span trace")
+    parser.add_argument("command", choices=["summary"])
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    spans = [s for path in args.paths for s in load_spans(path)]
+    print(f"{'span':<32} {'count':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'errors':>7}")
+    for r in summarize(spans):
+        mean = r["total_ms"] / r["count"]
+        print(f"{r['name']:<32} {r['count']:>7} {r['total_ms'] / 1000:>9.2f} {mean:>9.1f} {r['max_ms']:>9.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
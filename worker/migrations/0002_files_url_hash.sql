@@ -0,0 +1,7 @@
+-- SHA-256 of files.download_url, for POST /api/known-urls/check. SQLite has
+-- no SHA-256, so rows from before this migration are hashed by the Worker
+-- (backfillUrlHashes) the first time the check runs.
+ALTER TABLE files ADD COLUMN url_hash TEXT;
+ALTER TABLE files ADD COLUMN url_hash_prefix TEXT; -- first URL_HASH_PREFIX_LENGTH hex chars of url_hash
+
+CREATE INDEX IF NOT EXISTS idx_files_url_hash_prefix ON files(url_hash_prefix);
@@ -0,0 +1,7 @@
+-- Idempotency keys of manifest entries already taken on by POST /api/manifest,
+-- so a retried upload is skipped across requests, not only within one batch
+CREATE TABLE IF NOT EXISTS manifest_keys (
+  idempotency_key TEXT PRIMARY KEY,
+  download_url TEXT NOT NULL,
+  created_at TEXT DEFAULT (datetime('now'))
+);
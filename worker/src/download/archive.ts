@@ -1,4 +1,4 @@
-import type { DownloadedFile, FileRecord, PublicationRecord, PipelineError } from '../types';
+import type { DownloadedFile, FileRecord, ManifestEntry, PublicationRecord, PipelineError } from '../types';
 import { uploadFile } from '../storage/r2';
 import { insertPublication, insertFile } from '../storage/d1';
 
@@ -33,6 +33,23 @@ function buildR2Key(file: DownloadedFile): string {
   }
 }
 
+// Copies of a file under other publications, grouped by discovery into
+// metadata.duplicates. They share the downloaded bytes and R2 object but
+// each gets its own publication and file row. A ZIP member inherits its
+// archive's copies at the same #member suffix.
+export function copiesOf(entry: ManifestEntry): ManifestEntry[] {
+  const duplicates = (entry.metadata.duplicates ?? []) as ManifestEntry[];
+  const hash = entry.url.indexOf('#');
+  const member = hash >= 0 ? entry.url.slice(hash) : '';
+  return duplicates.map((copy) => ({
+    ...copy,
+    url: `${copy.url}${member}`,
+    filename: member ? entry.filename : copy.filename,
+    format: entry.format,
+    metadata: { ...copy.metadata, duplicate_of: entry.url },
+  }));
+}
+
 export async function archiveFiles(
   bucket: R2Bucket,
   db: D1Database,
@@ -42,16 +59,17 @@ export async function archiveFiles(
   const errors: PipelineError[] = [];
 
   // Group files by publication for batch publication creation
-  const pubMap = new Map<string, DownloadedFile>();
+  const pubMap = new Map<string, ManifestEntry>();
   for (const file of files) {
-    if (!pubMap.has(file.manifest_entry.publication_id)) {
-      pubMap.set(file.manifest_entry.publication_id, file);
+    for (const entry of [file.manifest_entry, ...copiesOf(file.manifest_entry)]) {
+      if (!pubMap.has(entry.publication_id)) {
+        pubMap.set(entry.publication_id, entry);
+      }
     }
   }
 
   // Create publication records
-  for (const [pubId, sampleFile] of pubMap) {
-    const entry = sampleFile.manifest_entry;
+  for (const [pubId, entry] of pubMap) {
     const pub: PublicationRecord = {
       id: pubId,
       source_id: entry.source,
@@ -102,6 +120,18 @@ export async function archiveFiles(
 
       await insertFile(db, record);
       fileRecords.push(record);
+
+      for (const copy of copiesOf(entry)) {
+        const copyRecord: FileRecord = {
+          ...record,
+          id: `${copy.publication_id}:${copy.filename}`,
+          publication_id: copy.publication_id,
+          filename: copy.filename,
+          download_url: copy.url,
+        };
+        await insertFile(db, copyRecord);
+        fileRecords.push(copyRecord);
+      }
     } catch (err) {
       const errMsg = err instanceof Error ? err.message : String(err);
       console.error(`Archive failed for ${entry.filename}:`, errMsg);
@@ -2,7 +2,7 @@ import type { Env } from './types';
 import { runPipeline } from './pipeline/orchestrator';
 import { handleIngest } from './routes/ingest';
 import { handleManifest } from './routes/manifest';
-import { handleKnownUrls } from './routes/known-urls';
+import { handleKnownUrls, handleKnownUrlsCheck } from './routes/known-urls';
 import { handleStatus } from './routes/status';
 import { handleTrigger } from './routes/trigger';
 import { handleHealth } from './routes/health';
@@ -45,6 +45,9 @@ export default {
         case path === '/api/known-urls' && request.method === 'GET':
           response = await handleKnownUrls(request, env);
           break;
+        case path === '/api/known-urls/check' && request.method === 'POST':
+          response = await handleKnownUrlsCheck(request, env);
+          break;
         case path === '/api/status' && request.method === 'GET':
           response = await handleStatus(request, env);
           break;
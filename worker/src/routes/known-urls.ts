@@ -1,39 +1,131 @@
 import type { Env } from '../types';
+import { backfillUrlHashes } from '../storage/d1';
+import { URL_HASH_PREFIX_LENGTH } from '../utils/hash';
+
+// D1 allows 100 bound parameters per query
+const MAX_BOUND_PREFIXES = 100;
+
+interface KnownUrlRow {
+  download_url: string;
+  created_at?: string;
+}
+
+interface UrlHashRow {
+  url_hash: string;
+}
+
+interface CheckPayload {
+  sources?: string[];
+  prefixes?: string[];
+}
+
+function isAuthorized(request: Request, env: Env): boolean {
+  const auth = request.headers.get('Authorization');
+  return !!auth && auth === `Bearer ${env.INGEST_AUTH_TOKEN}`;
+}
+
+function sourceConditions(sources: string[]): string[] {
+  const conditions: string[] = [];
+  if (sources.length === 0 || sources.includes('cbs-publications')) {
+    conditions.push("publication_id LIKE 'cbs-pub-%'");
+  }
+  if (sources.length === 0 || sources.includes('cbs-media')) {
+    conditions.push("publication_id LIKE 'cbs-media-%'");
+  }
+  return conditions;
+}
+
+// Snapshot version: the newest files.created_at among the returned rows
+function latestVersion(rows: KnownUrlRow[], floor: string): string {
+  return rows.reduce((max, r) => ((r.created_at ?? '') > max ? (r.created_at as string) : max), floor);
+}
 
 export async function handleKnownUrls(request: Request, env: Env): Promise<Response> {
   // Validate auth
-  const auth = request.headers.get('Authorization');
-  if (!auth || auth !== `Bearer ${env.INGEST_AUTH_TOKEN}`) {
+  if (!isAuthorized(request, env)) {
     return new Response('Unauthorized', { status: 401 });
   }
 
   try {
     const url = new URL(request.url);
     const sources = url.searchParams.getAll('source');
+    const since = url.searchParams.get('since');
 
-    const conditions: string[] = [];
-    if (sources.length === 0 || sources.includes('cbs-publications')) {
-      conditions.push("publication_id LIKE 'cbs-pub-%'");
-    }
-    if (sources.length === 0 || sources.includes('cbs-media')) {
-      conditions.push("publication_id LIKE 'cbs-media-%'");
-    }
-
+    const conditions = sourceConditions(sources);
     if (conditions.length === 0) {
       return Response.json({ urls: [], count: 0 });
     }
 
     const where = conditions.join(' OR ');
+
+    // Delta since a client snapshot version. >= so rows created in the same
+    // second as the snapshot are not missed; the client unions them.
+    if (since) {
+      const result = await env.DB
+        .prepare(`SELECT download_url, created_at FROM files WHERE (${where}) AND created_at >= ?`)
+        .bind(since)
+        .all<KnownUrlRow>();
+
+      const added = result.results.map((r) => r.download_url);
+      return Response.json({ added, count: added.length, version: latestVersion(result.results, since) });
+    }
+
     const result = await env.DB
-      .prepare(`SELECT download_url FROM files WHERE ${where}`)
-      .all<{ download_url: string }>();
+      .prepare(`SELECT download_url, created_at FROM files WHERE ${where}`)
+      .all<KnownUrlRow>();
 
     const urls = result.results.map((r) => r.download_url);
 
-    return Response.json({ urls, count: urls.length });
+    return Response.json({ urls, count: urls.length, version: latestVersion(result.results, '') });
   } catch (err) {
     const errMsg = err instanceof Error ? err.message : String(err);
     console.error('Known URLs handler error:', errMsg);
     return Response.json({ error: errMsg }, { status: 500 });
   }
 }
+
+// Membership check by hash prefix: the client sends SHA-256 prefixes of its
+// few candidate URLs and gets back the full hashes of known URLs sharing
+// them, so neither side transfers the whole URL list.
+export async function handleKnownUrlsCheck(request: Request, env: Env): Promise<Response> {
+  // Validate auth
+  if (!isAuthorized(request, env)) {
+    return new Response('Unauthorized', { status: 401 });
+  }
+
+  try {
+    const payload = (await request.json()) as CheckPayload;
+    const prefixes = [...new Set((payload.prefixes ?? []).map((p) => p.slice(0, URL_HASH_PREFIX_LENGTH)))];
+
+    const conditions = sourceConditions(payload.sources ?? []);
+    if (conditions.length === 0 || prefixes.length === 0) {
+      return Response.json({ hashes: [], count: 0 });
+    }
+
+    // Rows inserted before url_hash existed; a single index lookup once filled
+    let filled: number;
+    do {
+      filled = await backfillUrlHashes(env.DB);
+    } while (filled > 0);
+
+    // Looked up through idx_files_url_hash_prefix instead of hashing every
+    // row, in chunks under D1's limit on bound parameters
+    const hashes: string[] = [];
+    for (let i = 0; i < prefixes.length; i += MAX_BOUND_PREFIXES) {
+      const chunk = prefixes.slice(i, i + MAX_BOUND_PREFIXES);
+      const result = await env.DB
+        .prepare(
+          `SELECT url_hash FROM files WHERE url_hash_prefix IN (${chunk.map(() => '?').join(', ')}) AND (${conditions.join(' OR ')})`
+        )
+        .bind(...chunk)
+        .all<UrlHashRow>();
+      hashes.push(...result.results.map((r) => r.url_hash));
+    }
+
+    return Response.json({ hashes, count: hashes.length });
+  } catch (err) {
+    const errMsg = err instanceof Error ? err.message : String(err);
+    console.error('Known URLs check error:', errMsg);
+    return Response.json({ error: errMsg }, { status: 500 });
+  }
+}
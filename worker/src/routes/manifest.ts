@@ -1,5 +1,5 @@
 import type { Env, ManifestEntry, PipelineError } from '../types';
-import { getFileByDownloadUrl, insertHousingPriceIndex, insertAvgApartmentPrices, insertConsumerPriceIndex, insertReviewInsights, updateFileExtractionStatus } from '../storage/d1';
+import { claimManifestKey, releaseManifestKeys, getFileByDownloadUrl, insertHousingPriceIndex, insertAvgApartmentPrices, insertConsumerPriceIndex, insertReviewInsights, updateFileExtractionStatus } from '../storage/d1';
 import { downloadFiles } from '../download/downloader';
 import { archiveFiles } from '../download/archive';
 import { extractFiles } from '../extraction/router';
@@ -9,6 +9,23 @@ interface ManifestPayload {
   entries: ManifestEntry[];
 }
 
+// Discovery gzips large manifests (Content-Encoding: gzip). Check the magic
+// bytes rather than trusting the header alone, in case the body was already
+// decoded upstream.
+async function readPayload(request: Request): Promise<ManifestPayload> {
+  const encoding = request.headers.get('Content-Encoding') ?? '';
+  if (!encoding.toLowerCase().includes('gzip')) {
+    return (await request.json()) as ManifestPayload;
+  }
+
+  const body = new Uint8Array(await request.arrayBuffer());
+  if (body.length < 2 || body[0] !== 0x1f || body[1] !== 0x8b) {
+    return JSON.parse(new TextDecoder().decode(body)) as ManifestPayload;
+  }
+  const stream = new Blob([body]).stream().pipeThrough(new DecompressionStream('gzip'));
+  return (await new Response(stream).json()) as ManifestPayload;
+}
+
 export async function handleManifest(request: Request, env: Env): Promise<Response> {
   // Validate auth
   const auth = request.headers.get('Authorization');
@@ -16,23 +33,33 @@ export async function handleManifest(request: Request, env: Env): Promise<Respon
     return new Response('Unauthorized', { status: 401 });
   }
 
+  const claimed = new Map<string, string>(); // url -> idempotency key
   try {
-    const payload = (await request.json()) as ManifestPayload;
+    const payload = await readPayload(request);
     const entries = payload.entries ?? [];
 
     if (entries.length === 0) {
       return Response.json({ processed: 0, errors: 0, pdf_requests: 0 });
     }
 
-    // Filter out duplicates — skip entries whose URL is already in D1
+    // Filter out duplicates — skip entries repeated in this batch, whose URL
+    // is already in D1, or whose idempotency key an earlier request (a
+    // retried upload) already claimed in manifest_keys
     const newEntries: ManifestEntry[] = [];
+    const seen = new Set<string>();
     for (const entry of entries) {
+      const key = entry.idempotency_key ?? entry.url;
+      if (seen.has(key)) {
+        continue;
+      }
+      seen.add(key);
       const existing = await getFileByDownloadUrl(env.DB, entry.url);
-      if (existing) {
+      if (existing || !(await claimManifestKey(env.DB, key, entry.url))) {
         console.log(`Manifest: skipping duplicate ${entry.url}`);
-      } else {
-        newEntries.push(entry);
+        continue;
       }
+      claimed.set(entry.url, key);
+      newEntries.push(entry);
     }
 
     if (newEntries.length === 0) {
@@ -53,6 +80,14 @@ export async function handleManifest(request: Request, env: Env): Promise<Respon
     const archiveResult = await archiveFiles(env.STORAGE, env.DB, downloadResult.files);
     errors.push(...archiveResult.errors);
 
+    // Entries that failed to download or archive can be retried later (ZIP
+    // members are archived as <zip url>#<member>)
+    const archived = archiveResult.fileRecords.map((r) => r.download_url);
+    const unarchived = newEntries.filter(
+      (e) => !archived.some((url) => url === e.url || url.startsWith(`${e.url}#`))
+    );
+    await releaseManifestKeys(env.DB, unarchived.map((e) => claimed.get(e.url) as string));
+
     // Phase 3: Extract inline (XLSX, DOCX)
     console.log(`Manifest: extracting data...`);
     const extractionResult = await extractFiles(
@@ -118,6 +153,8 @@ export async function handleManifest(request: Request, env: Env): Promise<Respon
   } catch (err) {
     const errMsg = err instanceof Error ? err.message : String(err);
     console.error('Manifest handler error:', errMsg);
+    // Let a retry take these entries on again; archived ones are in D1 already
+    await releaseManifestKeys(env.DB, [...claimed.values()]).catch(() => undefined);
     return Response.json({ error: errMsg }, { status: 500 });
   }
 }
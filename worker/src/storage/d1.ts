@@ -9,6 +9,7 @@ import type {
   PipelineRun,
   PipelineError,
 } from '../types';
+import { sha256Hex, URL_HASH_PREFIX_LENGTH } from '../utils/hash';
 
 export async function insertPublication(db: D1Database, pub: PublicationRecord): Promise<void> {
   await db
@@ -43,10 +44,11 @@ export async function updatePublicationStatus(
 }
 
 export async function insertFile(db: D1Database, file: FileRecord): Promise<void> {
+  const urlHash = await sha256Hex(file.download_url);
   await db
     .prepare(
-      `INSERT OR IGNORE INTO files (id, publication_id, filename, format, download_url, r2_key, file_size_bytes, checksum_sha256, is_preferred_format, extraction_status, extraction_request_id)
-       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`
+      `INSERT OR IGNORE INTO files (id, publication_id, filename, format, download_url, r2_key, file_size_bytes, checksum_sha256, is_preferred_format, extraction_status, extraction_request_id, url_hash, url_hash_prefix)
+       VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)`
     )
     .bind(
       file.id,
@@ -59,11 +61,34 @@ export async function insertFile(db: D1Database, file: FileRecord): Promise<void
       file.checksum_sha256,
       file.is_preferred_format ? 1 : 0,
       file.extraction_status,
-      file.extraction_request_id ?? null
+      file.extraction_request_id ?? null,
+      urlHash,
+      urlHash.slice(0, URL_HASH_PREFIX_LENGTH)
     )
     .run();
 }
 
+// Hash files inserted before url_hash existed, a batch at a time; returns the
+// number of rows filled (0 once every row has its hash)
+export async function backfillUrlHashes(db: D1Database, limit = 500): Promise<number> {
+  const result = await db
+    .prepare(`SELECT id, download_url FROM files WHERE url_hash_prefix IS NULL LIMIT ?`)
+    .bind(limit)
+    .all<{ id: string; download_url: string }>();
+  if (result.results.length === 0) {
+    return 0;
+  }
+
+  const update = db.prepare(`UPDATE files SET url_hash = ?, url_hash_prefix = ? WHERE id = ?`);
+  const statements = [];
+  for (const row of result.results) {
+    const urlHash = await sha256Hex(row.download_url);
+    statements.push(update.bind(urlHash, urlHash.slice(0, URL_HASH_PREFIX_LENGTH), row.id));
+  }
+  await db.batch(statements);
+  return statements.length;
+}
+
 export async function updateFileExtractionStatus(
   db: D1Database,
   fileId: string,
@@ -78,6 +103,28 @@ export async function updateFileExtractionStatus(
     .run();
 }
 
+// Take on a manifest entry by its idempotency key. Returns false if an
+// earlier (or concurrent) manifest request already did.
+export async function claimManifestKey(db: D1Database, key: string, url: string): Promise<boolean> {
+  const result = await db
+    .prepare(
+      `INSERT INTO manifest_keys (idempotency_key, download_url) VALUES (?, ?)
+       ON CONFLICT (idempotency_key) DO NOTHING`
+    )
+    .bind(key, url)
+    .run();
+  return result.meta.changes > 0;
+}
+
+// Give keys back so a later retry can process those entries again
+export async function releaseManifestKeys(db: D1Database, keys: string[]): Promise<void> {
+  if (keys.length === 0) {
+    return;
+  }
+  const remove = db.prepare(`DELETE FROM manifest_keys WHERE idempotency_key = ?`);
+  await db.batch(keys.map((key) => remove.bind(key)));
+}
+
 export async function getFileByDownloadUrl(
   db: D1Database,
   url: string
@@ -18,6 +18,7 @@ export interface ManifestEntry {
   publish_date: string; // ISO 8601
   metadata: Record<string, unknown>;
   is_new: boolean;
+  idempotency_key?: string; // SHA-256 of url, set by the discovery uploader
 }
 
 // Downloaded file ready for archiving
@@ -0,0 +1,10 @@
+// Hex characters of SHA-256(url) stored in files.url_hash_prefix and
+// compared by POST /api/known-urls/check
+export const URL_HASH_PREFIX_LENGTH = 8;
+
+export async function sha256Hex(text: string): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest))
+    .map((b) => b.toString(16).padStart(2, '0'))
+    .join('');
+}
@@ -0,0 +1,70 @@
+import { describe, it, expect, vi, beforeEach } from 'vitest';
+
+vi.mock('../src/storage/r2', () => ({
+  uploadFile: vi.fn(),
+}));
+
+vi.mock('../src/storage/d1', () => ({
+  insertPublication: vi.fn(),
+  insertFile: vi.fn(),
+}));
+
+import { archiveFiles, copiesOf } from '../src/download/archive';
+import { uploadFile } from '../src/storage/r2';
+import { insertPublication, insertFile } from '../src/storage/d1';
+import type { ManifestEntry } from '../src/types';
+
+const copy: ManifestEntry = {
+  source: 'cbs-publications',
+  url: 'https://www.cbs.gov.il/he/publications/Madad/DocLib/2026/price01aa/aa2_1.pdf',
+  filename: 'aa2_1.pdf',
+  format: 'pdf',
+  publication_id: 'cbs-pub-2026-price01aa',
+  publish_date: '2026-02-15T00:00:00Z',
+  metadata: { title: 'Price indexes', year: '2026', folder: 'price01aa' },
+  is_new: true,
+};
+
+const primary: ManifestEntry = {
+  source: 'cbs-media',
+  url: 'https://www.cbs.gov.il/he/mediarelease/Madad/DocLib/2026/045/aa2_1.pdf',
+  filename: 'aa2_1.pdf',
+  format: 'pdf',
+  publication_id: 'cbs-media-2026-045',
+  publish_date: '2026-02-15T00:00:00Z',
+  metadata: { year: '2026', release_number: '045', duplicates: [copy] },
+  is_new: true,
+};
+
+describe('archiveFiles with discovery-grouped copies', () => {
+  beforeEach(() => {
+    vi.clearAllMocks();
+  });
+
+  it('uploads once and records a file row per publication', async () => {
+    const result = await archiveFiles({} as R2Bucket, {} as D1Database, [{
+      manifest_entry: primary,
+      data: new ArrayBuffer(4),
+      file_size_bytes: 4,
+      checksum_sha256: 'abc',
+      is_preferred_format: true,
+    }]);
+
+    expect(uploadFile).toHaveBeenCalledTimes(1);
+    expect(insertPublication).toHaveBeenCalledTimes(2);
+    expect(insertFile).toHaveBeenCalledTimes(2);
+    const [first, second] = result.fileRecords;
+    expect(second.publication_id).toBe(copy.publication_id);
+    expect(second.download_url).toBe(copy.url);
+    expect(second.r2_key).toBe(first.r2_key);
+    expect(second.checksum_sha256).toBe('abc');
+  });
+
+  it('maps a ZIP member onto the same member of each copy', () => {
+    const member = { ...primary, url: `${primary.url}#t1.xlsx`, filename: 't1.xlsx', format: 'xlsx' as const };
+    const [copied] = copiesOf(member);
+    expect(copied.url).toBe(`${copy.url}#t1.xlsx`);
+    expect(copied.filename).toBe('t1.xlsx');
+    expect(copied.metadata.duplicate_of).toBe(member.url);
+  });
+});
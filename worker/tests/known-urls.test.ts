@@ -1,5 +1,5 @@
 import { describe, it, expect, vi, beforeEach } from 'vitest';
-import { handleKnownUrls } from '../src/routes/known-urls';
+import { handleKnownUrls, handleKnownUrlsCheck } from '../src/routes/known-urls';
 import type { Env } from '../src/types';
 
 function createMockEnv(files: { download_url: string; publication_id: string }[] = []): Env {
@@ -76,3 +76,150 @@ describe('GET /api/known-urls', () => {
     expect(body.count).toBe(2);
   });
 });
+
+function createVersionedEnv(rows: { download_url: string; created_at: string }[]): Env {
+  const all = vi.fn().mockResolvedValue({ results: rows });
+  const bind = vi.fn().mockReturnValue({ all });
+  return {
+    INGEST_AUTH_TOKEN: 'test-token',
+    DB: {
+      prepare: vi.fn().mockReturnValue({ all, bind }),
+    } as unknown as D1Database,
+    STORAGE: {} as R2Bucket,
+    STATE: {} as KVNamespace,
+    GH_TOKEN: '',
+    ANTHRIPIC_API_KEY: '',
+  };
+}
+
+async function sha256Hex(text: string): Promise<string> {
+  const digest = await crypto.subtle.digest('SHA-256', new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest)).map((b) => b.toString(16).padStart(2, '0')).join('');
+}
+
+describe('GET /api/known-urls?since=', () => {
+  it('returns full list with a snapshot version', async () => {
+    const env = createVersionedEnv([
+      { download_url: 'https://cbs.gov.il/a.pdf', created_at: '2026-01-10 08:00:00' },
+      { download_url: 'https://cbs.gov.il/b.pdf', created_at: '2026-02-10 08:00:00' },
+    ]);
+    const req = new Request('http://localhost/api/known-urls', {
+      headers: { Authorization: 'Bearer test-token' },
+    });
+    const res = await handleKnownUrls(req, env);
+    const body = await res.json() as { urls: string[]; version: string };
+    expect(body.urls).toHaveLength(2);
+    expect(body.version).toBe('2026-02-10 08:00:00');
+  });
+
+  it('returns only URLs added since the version', async () => {
+    const env = createVersionedEnv([
+      { download_url: 'https://cbs.gov.il/c.pdf', created_at: '2026-03-01 09:00:00' },
+    ]);
+    const req = new Request('http://localhost/api/known-urls?since=2026-02-10%2008:00:00', {
+      headers: { Authorization: 'Bearer test-token' },
+    });
+    const res = await handleKnownUrls(req, env);
+    expect(res.status).toBe(200);
+    const body = await res.json() as { added: string[]; version: string; urls?: string[] };
+    expect(body.added).toEqual(['https://cbs.gov.il/c.pdf']);
+    expect(body.version).toBe('2026-03-01 09:00:00');
+    expect(body.urls).toBeUndefined();
+  });
+});
+
+interface FileRow {
+  id: string;
+  download_url: string;
+  url_hash?: string;
+  url_hash_prefix?: string;
+}
+
+// D1 stand-in answering the check route's queries from rows in memory
+function createHashedEnv(rows: FileRow[]): Env {
+  const prepare = vi.fn((sql: string) => {
+    const statement = (args: unknown[]) => ({
+      all: vi.fn(async () => {
+        if (sql.includes('url_hash_prefix IS NULL')) {
+          return { results: rows.filter((r) => !r.url_hash_prefix).slice(0, args[0] as number) };
+        }
+        if (sql.includes('url_hash_prefix IN')) {
+          return {
+            results: rows.filter((r) => args.includes(r.url_hash_prefix)).map((r) => ({ url_hash: r.url_hash })),
+          };
+        }
+        return { results: [] };
+      }),
+      run: vi.fn(async () => {
+        const [urlHash, prefix, id] = args as string[];
+        const row = rows.find((r) => r.id === id) as FileRow;
+        row.url_hash = urlHash;
+        row.url_hash_prefix = prefix;
+      }),
+    });
+    return { ...statement([]), bind: (...args: unknown[]) => statement(args) };
+  });
+  return {
+    INGEST_AUTH_TOKEN: 'test-token',
+    DB: {
+      prepare,
+      batch: vi.fn(async (statements: { run: () => Promise<void> }[]) => {
+        for (const s of statements) await s.run();
+      }),
+    } as unknown as D1Database,
+    STORAGE: {} as R2Bucket,
+    STATE: {} as KVNamespace,
+    GH_TOKEN: '',
+    ANTHRIPIC_API_KEY: '',
+  };
+}
+
+function checkRequest(prefixes: string[]): Request {
+  return new Request('http://localhost/api/known-urls/check', {
+    method: 'POST',
+    headers: { Authorization: 'Bearer test-token', 'Content-Type': 'application/json' },
+    body: JSON.stringify({ prefixes }),
+  });
+}
+
+describe('POST /api/known-urls/check', () => {
+  it('returns full hashes of known URLs matching the prefixes', async () => {
+    const known = 'https://cbs.gov.il/known.pdf';
+    const other = 'https://cbs.gov.il/other.pdf';
+    const knownHash = await sha256Hex(known);
+    const otherHash = await sha256Hex(other);
+    const env = createHashedEnv([
+      { id: 'f1', download_url: known, url_hash: knownHash, url_hash_prefix: knownHash.slice(0, 8) },
+      { id: 'f2', download_url: other, url_hash: otherHash, url_hash_prefix: otherHash.slice(0, 8) },
+    ]);
+    const res = await handleKnownUrlsCheck(checkRequest([knownHash.slice(0, 8)]), env);
+    const body = await res.json() as { hashes: string[] };
+    expect(body.hashes).toEqual([knownHash]);
+  });
+
+  it('looks prefixes up by the stored column instead of hashing every URL', async () => {
+    const env = createHashedEnv([]);
+    await handleKnownUrlsCheck(checkRequest(['0123abcd']), env);
+    const queries = (env.DB.prepare as ReturnType<typeof vi.fn>).mock.calls.map((c) => c[0] as string);
+    expect(queries.some((q) => q.includes('url_hash_prefix IN (?)'))).toBe(true);
+    expect(queries.some((q) => q.startsWith('SELECT download_url FROM files WHERE publication_id'))).toBe(false);
+  });
+
+  it('hashes rows stored before the url_hash column', async () => {
+    const legacy = 'https://cbs.gov.il/legacy.pdf';
+    const legacyHash = await sha256Hex(legacy);
+    const rows: FileRow[] = [{ id: 'f1', download_url: legacy }];
+    const env = createHashedEnv(rows);
+    const res = await handleKnownUrlsCheck(checkRequest([legacyHash.slice(0, 8)]), env);
+    const body = await res.json() as { hashes: string[] };
+    expect(body.hashes).toEqual([legacyHash]);
+    expect(rows[0].url_hash).toBe(legacyHash);
+  });
+
+  it('returns 401 without auth', async () => {
+    const env = createHashedEnv([]);
+    const req = new Request('http://localhost/api/known-urls/check', { method: 'POST', body: '{}' });
+    const res = await handleKnownUrlsCheck(req, env);
+    expect(res.status).toBe(401);
+  });
+});
@@ -2,6 +2,8 @@ import { describe, it, expect, vi, beforeEach } from 'vitest';
 
 // Mock modules before importing handler
 vi.mock('../src/storage/d1', () => ({
+  claimManifestKey: vi.fn(),
+  releaseManifestKeys: vi.fn(),
   getFileByDownloadUrl: vi.fn(),
   insertHousingPriceIndex: vi.fn(),
   insertAvgApartmentPrices: vi.fn(),
@@ -27,7 +29,7 @@ vi.mock('../src/pipeline/trigger', () => ({
 }));
 
 import { handleManifest } from '../src/routes/manifest';
-import { getFileByDownloadUrl } from '../src/storage/d1';
+import { claimManifestKey, releaseManifestKeys, getFileByDownloadUrl } from '../src/storage/d1';
 import { downloadFiles } from '../src/download/downloader';
 import { archiveFiles } from '../src/download/archive';
 import { extractFiles } from '../src/extraction/router';
@@ -68,6 +70,7 @@ const sampleEntry: ManifestEntry = {
 describe('POST /api/manifest', () => {
   beforeEach(() => {
     vi.clearAllMocks();
+    vi.mocked(claimManifestKey).mockResolvedValue(true);
   });
 
   it('returns 401 without auth', async () => {
@@ -179,4 +182,61 @@ describe('POST /api/manifest', () => {
     expect(body.pdf_requests).toBe(2);
     expect(triggerGitHubAction).toHaveBeenCalledWith('gh-token', expect.any(String));
   });
+
+  it('accepts a gzip-compressed manifest', async () => {
+    vi.mocked(getFileByDownloadUrl).mockResolvedValue(null);
+    vi.mocked(downloadFiles).mockResolvedValue({ files: [], errors: [] });
+    vi.mocked(archiveFiles).mockResolvedValue({ fileRecords: [], errors: [] });
+    vi.mocked(extractFiles).mockResolvedValue({ extracted: [], pdfRequestsCreated: 0, errors: [] });
+
+    const json = new Blob([JSON.stringify({ entries: [sampleEntry] })]).stream();
+    const gzipped = await new Response(json.pipeThrough(new CompressionStream('gzip'))).arrayBuffer();
+    const req = new Request('https://example.com/api/manifest', {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        'Content-Encoding': 'gzip',
+        Authorization: 'Bearer test-token',
+      },
+      body: gzipped,
+    });
+    const res = await handleManifest(req, mockEnv);
+    expect(res.status).toBe(200);
+    expect(downloadFiles).toHaveBeenCalledWith([sampleEntry]);
+  });
+
+  it('drops entries repeated under the same idempotency key', async () => {
+    vi.mocked(getFileByDownloadUrl).mockResolvedValue(null);
+    vi.mocked(downloadFiles).mockResolvedValue({ files: [], errors: [] });
+    vi.mocked(archiveFiles).mockResolvedValue({ fileRecords: [], errors: [] });
+    vi.mocked(extractFiles).mockResolvedValue({ extracted: [], pdfRequestsCreated: 0, errors: [] });
+
+    const entry = { ...sampleEntry, idempotency_key: 'k1' };
+    const req = makeRequest({ entries: [entry, entry] });
+    const res = await handleManifest(req, mockEnv);
+    expect(res.status).toBe(200);
+    expect(downloadFiles).toHaveBeenCalledWith([entry]);
+  });
+
+  it('skips entries whose idempotency key an earlier request claimed', async () => {
+    vi.mocked(getFileByDownloadUrl).mockResolvedValue(null);
+    vi.mocked(claimManifestKey).mockResolvedValue(false);
+
+    const entry = { ...sampleEntry, idempotency_key: 'k1' };
+    const res = await handleManifest(makeRequest({ entries: [entry] }), mockEnv);
+    expect(res.status).toBe(200);
+    expect(claimManifestKey).toHaveBeenCalledWith(mockEnv.DB, 'k1', entry.url);
+    expect(downloadFiles).not.toHaveBeenCalled();
+  });
+
+  it('releases the keys of entries that were not archived', async () => {
+    vi.mocked(getFileByDownloadUrl).mockResolvedValue(null);
+    vi.mocked(downloadFiles).mockResolvedValue({ files: [], errors: [] });
+    vi.mocked(archiveFiles).mockResolvedValue({ fileRecords: [], errors: [] });
+    vi.mocked(extractFiles).mockResolvedValue({ extracted: [], pdfRequestsCreated: 0, errors: [] });
+
+    const entry = { ...sampleEntry, idempotency_key: 'k1' };
+    await handleManifest(makeRequest({ entries: [entry] }), mockEnv);
+    expect(releaseManifestKeys).toHaveBeenCalledWith(mockEnv.DB, ['k1']);
+  });
 });